@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Request, request, jsonify, render_template, Response, send_from_directory
 from flask_cors import CORS
 import os
 import speech_recognition as sr
@@ -6,13 +6,45 @@ from deep_translator import GoogleTranslator
 from gtts import gTTS
 import requests
 import uuid
+import click
+import hashlib
+import base64
 import json
 import shutil
 from datetime import datetime
 import threading
+import atexit
 import unicodedata
 import re
 import random
+import bisect
+import heapq
+import math
+import struct
+import sys
+import zlib
+from array import array
+import functools
+import glob
+import itertools
+import csv
+import io
+import time
+import queue
+import subprocess
+import tempfile
+import sqlite3
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import audioop  # ausente desde Python 3.13: se cae a ventanas fijas
+except ImportError:
+    audioop = None
+try:
+    import fcntl  # solo POSIX: en Windows el modo multiproceso usa un lock de hilos
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 CORS(app)
@@ -22,82 +54,222 @@ AUDIO_FOLDER = os.path.join('static', 'audio')
 DATA_FOLDER = os.path.join('data')
 DICT_PATH = os.path.join(DATA_FOLDER, 'dictionary_es_qu.json')
 BACKUP_DIR = os.path.join(DATA_FOLDER, 'backups')
-HISTORY_PATH = os.path.join(DATA_FOLDER, 'history.json')
+HISTORY_PATH = os.path.join(DATA_FOLDER, 'history.json')  # formato antiguo (se migra)
+HISTORY_LOG_PATH = os.path.join(DATA_FOLDER, 'history.jsonl')
 META_PATH = os.path.join(DATA_FOLDER, 'meta.json')
+BACKUP_CATALOG_PATH = os.path.join(DATA_FOLDER, 'backups_catalog.jsonl')
+# Almacenamiento del diccionario: 'json' (archivos en data/, por defecto) o 'sqlite'
+STORAGE_BACKEND = (os.getenv('STORAGE_BACKEND') or 'json').strip().lower()
+SQLITE_DB_PATH = os.getenv('SQLITE_DB_PATH') or os.path.join(DATA_FOLDER, 'asistente.sqlite')
+SQLITE_STORAGE = None  # SqliteStorage si STORAGE_BACKEND == 'sqlite' (ver más abajo)
+# Varios procesos (p.ej. gunicorn -w N) comparten data/: lock de archivo y puesta al día por versión
+DICT_MULTIPROCESS = (os.getenv('DICT_MULTIPROCESS') or '').strip().lower() in ('1', 'true', 'yes', 'si', 'sí')
+DICT_LOCK_PATH = os.path.join(DATA_FOLDER, 'dictionary.lock')
 
 os.makedirs(AUDIO_FOLDER, exist_ok=True)
 os.makedirs(DATA_FOLDER, exist_ok=True)
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
-# Lock reentrante para permitir llamadas anidadas (evita deadlocks)
-DICT_LOCK = threading.RLock()
+class InterProcessLock:
+    """Lock reentrante entre hilos y procesos: RLock + flock exclusivo sobre `path`.
+
+    Solo el primer `acquire` de un hilo toma el flock; los anidados cuentan
+    profundidad. El archivo se abre por proceso (tras un fork hace falta un
+    descriptor propio: flock comparte el candado entre descriptores heredados).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fh = None
+        self._pid = None
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                if self._fh is None or self._pid != os.getpid():
+                    self._fh = open(self.path, 'a+')
+                    self._pid = os.getpid()
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None and self._fh is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+# Lock reentrante para permitir llamadas anidadas (evita deadlocks); entre procesos si DICT_MULTIPROCESS
+DICT_LOCK = InterProcessLock(DICT_LOCK_PATH) if DICT_MULTIPROCESS else threading.RLock()
 
 def _now_iso():
     return datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
 
-def _utcnow():
-    return datetime.utcnow()
+def _env_int(name, default):
+    try:
+        value = os.getenv(name)
+        return int(value) if value else default
+    except Exception:
+        return default
 
-def _file_mtime_utc(path):
+def _int_arg(name, default):
     try:
-        ts = os.path.getmtime(path)
-        return datetime.utcfromtimestamp(ts)
+        return int(request.args.get(name, default))
     except Exception:
-        return None
+        return default
+
+class AudioJanitor:
+    """Limpieza de AUDIO_FOLDER guiada por eventos, sin barridos periódicos.
 
-def _cleanup_audio_folder(ttl_minutes=60):
-    """Elimina archivos en AUDIO_FOLDER más antiguos que ttl_minutes.
+    Cada archivo se registra una vez (`track`) en un montículo ordenado por
+    vencimiento y en un total de bytes. Un hilo duerme hasta el próximo
+    vencimiento; si el total supera `max_bytes` se borran primero los que
+    vencen antes. Al iniciar se hace un único escaneo de reconciliación.
 
-    Se ejecuta periódicamente en un hilo daemon.
+    Solo gestiona el primer nivel (archivos de versiones anteriores o
+    copiados a mano; la aplicación ya no escribe ahí). La subcarpeta tts/ es
+    exclusiva de TtsAudioCache, que la limita con su propia cuota: `track`
+    rechaza rutas de subcarpetas para que ningún archivo se cuente dos veces.
     """
-    try:
-        now = _utcnow()
-        ttl = max(1, int(ttl_minutes))
-        for name in os.listdir(AUDIO_FOLDER):
-            path = os.path.join(AUDIO_FOLDER, name)
-            if not os.path.isfile(path):
-                continue
-            mtime = _file_mtime_utc(path)
-            if not mtime:
-                continue
-            age_min = (now - mtime).total_seconds() / 60.0
-            if age_min > ttl:
-                try:
-                    os.remove(path)
-                except Exception:
-                    pass
-    except Exception:
-        pass
 
-def _start_audio_cleanup_thread():
-    """Lanza un hilo que limpia la carpeta de audio cada cierto intervalo."""
-    try:
-        ttl_env = os.getenv('AUDIO_TTL_MINUTES')
+    def __init__(self, folder, ttl_seconds, max_bytes):
+        self.folder = folder
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.max_bytes = max(1, int(max_bytes))
+        self._heap = []      # (vence, ruta); puede tener entradas obsoletas
+        self._files = {}     # ruta -> (bytes, vence)
+        self._total = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.counters = {'tracked': 0, 'expired': 0, 'evicted_quota': 0, 'missing': 0, 'reconciled': 0}
+
+    def track(self, path, size=None, created=None):
+        """Registra (o renueva) un archivo recién escrito. O(log n).
+
+        Devuelve False si la ruta no es un archivo del primer nivel de la carpeta.
+        """
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.folder):
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        size = st.st_size if size is None else size
+        expires = (st.st_mtime if created is None else created) + self.ttl_seconds
+        with self._cond:
+            previous = self._files.get(path)
+            if previous is not None:
+                self._total -= previous[0]
+            self._files[path] = (size, expires)
+            self._total += size
+            heapq.heappush(self._heap, (expires, path))
+            self.counters['tracked'] += 1
+            self._enforce_quota()
+            self._cond.notify()
+        return True
+
+    def forget(self, path):
+        """Deja de seguir un archivo que otro componente ya eliminó."""
+        with self._cond:
+            entry = self._files.pop(path, None)
+            if entry is not None:
+                self._total -= entry[0]
+
+    def _pop_oldest(self):
+        """Saca la entrada vigente que vence antes, descartando las obsoletas."""
+        while self._heap:
+            expires, path = heapq.heappop(self._heap)
+            entry = self._files.get(path)
+            if entry is not None and entry[1] == expires:
+                del self._files[path]
+                self._total -= entry[0]
+                return path
+        return None
+
+    def _delete(self, path, counter):
         try:
-            ttl_minutes = int(ttl_env) if ttl_env else 60
+            os.remove(path)
+            self.counters[counter] += 1
+        except FileNotFoundError:
+            self.counters['missing'] += 1
         except Exception:
-            ttl_minutes = 60
+            pass
+
+    def _enforce_quota(self):
+        while self._total > self.max_bytes and self._files:
+            path = self._pop_oldest()
+            if path is None:
+                break
+            self._delete(path, 'evicted_quota')
+
+    def _expire_due(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            expires, path = self._heap[0]
+            entry = self._files.get(path)
+            if entry is None or entry[1] != expires:
+                heapq.heappop(self._heap)
+                continue
+            self._pop_oldest()
+            self._delete(path, 'expired')
 
-        interval_env = os.getenv('AUDIO_CLEAN_INTERVAL_SECONDS')
+    def reconcile(self):
+        """Escaneo único al iniciar: registra lo que ya hay en la carpeta."""
         try:
-            interval_seconds = int(interval_env) if interval_env else 900  # 15 min
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    self.track(entry.path, st.st_size, st.st_mtime)
+                    self.counters['reconciled'] += 1
         except Exception:
-            interval_seconds = 900
+            pass
 
-        def _loop():
-            import time
-            while True:
-                _cleanup_audio_folder(ttl_minutes)
-                try:
-                    time.sleep(max(60, interval_seconds))
-                except Exception:
-                    # si sleep falla, continuar
-                    pass
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._expire_due(time.time())
+                if self._heap:
+                    timeout = max(0.05, self._heap[0][0] - time.time())
+                else:
+                    timeout = None
+                self._cond.wait(timeout)
 
-        t = threading.Thread(target=_loop, daemon=True)
-        t.start()
-    except Exception:
-        pass
+    def start(self):
+        if self._thread is not None:
+            return
+        self.reconcile()
+        self._thread = threading.Thread(target=self._loop, name='audio-janitor', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self.counters,
+                'files': len(self._files),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'next_expiry_in': round(self._heap[0][0] - time.time(), 1) if self._heap else None,
+            }
+
+AUDIO_JANITOR = AudioJanitor(
+    AUDIO_FOLDER,
+    ttl_seconds=_env_int('AUDIO_TTL_MINUTES', 60) * 60,
+    max_bytes=_env_int('AUDIO_MAX_MB', 100) * 1024 * 1024,
+)
 
 def _safe_read_json(path, default):
     try:
@@ -115,6 +287,8 @@ def _safe_write_json(path, data):
     os.replace(tmp_path, path)
 
 def ensure_meta_initialized():
+    if SQLITE_STORAGE is not None:
+        return SQLITE_STORAGE.meta()
     meta = _safe_read_json(META_PATH, {})
     changed = False
     if 'current_version' not in meta:
@@ -132,21 +306,293 @@ def ensure_meta_initialized():
         _safe_write_json(META_PATH, meta)
     return meta
 
+# -------------------- Almacén del diccionario en memoria --------------------
+def _file_signature(path):
+    """Firma barata (mtime_ns, tamaño) para detectar cambios en disco."""
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except Exception:
+        return None
+
+_DELETED = object()  # marca de clave eliminada en la capa de LayeredMap
+
+class LayeredMap(Mapping):
+    """Mapeo inmutable: un dict base compartido más una capa pequeña de cambios.
+
+    `updated()` devuelve un mapeo nuevo copiando solo la capa, así que varias
+    versiones comparten la base sin que ninguna vea los cambios de otra.
+    Cuando la capa crece más de 1/8 de la base se funde en una base nueva
+    (costo amortizado constante por clave cambiada). Nadie debe modificar la
+    base después de entregarla.
+    """
+
+    __slots__ = ('_base', '_layer', '_len')
+    _COMPACT_MIN = 1024
+
+    def __init__(self, base=None, layer=None, length=None):
+        self._base = base if base is not None else {}
+        self._layer = layer or {}
+        if length is None:
+            length = len(self._base) + sum(
+                (v is not _DELETED) - (k in self._base) for k, v in self._layer.items())
+        self._len = length
+
+    def __getitem__(self, key):
+        value = self._layer.get(key, self._base) if self._layer else self._base
+        if value is self._base:
+            return self._base[key]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if self._layer and key in self._layer:
+            value = self._layer[key]
+            return default if value is _DELETED else value
+        return self._base.get(key, default)
+
+    def __contains__(self, key):
+        if self._layer and key in self._layer:
+            return self._layer[key] is not _DELETED
+        return key in self._base
+
+    def __iter__(self):
+        layer = self._layer
+        for key in self._base:
+            if key not in layer or layer[key] is not _DELETED:
+                yield key
+        for key, value in layer.items():
+            if value is not _DELETED and key not in self._base:
+                yield key
+
+    def __len__(self):
+        return self._len
+
+    def updated(self, updates):
+        """Mapeo nuevo con `updates` aplicados (valor `_DELETED` elimina la clave)."""
+        layer = dict(self._layer)
+        length = self._len
+        for key, value in updates.items():
+            had = key in self
+            if value is _DELETED:
+                if not had:
+                    continue
+                length -= 1
+                if key in self._base:
+                    layer[key] = _DELETED
+                else:
+                    layer.pop(key, None)
+            else:
+                if not had:
+                    length += 1
+                layer[key] = value
+        if len(layer) > max(self._COMPACT_MIN, len(self._base) // 8):
+            merged = dict(self._base)
+            for key, value in layer.items():
+                if value is _DELETED:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = value
+            return LayeredMap(merged, None, length)
+        return LayeredMap(self._base, layer, length)
+
+class DictionarySnapshot:
+    """Versión inmutable del diccionario y de sus estructuras derivadas.
+
+    Los lectores nunca deben modificar `data`; las estructuras derivadas
+    (índices, matchers, etc.) se construyen una sola vez por instantánea.
+    """
+
+    def __init__(self, data, signature, version, pending=0):
+        self.data = data
+        self.signature = signature
+        self.version = version
+        # Ediciones aplicadas en memoria y aún no volcadas a disco
+        self.pending = pending
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def derived(self, name, builder):
+        """Devuelve la estructura `name`, construyéndola con `builder(data)` si falta."""
+        value = self._derived.get(name)
+        if value is not None:
+            return value
+        with self._derived_lock:
+            value = self._derived.get(name)
+            if value is None:
+                value = builder(self.data)
+                self._derived[name] = value
+        return value
+
+    def carry_over(self, previous, changes):
+        """Hereda de `previous` las estructuras que saben aplicar `changes`.
+
+        Las que exponen `apply_changes(changes)` devuelven una estructura nueva
+        con los cambios (compartiendo lo que no tocan) y dejan intacta la de
+        `previous`: quien siga leyendo la instantánea anterior ve índices
+        coherentes con sus datos. El resto se reconstruye bajo demanda.
+        """
+        for name, value in list(previous._derived.items()):
+            apply = getattr(value, 'apply_changes', None)
+            if apply is None:
+                continue
+            try:
+                self._derived[name] = apply(changes)
+            except Exception:
+                pass
+
+class DictionaryStore:
+    """Diccionario compartido por todo el proceso.
+
+    Recarga el JSON solo cuando cambia su firma en disco o cuando
+    `save_dictionary` publica una versión nueva. La lectura de la instantánea
+    actual no toma DICT_LOCK: el reemplazo de la referencia es atómico.
+
+    Con un `source` (p.ej. SqliteStorage) la firma, la carga y la puesta al
+    día vienen de él: si expone `catch_up(snapshot)`, una firma distinta se
+    resuelve aplicando solo los cambios posteriores a la versión en memoria,
+    de modo que los índices se actualizan en vez de reconstruirse.
+    """
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.source = source
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registra `callback(changes)` para cada versión nueva.
+
+        `changes` es la lista de cambios publicada o None si el diccionario se
+        recargó completo (edición externa, restauración, etc.).
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, changes):
+        for cb in list(self._listeners):
+            try:
+                cb(changes)
+            except Exception:
+                pass
+
+    def _signature(self):
+        if self.source is not None:
+            return self.source.signature()
+        return _file_signature(self.path)
+
+    def _load(self):
+        """(diccionario, versión, firma) leídos del origen."""
+        if self.source is not None:
+            return self.source.load()
+        sig = _file_signature(self.path)
+        data = _safe_read_json(self.path, {})
+        if not isinstance(data, dict):
+            data = {}
+        version = _safe_read_json(META_PATH, {}).get('current_version', 0)
+        return data, version, sig
+
+    def _catch_up(self, snap):
+        """Instantánea nueva a partir de `snap` y los cambios posteriores, o None."""
+        catch_up = getattr(self.source, 'catch_up', None)
+        if snap is None or catch_up is None:
+            return None
+        caught = catch_up(snap)
+        if caught is None:
+            return None
+        changes, version, sig = caught
+        data = snap.data if isinstance(snap.data, LayeredMap) else LayeredMap(snap.data)
+        updates = {}
+        applied = []
+        for es, _, after in changes:
+            # El "antes" es el de memoria: reaplicar un cambio ya visto no hace nada
+            before = updates[es] if es in updates else data.get(es)
+            if before is _DELETED:
+                before = None
+            if before == after:
+                continue
+            updates[es] = _DELETED if after is None else after
+            applied.append((es, before, after))
+        # Capa sobre la instantánea: el costo es el de los cambios, no el del diccionario
+        new = DictionarySnapshot(data.updated(updates), sig, version)
+        new.carry_over(snap, applied)
+        return new, applied
+
+    def snapshot(self):
+        snap = self._snapshot
+        sig = self._signature()
+        if snap is not None and snap.signature == sig:
+            return snap
+        with self._reload_lock:
+            snap = self._snapshot
+            if snap is not None and snap.signature == self._signature():
+                return snap
+            caught = self._catch_up(snap)
+            if caught is not None:
+                snap, changes = caught
+                self._snapshot = snap
+                self._notify(changes)
+                return snap
+            data, version, sig = self._load()
+            reloaded = snap is not None
+            snap = DictionarySnapshot(data, sig, version)
+            self._snapshot = snap
+            if reloaded:
+                self._notify(None)
+        return snap
+
+    def publish(self, new_dic, version, changes=None, pending=0, owned=False):
+        """Instala `new_dic` como instantánea vigente.
+
+        `changes` es una lista opcional de tuplas (español, kichwa_antes,
+        kichwa_después) que permite actualizar índices sin reconstruirlos.
+        `pending` cuenta ediciones aún no volcadas a disco; con `owned` el
+        llamador cede `new_dic` y se evita copiarlo.
+        """
+        with self._reload_lock:
+            snap = self._install(new_dic, version, changes, pending, owned)
+        self._notify(changes)
+        return snap
+
+    def commit(self, write, new_dic, changes=None, owned=False):
+        """Escribe con `write()` (que devuelve la versión) y publica `new_dic` en un paso.
+
+        La escritura cambia la firma en disco; hacerla bajo el lock de recarga
+        evita que un lector concurrente vea la firma nueva antes que la
+        instantánea y recargue el diccionario completo. `write` no debe leer
+        DICT_STORE.
+        """
+        with self._reload_lock:
+            version = write()
+            snap = self._install(new_dic, version, changes, 0, owned)
+        self._notify(changes)
+        return snap
+
+    def _install(self, new_dic, version, changes, pending, owned):
+        previous = self._snapshot
+        data = new_dic if owned else dict(new_dic)
+        snap = DictionarySnapshot(data, self._signature(), version, pending)
+        if previous is not None and changes is not None:
+            snap.carry_over(previous, changes)
+        self._snapshot = snap
+        return snap
+
+DICT_STORE = DictionaryStore(DICT_PATH)
+
 def load_dictionary():
-    return _safe_read_json(DICT_PATH, {})
+    # Copia mutable; los lectores de solo lectura deben usar DICT_STORE.snapshot()
+    return dict(DICT_STORE.snapshot().data)
 
 # -------------------- Normalización y segmentación Kichwa --------------------
 _NON_ALNUM_RE = re.compile(r"[^a-zñáéíóúü-]+", re.IGNORECASE)
 _DASHES_RE = re.compile(r"[-_·•]+")
 
-def remove_diacritics(text):
-    # Normaliza eliminando tildes, conserva ñ
-    if not text:
-        return ''
+def _remove_diacritics_slow(text):
     normalized = unicodedata.normalize('NFD', text)
     out_chars = []
     for ch in normalized:
-        # Mantener ñ/Ñ explícitamente
+        # Tras NFD la ñ ya es n + U+0303, así que también pierde la tilde
         if ch in ('ñ', 'Ñ'):
             out_chars.append(ch)
             continue
@@ -156,6 +602,39 @@ def remove_diacritics(text):
         out_chars.append(ch)
     return unicodedata.normalize('NFC', ''.join(out_chars))
 
+def _build_diacritics_table():
+    # Latin-1, Latin Extended-A/B y marcas combinantes: mismo resultado que la ruta lenta
+    table = {}
+    for cp in list(range(0x80, 0x250)) + list(range(0x300, 0x370)):
+        ch = chr(cp)
+        stripped = _remove_diacritics_slow(ch)
+        if stripped != ch:
+            table[cp] = stripped or None
+    return table
+
+def _build_diacritics_keep(table):
+    # Caracteres no ASCII que la ruta lenta deja igual (¿, ¡, º, ß...), de la
+    # tabla o de sus reemplazos: si solo quedan estos, el resultado ya es final
+    candidates = {chr(cp) for cp in list(range(0x80, 0x250)) + list(range(0x300, 0x370)) if cp not in table}
+    candidates.update(ch for value in table.values() if value for ch in value if not ch.isascii())
+    return {ord(ch): None for ch in candidates if _remove_diacritics_slow(ch) == ch}
+
+_DIACRITICS_TABLE = _build_diacritics_table()
+_DIACRITICS_KEEP = _build_diacritics_keep(_DIACRITICS_TABLE)
+
+def remove_diacritics(text):
+    # Normaliza eliminando tildes con una tabla precalculada (str.translate)
+    if not text:
+        return ''
+    if text.isascii():
+        return text
+    out = text.translate(_DIACRITICS_TABLE)
+    if out.isascii() or out.translate(_DIACRITICS_KEEP).isascii():
+        return out
+    # Caracteres fuera de la tabla (p.ej. vietnamita, griego): ruta Unicode completa
+    return _remove_diacritics_slow(text)
+
+@functools.lru_cache(maxsize=16384)
 def normalize_kichwa_token(token):
     # minúsculas, quitar tildes, normalizar guiones múltiples a uno, recortar
     t = token.strip().lower()
@@ -164,80 +643,807 @@ def normalize_kichwa_token(token):
     t = t.strip('-')
     return t
 
+# Sufijos frecuentes (heurístico), en el orden en que se generan las bases
+_KICHWA_SUFFIXES = ('mi', 'm', 'shi', 'sh', 'ka', 'k', 'ta', 'n', 'pak', 'paj', 'sapa', 'kuna')
+# Índice por última letra: solo se prueban los sufijos que pueden terminar el token
+_SUFFIXES_BY_LAST = {}
+for _suf in _KICHWA_SUFFIXES:
+    _SUFFIXES_BY_LAST.setdefault(_suf[-1], []).append(_suf)
+_SUFFIXES_BY_LAST = {k: tuple(v) for k, v in _SUFFIXES_BY_LAST.items()}
+del _suf
+
+@functools.lru_cache(maxsize=16384)
+def _expand_kichwa_token(raw):
+    """Token normalizado, sus partes por guión y sus bases sin sufijo (con repetidos)."""
+    t = normalize_kichwa_token(raw)
+    if not t:
+        return ()
+    # Mantener token completo y sus partes base
+    out = [t]
+    if '-' in t:
+        out.extend(p for p in t.split('-') if p and p != t)
+    # Generar variantes sin sufijos con y sin guiones
+    for suf in _SUFFIXES_BY_LAST.get(t[-1], ()):
+        if t.endswith(suf):
+            base = t[: -len(suf)].rstrip('-')
+            if base:
+                out.append(base)
+    return tuple(out)
+
 def tokenize_kichwa(text):
     if not text:
         return []
     # Reemplazar separadores no alfanum a espacios, preservar guiones como partidores de morfemas
     cleaned = _NON_ALNUM_RE.sub(' ', text)
-    tokens = []
-    for raw in cleaned.split():
-        t = normalize_kichwa_token(raw)
-        if not t:
-            continue
-        # Segmentar por sufijos comunes kichwa (heurístico)
-        # Lista básica de morfemas frecuentes
-        suffixes = ['-mi', '-m', '-shi', '-sh', '-ka', '-k', '-ta', '-n', '-pak', '-paj', '-sapa', '-kuna']
-        # asegurar formato con guión
-        parts = t.split('-') if '-' in t else [t]
-        # Mantener token completo y sus partes base
-        tokens.append(t)
-        for p in parts:
-            if p and p != t:
-                tokens.append(p)
-        # Generar variantes sin sufijos con y sin guiones
-        for suf in suffixes:
-            suf_clean = suf.lstrip('-')
-            if t.endswith(suf_clean):
-                base = t[: -len(suf_clean)]
-                base = base.rstrip('-')
-                if base:
-                    tokens.append(base)
     # Unificar y devolver únicos preservando orden
     seen = set()
     uniq = []
-    for tok in tokens:
-        if tok not in seen:
-            seen.add(tok)
-            uniq.append(tok)
+    for raw in cleaned.split():
+        for tok in _expand_kichwa_token(raw):
+            if tok not in seen:
+                seen.add(tok)
+                uniq.append(tok)
     return uniq
 
-def best_kichwa_match(es_to_qu_dic, text):
-    # Intenta reemplazos por frases más largas primero usando normalización/tokenización
+def tokenize_kichwa_many(texts):
+    """Tokeniza varios textos en una llamada; comparte la memoria de tokens."""
+    return [tokenize_kichwa(t) for t in texts]
+
+def _is_word_char(ch):
+    return ch.isalnum()
+
+class PhraseMatcher:
+    """Trie de frases españolas normalizadas -> kichwa normalizado.
+
+    Se construye una vez por versión del diccionario y traduce en una sola
+    pasada de izquierda a derecha, eligiendo siempre la coincidencia más larga
+    que respete límites de palabra. El texto ya reemplazado no se vuelve a
+    examinar, así que no hay reemplazos en cascada.
+    """
+
+    _END = ''  # clave reservada para el valor terminal del nodo
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    @classmethod
+    def from_dictionary(cls, es_to_qu_dic):
+        matcher = cls()
+        for es, qu in es_to_qu_dic.items():
+            if not isinstance(es, str) or not isinstance(qu, str):
+                continue
+            matcher.add(normalize_kichwa_token(es), normalize_kichwa_token(qu))
+        return matcher
+
+    def add(self, key, value):
+        if not key:
+            return
+        node = self.root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        if self._END not in node:
+            self.size += 1
+        node[self._END] = value
+
+    def _longest_at(self, text, i):
+        """Devuelve (fin, valor) de la coincidencia válida más larga desde i."""
+        node = self.root
+        best = None
+        n = len(text)
+        j = i
+        while j < n:
+            node = node.get(text[j])
+            if node is None:
+                break
+            j += 1
+            if self._END in node:
+                # límite derecho: fin de texto, separador o clave que termina en signo
+                if j == n or not _is_word_char(text[j]) or not _is_word_char(text[j - 1]):
+                    best = (j, node[self._END])
+        return best
+
+    def translate(self, text):
+        if not text or not self.root:
+            return text
+        out = []
+        i = 0
+        n = len(text)
+        while i < n:
+            # límite izquierdo: inicio, tras un separador o en un signo
+            if i == 0 or not _is_word_char(text[i - 1]) or not _is_word_char(text[i]):
+                hit = self._longest_at(text, i)
+                if hit:
+                    j, value = hit
+                    out.append(value)
+                    i = j
+                    continue
+            out.append(text[i])
+            i += 1
+        return ''.join(out)
+
+def kichwa_phrase_matcher(snapshot):
+    """Matcher ES->QU cacheado para la instantánea dada."""
+    return snapshot.derived('es_qu_matcher', PhraseMatcher.from_dictionary)
+
+def best_kichwa_match(es_to_qu_dic, text, matcher=None):
+    # Reemplaza frases españolas por kichwa priorizando las coincidencias más largas
     if not text:
         return text
-    # Construir mapping normalizado -> original kichwa
-    normalized_map = {}
-    for es, qu in es_to_qu_dic.items():
-        es_norm = normalize_kichwa_token(es)
-        if es_norm:
-            normalized_map[es_norm] = qu
-
-    # Reemplazo sobre texto normalizado, pero preservando espacios del original
-    txt_norm = normalize_kichwa_token(text)
-    # Ordenar claves por longitud desc para coincidencias más largas
-    keys = sorted(normalized_map.keys(), key=lambda k: -len(k))
-    out = txt_norm
-    for k in keys:
-        if not k: continue
-        if k in out:
-            out = out.replace(k, normalize_kichwa_token(normalized_map[k]))
+    if matcher is None:
+        matcher = PhraseMatcher.from_dictionary(es_to_qu_dic)
     # Devolver versión normalizada traducida; el front muestra el valor final
-    return out
+    return matcher.translate(normalize_kichwa_token(text))
+
+class KichwaInverseIndex:
+    """Índice inverso kichwa normalizado -> glosas en español.
+
+    Guarda todas las glosas de cada forma (no solo la última) y, aparte, las
+    bases morfológicas (partes por guión y formas sin sufijo) de los valores
+    de una sola palabra: las palabras de una frase no heredan la glosa de la
+    frase completa. Es inmutable:
+    `apply_changes` devuelve un índice nuevo que comparte con este las
+    formas no tocadas (LayeredMap), y cada entrada es una tupla.
+    """
+
+    def __init__(self, exact=None, bases=None):
+        self.exact = exact if exact is not None else LayeredMap()
+        self.bases = bases if bases is not None else LayeredMap()
+
+    @classmethod
+    def from_dictionary(cls, dic):
+        exact, bases = {}, {}
+        for es, qu in dic.items():
+            cls._edit_entry({}, exact, {}, bases, es, qu, True)
+        return cls(LayeredMap(exact), LayeredMap(bases))
+
+    @staticmethod
+    def _forms(qu):
+        full = normalize_kichwa_token(qu)
+        words = _NON_ALNUM_RE.sub(' ', qu).split()
+        if len(words) != 1:
+            return full, []
+        return full, [t for t in _expand_kichwa_token(words[0]) if t != full]
+
+    @staticmethod
+    def _edit(table, pending, key, es, add):
+        """Agrega o quita `es` de la tupla de `key`, anotando el resultado en `pending`."""
+        current = pending.get(key)
+        if current is None:
+            current = table.get(key, ())
+        elif current is _DELETED:
+            current = ()
+        if add:
+            if es not in current:
+                pending[key] = current + (es,)
+        elif es in current:
+            pending[key] = tuple(g for g in current if g != es) or _DELETED
+
+    @classmethod
+    def _edit_entry(cls, exact, exact_pending, bases, bases_pending, es, qu, add):
+        if not isinstance(es, str) or not isinstance(qu, str):
+            return
+        full, forms = cls._forms(qu)
+        if full:
+            cls._edit(exact, exact_pending, full, es, add)
+        for b in forms:
+            cls._edit(bases, bases_pending, b, es, add)
+
+    def apply_changes(self, changes):
+        exact_pending, bases_pending = {}, {}
+        for es, before, after in changes:
+            if before is not None:
+                self._edit_entry(self.exact, exact_pending, self.bases, bases_pending, es, before, False)
+            if after is not None:
+                self._edit_entry(self.exact, exact_pending, self.bases, bases_pending, es, after, True)
+        return KichwaInverseIndex(self.exact.updated(exact_pending), self.bases.updated(bases_pending))
+
+    @staticmethod
+    def _ranked(glosses):
+        # Glosas de una sola palabra primero; entre iguales, orden de inserción
+        return tuple(sorted(glosses, key=lambda g: ' ' in g.strip()))
+
+    def lookup_exact(self, token):
+        """Glosas de la forma completa `token` (ya normalizada)."""
+        return self._ranked(self.exact.get(token) or ())
+
+    def lookup(self, token):
+        """Glosas para `token` (ya normalizado): primero forma exacta, luego bases."""
+        return self._ranked(self.exact.get(token) or self.bases.get(token) or ())
+
+    def lookup_word(self, forms):
+        """(forma, glosas) de una palabra expandida con `_expand_kichwa_token`.
+
+        Prueba la forma completa y luego sus propias bases, primero como
+        entradas exactas y después en las bases del índice; la primera forma
+        con glosas gana, así las bases de una palabra ya traducida no se
+        traducen aparte. Un sufijo escrito suelto (p.ej. "kuna") solo se
+        busca como entrada exacta.
+        """
+        for form in forms:
+            glosses = self.exact.get(form)
+            if glosses:
+                return form, self._ranked(glosses)
+        if forms and forms[0] not in _KICHWA_SUFFIXES:
+            for form in forms:
+                glosses = self.bases.get(form)
+                if glosses:
+                    return form, self._ranked(glosses)
+        return (forms[0] if forms else ''), ()
+
+def kichwa_inverse_index(snapshot):
+    """Índice QU->ES cacheado para la instantánea dada."""
+    return snapshot.derived('qu_es_index', KichwaInverseIndex.from_dictionary)
+
+# -------------------- Búsqueda en el diccionario --------------------
+def _bounded_edit_distance(a, b, max_dist):
+    """Levenshtein entre a y b; devuelve max_dist + 1 si se supera el límite."""
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    if len(a) > len(b):
+        a, b = b, a
+    previous = list(range(len(a) + 1))
+    for j, cb in enumerate(b, 1):
+        current = [j]
+        row_min = j
+        for i, ca in enumerate(a, 1):
+            cost = 0 if ca == cb else 1
+            value = min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + cost)
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > max_dist:
+            return max_dist + 1
+        previous = current
+    return previous[-1]
+
+def _search_trigrams(form):
+    padded = f"  {form} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class DictionarySearchIndex:
+    """Índice de búsqueda por prefijo y con tolerancia a errores.
+
+    - Prefijo: arreglo ordenado de (forma, campo, clave) por cada inicio de
+      palabra de las formas normalizadas en español y kichwa; un prefijo es
+      un rango contiguo que se localiza con bisect.
+    - Errores de tipeo: índice invertido trigrama -> referencias de palabra
+      (id de entrada y campo). Los candidatos salen solo de los trigramas
+      más raros de la consulta (filtro por prefijo: quien comparta el mínimo
+      exigido debe aparecer en alguno de ellos) y se ordenan por distancia de
+      edición acotada.
+    Es inmutable: `apply_changes` devuelve un índice nuevo. El arreglo base
+    se comparte y los cambios viven en una lista ordenada pequeña (`_added`)
+    y un conjunto de filas quitadas (`_removed`) que se funden al crecer; los
+    trigramas y entradas son LayeredMap y cada bucket tocado se copia. Los
+    ids de entrada solo se agregan, así que compartirlos no altera lo que ve
+    un índice anterior.
+    """
+
+    FIELDS = ('es', 'qu')
+
+    def __init__(self, rows=(), added=(), removed=frozenset(), grams=None, entries=None, ids=None, keys=None):
+        self._sorted = rows
+        self._added = added
+        self._removed = removed
+        self._grams = grams if grams is not None else LayeredMap()
+        self._entries = entries if entries is not None else LayeredMap()  # español -> kichwa
+        self._ids = ids if ids is not None else {}     # español -> id entero
+        self._keys = keys if keys is not None else []  # id -> español
+
+    @classmethod
+    def from_dictionary(cls, dic):
+        rows, grams, entries, ids, keys = [], {}, {}, {}, []
+        for es, qu in dic.items():
+            if isinstance(es, str) and isinstance(qu, str):
+                entries[es] = qu
+                rows.extend(cls._forms(es, qu))
+                ident = ids[es] = len(keys)
+                keys.append(es)
+                for g, ref in cls._gram_refs(ident, es, qu):
+                    bucket = grams.get(g)
+                    if bucket is None:
+                        grams[g] = {ref}
+                    else:
+                        bucket.add(ref)
+        rows.sort()
+        return cls(rows, (), frozenset(), LayeredMap(grams), LayeredMap(entries), ids, keys)
+
+    def _id_for(self, es):
+        ident = self._ids.get(es)
+        if ident is None:
+            ident = self._ids[es] = len(self._keys)
+            self._keys.append(es)
+        return ident
+
+    @staticmethod
+    def _forms(es, qu):
+        out = []
+        for field, text in (('es', es), ('qu', qu)):
+            words = normalize_kichwa_token(text).split()
+            for i in range(len(words)):
+                out.append((' '.join(words[i:]), field, es))
+        return out
+
+    @staticmethod
+    def _gram_refs(ident, es, qu):
+        """(trigrama, ref) por palabra; ref = id * 2 + campo (0 es, 1 qu)."""
+        refs = set()
+        for bit, text in ((0, es), (1, qu)):
+            ref = ident * 2 + bit
+            for word in set(normalize_kichwa_token(text).split()):
+                for g in _search_trigrams(word):
+                    refs.add((g, ref))
+        return refs
+
+    @staticmethod
+    def _contains(items, item):
+        i = bisect.bisect_left(items, item)
+        return i < len(items) and items[i] == item
+
+    def apply_changes(self, changes):
+        added = list(self._added)
+        removed = set(self._removed)
+        grams_pending, entries_pending = {}, {}
+
+        def bucket(g):
+            current = grams_pending.get(g)
+            if current is None:
+                return self._grams.get(g, frozenset())
+            return frozenset() if current is _DELETED else current
+
+        for es, before, after in changes:
+            if not isinstance(es, str):
+                continue
+            if isinstance(before, str):
+                entries_pending[es] = _DELETED
+                for item in self._forms(es, before):
+                    i = bisect.bisect_left(added, item)
+                    if i < len(added) and added[i] == item:
+                        del added[i]
+                    elif self._contains(self._sorted, item):
+                        removed.add(item)
+                ident = self._ids.get(es)
+                if ident is not None:
+                    for g, ref in self._gram_refs(ident, es, before):
+                        grams_pending[g] = (bucket(g) - {ref}) or _DELETED
+            if isinstance(after, str):
+                entries_pending[es] = after
+                for item in self._forms(es, after):
+                    if item in removed:
+                        removed.discard(item)
+                    elif not self._contains(self._sorted, item) and not self._contains(added, item):
+                        bisect.insort(added, item)
+                for g, ref in self._gram_refs(self._id_for(es), es, after):
+                    grams_pending[g] = bucket(g) | {ref}
+        rows = self._sorted
+        if len(added) + len(removed) > max(1024, len(rows) // 8):
+            rows = list(heapq.merge((r for r in rows if r not in removed), added))
+            added, removed = [], set()
+        return DictionarySearchIndex(rows, added, frozenset(removed), self._grams.updated(grams_pending),
+                                     self._entries.updated(entries_pending), self._ids, self._keys)
+
+    @staticmethod
+    def _range(items, query):
+        i = bisect.bisect_left(items, (query,))
+        while i < len(items) and items[i][0].startswith(query):
+            yield items[i]
+            i += 1
+
+    def prefix(self, query, fields):
+        """{(campo, clave): forma} de las formas que empiezan por `query`."""
+        hits = {}
+        removed = self._removed
+        for item in heapq.merge(self._range(self._sorted, query), self._range(self._added, query)):
+            if removed and item in removed:
+                continue
+            form, field, es = item
+            if field in fields and (field, es) not in hits:
+                hits[(field, es)] = form
+        return hits
+
+    def fuzzy(self, query, fields, max_dist, max_candidates=200):
+        """[(distancia, campo, clave)] de palabras a <= max_dist ediciones de `query`."""
+        grams = _search_trigrams(query)
+        bits = {self.FIELDS.index(f) for f in fields}
+        # Cada edición destruye como mucho 3 trigramas
+        min_shared = max(1, len(grams) - 3 * max_dist)
+        postings = sorted((self._grams.get(g, ()) for g in grams), key=len)
+        # Filtro por prefijo: basta generar candidatos con los trigramas más raros
+        seed_count = len(postings) - min_shared + 1
+        candidates = set()
+        for bucket in postings[:seed_count]:
+            candidates.update(bucket)
+        scored = []
+        for ref in candidates:
+            if ref & 1 not in bits:
+                continue
+            shared = sum(1 for bucket in postings if ref in bucket)
+            if shared >= min_shared:
+                scored.append((-shared, ref))
+        scored.sort()
+        refs = [ref for _, ref in scored[:max_candidates]]
+        rows = []
+        for ref in refs:
+            es = self._keys[ref >> 1]
+            qu = self._entries.get(es)
+            if qu is not None:
+                rows.append((self.FIELDS[ref & 1], es, qu))
+        out = []
+        for field, es, qu in rows:
+            text = normalize_kichwa_token(es if field == 'es' else qu)
+            best = min(_bounded_edit_distance(query, w, max_dist) for w in text.split() + [text])
+            if best <= max_dist:
+                out.append((best, field, es))
+        return out
+
+    def search(self, query, fields=('es', 'qu'), mode='auto', max_dist=None):
+        """Resultados ordenados: exacto, prefijo y luego aproximados por distancia."""
+        q = normalize_kichwa_token(query or '')
+        if not q:
+            return []
+        fields = tuple(f for f in fields if f in self.FIELDS) or self.FIELDS
+        if max_dist is None:
+            max_dist = 1 if len(q) <= 4 else 2
+        results = {}
+        if mode in ('auto', 'prefix', 'exact'):
+            for (field, es), form in self.prefix(q, fields).items():
+                whole = normalize_kichwa_token(es if field == 'es' else self._entries.get(es, ''))
+                kind = 'exact' if whole == q else 'prefix'
+                if mode == 'exact' and kind != 'exact':
+                    continue
+                rank = (0 if kind == 'exact' else 1, len(form), es)
+                if es not in results or rank < results[es][0]:
+                    results[es] = (rank, {'match': kind, 'field': field, 'distance': 0})
+        if mode in ('auto', 'fuzzy') and len(q) >= 3:
+            for dist, field, es in self.fuzzy(q, fields, max_dist):
+                rank = (2 + dist, 0, es)
+                if es not in results or rank < results[es][0]:
+                    results[es] = (rank, {'match': 'fuzzy', 'field': field, 'distance': dist})
+        ordered = sorted(results.items(), key=lambda kv: kv[1][0])
+        return [dict(spanish=es, kichwa=self._entries.get(es), **info)
+                for es, (_, info) in ordered if es in self._entries]
+
+def dictionary_search_index(snapshot):
+    """Índice de búsqueda cacheado para la instantánea dada."""
+    return snapshot.derived('search_index', DictionarySearchIndex.from_dictionary)
+
+# -------------------- Listado paginado y exportación --------------------
+class SortedKeys:
+    """Claves en español ordenadas, para paginar con cursor y exportar en orden.
+
+    No se hereda entre versiones (no expone `apply_changes`): una exportación
+    en curso sigue iterando la lista de su propia instantánea mientras otra
+    petición guarda cambios.
+    """
+
+    def __init__(self, keys=()):
+        self.keys = sorted(keys)
+
+    @classmethod
+    def from_dictionary(cls, dic):
+        return cls(dic.keys())
+
+    def page(self, after=None, limit=100):
+        """Devuelve hasta `limit` claves estrictamente posteriores a `after`."""
+        start = bisect.bisect_right(self.keys, after) if after is not None else 0
+        return self.keys[start: start + limit]
+
+def sorted_dictionary_keys(snapshot):
+    """Claves ordenadas cacheadas para la instantánea dada."""
+    return snapshot.derived('sorted_keys', SortedKeys.from_dictionary)
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    """Clave codificada en `cursor`, o None si no es un cursor emitido por la API."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = base64.b64decode(padded.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+    except Exception:
+        return None
+    return key if _encode_cursor(key) == cursor else None
+
+def _dictionary_validators(snapshot):
+    """ETag y Last-Modified de una instantánea.
+
+    La ETag se deriva de `current_version` de meta.json, de las ediciones
+    aún pendientes de volcar y de la firma del archivo (para no servir un 304
+    tras una edición manual sin versión).
+    Last-Modified es la fecha de escritura del diccionario, que
+    `save_dictionary` actualiza junto con meta.json. Con ediciones pendientes
+    esa fecha no las refleja, así que se omite (None): If-Modified-Since no
+    puede dar un 304 y la revalidación queda a cargo de la ETag.
+    """
+    mtime_ns = snapshot.signature[0] if snapshot.signature else 0
+    etag = f"v{snapshot.version}.{snapshot.pending}-{mtime_ns:x}"
+    if snapshot.pending or not mtime_ns:
+        return etag, None
+    return etag, datetime.utcfromtimestamp(mtime_ns // 1_000_000_000)
+
+def _not_modified(etag, last_modified):
+    """True si la petición condicional ya tiene la versión vigente."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    if since is not None and last_modified is not None:
+        return last_modified.replace(tzinfo=since.tzinfo) <= since
+    return False
+
+def _conditional_response(snapshot, build):
+    """Responde 304 sin serializar nada si el cliente está al día.
+
+    `build()` solo se invoca cuando hay que enviar el cuerpo.
+    """
+    etag, last_modified = _dictionary_validators(snapshot)
+    if _not_modified(etag, last_modified):
+        resp = Response(status=304)
+    else:
+        resp = build()
+    resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    # Obliga al navegador a revalidar en cada sondeo (barato gracias al 304)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+def _iter_export_json(dic, keys):
+    yield '{"dictionary": {'
+    sep = ''
+    for es in keys:
+        yield f"{sep}\n  {json.dumps(es, ensure_ascii=False)}: {json.dumps(dic[es], ensure_ascii=False)}"
+        sep = ','
+    yield '\n}}\n'
+
+def _iter_export_csv(dic, keys, batch=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, es in enumerate(keys, 1):
+        writer.writerow([es, dic[es]])
+        if i % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
 
 # -------------------- Detección automática de idioma --------------------
 _KICHWA_CHAR_HINTS = set(list('kqshñ'))
 _SPANISH_ONLY_HINTS = set(list('áéíóú'))
 _KICHWA_COMMON_TOKENS = {'ñuka','kan','pay','kanka','mashi','alli','shuk','wasi','yachay','mikuy','kawsay','kawsankichu','rimay','mikhuna','yakuk'}
 
-def detect_lang_text(text):
-    """Devuelve 'qu' o 'es' heurísticamente para texto."""
-    lang, _, _ = detect_lang_with_score(text)
-    return lang
+LANGID_MODEL_PATH = os.path.join(DATA_FOLDER, 'langid_model.bin')
+_LANGID_MAGIC = b'KQLM'
+_LANGID_FORMAT = 2  # 1: solo pesos; 2: conteos por celda (permite actualizar)
 
-def detect_lang_with_score(text):
-    """Retorna (lang, score_qu, score_es)."""
-    if not text:
-        return ('es', 0.0, 0.0)
+def _langid_grams(text, max_order):
+    # Minúsculas con tildes (útiles para español); todo lo no alfabético es espacio
+    t = ' ' + ' '.join(_NON_ALNUM_RE.sub(' ', (text or '').lower()).split()) + ' '
+    if t == '  ':
+        return []
+    grams = []
+    for n in range(1, max_order + 1):
+        grams.extend(t[i:i + n] for i in range(len(t) - n + 1))
+    return [g for g in grams if g.strip()]
+
+@functools.lru_cache(maxsize=65536)
+def _langid_hash(gram):
+    return zlib.crc32(gram.encode('utf-8'))
+
+@functools.lru_cache(maxsize=65536)
+def _langid_word_cells(word, buckets, max_order):
+    return tuple(_langid_hash(g) % buckets for g in _langid_grams(word, max_order))
+
+def _langid_cells(text, buckets, max_order):
+    """Celdas de los n-gramas de `text` (mismo multiconjunto que _langid_grams).
+
+    Los n-gramas dentro de cada palabra (con sus espacios de borde) salen de
+    una memoria por palabra; solo se calculan aparte los que cruzan el
+    espacio entre dos palabras, contados en el primer espacio que contienen.
+    """
+    words = _NON_ALNUM_RE.sub(' ', (text or '').lower()).split()
+    cells = []
+    for w in words:
+        cells.extend(_langid_word_cells(w, buckets, max_order))
+    if len(words) > 1 and max_order >= 3:
+        t = ' ' + ' '.join(words) + ' '
+        pos = 0
+        for w in words[:-1]:
+            pos += len(w) + 1  # espacio que sigue a `w`
+            for n in range(3, max_order + 1):
+                for start in range(max(0, pos - n + 2), pos):
+                    if start + n <= len(t) and ' ' not in t[start + 1:pos]:
+                        cells.append(_langid_hash(t[start:start + n]) % buckets)
+    return cells
+
+class LangIdModel:
+    """Modelo de n-gramas de caracteres (1..max_order) kichwa vs español.
+
+    Se entrena con las claves (español) y valores (kichwa) del diccionario.
+    Los n-gramas se agrupan por hash en `buckets` celdas. Se guardan los
+    conteos por celda de cada idioma (`counts`) y, derivado de ellos, un
+    arreglo float32 con log(c_qu + 1) - log(c_es + 1) más un sesgo común
+    log(total_es) - log(total_qu): puntuar un texto es sumar los pesos de
+    sus celdas más n * sesgo. Con los conteos, `updated` aplica cambios del
+    diccionario tocando solo las celdas de los textos modificados.
+    """
+
+    def __init__(self, weights, max_order=3, bias=0.0, counts=None):
+        self.weights = weights
+        self.buckets = len(weights)
+        self.max_order = max_order
+        self.bias = bias
+        self.counts = counts  # (array es, array qu) o None si solo hay pesos
+
+    def _cells(self, text):
+        return _langid_cells(text, self.buckets, self.max_order)
+
+    @staticmethod
+    def _cell_weight(ce, cq):
+        return math.log(cq + 1) - math.log(ce + 1)
+
+    @classmethod
+    def from_counts(cls, count_es, count_qu, max_order=3):
+        buckets = len(count_es)
+        weights = array('f', map(cls._cell_weight, count_es, count_qu))
+        bias = math.log(sum(count_es) + buckets) - math.log(sum(count_qu) + buckets)
+        return cls(weights, max_order, bias, (count_es, count_qu))
+
+    @classmethod
+    def train(cls, es_texts, qu_texts, buckets=4096, max_order=3):
+        counts = {'es': array('i', bytes(4 * buckets)), 'qu': array('i', bytes(4 * buckets))}
+        for lang, texts in (('es', es_texts), ('qu', qu_texts)):
+            table = counts[lang]
+            for text in texts:
+                for cell in _langid_cells(text, buckets, max_order):
+                    table[cell] += 1
+        return cls.from_counts(counts['es'], counts['qu'], max_order)
+
+    @classmethod
+    def from_dictionary(cls, dic, **kwargs):
+        es_texts = [k for k in dic if isinstance(k, str)]
+        qu_texts = [v for v in dic.values() if isinstance(v, str)]
+        return cls.train(es_texts, qu_texts, **kwargs)
+
+    def updated(self, changes):
+        """Modelo nuevo con los cambios (español, antes, después) aplicados.
+
+        Copia los arreglos (unos pocos KB) y recalcula solo las celdas
+        tocadas; el modelo actual no se modifica. Requiere `counts`.
+        """
+        count_es, count_qu = array('i', self.counts[0]), array('i', self.counts[1])
+        weights = array('f', self.weights)
+        touched = set()
+
+        def add(table, text, delta):
+            if isinstance(text, str):
+                for cell in self._cells(text):
+                    table[cell] = max(0, table[cell] + delta)
+                    touched.add(cell)
+
+        for es, before, after in changes:
+            if (before is None) != (after is None):
+                add(count_es, es, 1 if before is None else -1)
+            add(count_qu, before, -1)
+            add(count_qu, after, 1)
+        for cell in touched:
+            weights[cell] = self._cell_weight(count_es[cell], count_qu[cell])
+        b = self.buckets
+        bias = math.log(sum(count_es) + b) - math.log(sum(count_qu) + b)
+        return LangIdModel(weights, self.max_order, bias, (count_es, count_qu))
+
+    def save(self, path):
+        if self.counts is None:
+            raise ValueError('El modelo no tiene conteos; entrénalo con el diccionario')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(struct.pack('<4sHHI', _LANGID_MAGIC, _LANGID_FORMAT, self.max_order, self.buckets))
+            for table in self.counts:
+                table = array('i', table)
+                if sys.byteorder == 'big':
+                    table.byteswap()
+                f.write(table.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, fmt, max_order, buckets = struct.unpack('<4sHHI', f.read(12))
+            if magic != _LANGID_MAGIC or fmt not in (1, _LANGID_FORMAT):
+                raise ValueError('Modelo de idioma con formato desconocido')
+            tables = []
+            for _ in range(1 if fmt == 1 else 2):
+                table = array('f' if fmt == 1 else 'i')
+                table.frombytes(f.read(4 * buckets))
+                if len(table) != buckets:
+                    raise ValueError('Modelo de idioma truncado')
+                if sys.byteorder == 'big':
+                    table.byteswap()
+                tables.append(table)
+        if fmt == 1:
+            # Formato antiguo: pesos con el sesgo ya incluido, sin conteos
+            return cls(tables[0], max_order)
+        return cls.from_counts(tables[0], tables[1], max_order)
+
+    def log_ratio(self, text):
+        """(suma de log P(celda|qu) - log P(celda|es), número de n-gramas)."""
+        cells = self._cells(text)
+        return sum(map(self.weights.__getitem__, cells)) + len(cells) * self.bias, len(cells)
+
+    @staticmethod
+    def _probability(ratio, n):
+        # La suma se atenúa por la raíz del número de n-gramas: los n-gramas
+        # solapados no son independientes y sin esto todo saldría con 0/1.
+        if n:
+            ratio /= math.sqrt(n)
+        ratio = max(-50.0, min(50.0, ratio))
+        p_qu = 1.0 / (1.0 + math.exp(-ratio))
+        lang = 'qu' if p_qu > 0.5 else 'es'
+        return (lang, round(p_qu, 4), round(1.0 - p_qu, 4))
+
+    def score(self, text):
+        """(lang, p_qu, p_es) con prior uniforme."""
+        return self._probability(*self.log_ratio(text))
+
+    def score_many(self, texts):
+        """Como `score` para una lista, en un solo paso sobre los arreglos.
+
+        Las celdas de todos los textos van a un arreglo plano; los pesos se
+        leen de una vez y las sumas por texto salen de sumas prefijas.
+        """
+        b, max_order = self.buckets, self.max_order
+        cells = array('I')
+        ends = array('I')
+        for text in texts:
+            cells.extend(_langid_cells(text, b, max_order))
+            ends.append(len(cells))
+        prefix = array('d', itertools.accumulate(map(self.weights.__getitem__, cells), initial=0.0))
+        out = []
+        start = 0
+        for end in ends:
+            n = end - start
+            out.append(self._probability(prefix[end] - prefix[start] + n * self.bias, n))
+            start = end
+        return out
+
+_LANGID_MODEL = None
+_LANGID_STALE = False  # el artefacto en disco ya no refleja el diccionario
+_LANGID_LOCK = threading.Lock()
+
+def langid_model():
+    """Modelo cargado desde LANGID_MODEL_PATH o, si falta, entrenado en memoria."""
+    global _LANGID_MODEL
+    model = _LANGID_MODEL
+    if model is not None:
+        return model
+    with _LANGID_LOCK:
+        if _LANGID_MODEL is None:
+            try:
+                if _LANGID_STALE:
+                    raise ValueError('artefacto desactualizado')
+                _LANGID_MODEL = LangIdModel.load(LANGID_MODEL_PATH)
+            except Exception:
+                dic = DICT_STORE.snapshot().data
+                _LANGID_MODEL = LangIdModel.from_dictionary(dic) if dic else False
+        return _LANGID_MODEL
+
+def _langid_on_change(changes):
+    """Mantiene el modelo al día: actualiza conteos o lo marca para reentrenar."""
+    global _LANGID_MODEL, _LANGID_STALE
+    with _LANGID_LOCK:
+        model = _LANGID_MODEL
+        if model is None:
+            _LANGID_STALE = True
+        elif changes is None or not model or model.counts is None:
+            # Recarga completa o modelo sin conteos: reentrenar en el próximo uso
+            _LANGID_MODEL = None
+            _LANGID_STALE = True
+        elif changes:
+            _LANGID_MODEL = model.updated(changes)
+
+DICT_STORE.add_listener(_langid_on_change)
+
+def _detect_lang_heuristic(text):
     t = normalize_kichwa_token(text)
     hints_qu = sum(1 for ch in t if ch in _KICHWA_CHAR_HINTS)
     hints_es = sum(1 for ch in t if ch in _SPANISH_ONLY_HINTS)
@@ -248,86 +1454,1479 @@ def detect_lang_with_score(text):
     lang = 'qu' if score_qu >= max(1.0, score_es) else 'es'
     return (lang, float(score_qu), float(score_es))
 
-def backup_dictionary(reason="manual"):
-    # Copia con timestamp y versión
-    meta = ensure_meta_initialized()
-    ts = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-    version = meta.get('current_version', 0)
-    suffix = f"v{version}_{ts}"
-    backup_path = os.path.join(BACKUP_DIR, f"dictionary_es_qu_{suffix}.json")
-    dic = load_dictionary()
-    payload = {
-        'metadata': {
-            'reason': reason,
-            'created_at': _now_iso(),
-            'source': 'live-dictionary',
-            'version': version,
-            'entries': len(dic)
-        },
-        'dictionary': dic
-    }
-    _safe_write_json(backup_path, payload)
-    return backup_path
-
-def append_history(action, spanish_before=None, spanish_after=None, kichwa_before=None, kichwa_after=None, info=None):
-    history = _safe_read_json(HISTORY_PATH, [])
-    entry = {
-        'timestamp': _now_iso(),
-        'action': action,
-        'spanish_before': spanish_before,
-        'spanish_after': spanish_after,
-        'kichwa_before': kichwa_before,
-        'kichwa_after': kichwa_after,
-        'info': info or {}
-    }
-    history.append(entry)
-    _safe_write_json(HISTORY_PATH, history)
+def detect_lang_text(text):
+    """Devuelve 'qu' o 'es' para texto."""
+    lang, _, _ = detect_lang_with_score(text)
+    return lang
 
-def save_dictionary(new_dic, reason, info=None):
-    with DICT_LOCK:
-        # Respaldo del estado actual
-        backup_dictionary(reason=reason)
-        # Guardar nuevo estado
-        _safe_write_json(DICT_PATH, new_dic)
-        # Actualizar meta
-        meta = ensure_meta_initialized()
-        meta['current_version'] = int(meta.get('current_version', 0)) + 1
-        meta['last_updated'] = _now_iso()
-        meta['entry_count'] = len(new_dic)
-        _safe_write_json(META_PATH, meta)
-        # Guardar última versión final como backup labeled post-save
-        try:
-            ts = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            suffix = f"v{meta['current_version']}_{ts}_postsave"
-            backup_path = os.path.join(BACKUP_DIR, f"dictionary_es_qu_{suffix}.json")
-            payload = {
-                'metadata': {
-                    'reason': f"{reason}-postsave",
-                    'created_at': _now_iso(),
-                    'source': 'new-dictionary',
-                    'version': meta['current_version'],
-                    'entries': len(new_dic),
-                    'info': info or {}
-                },
-                'dictionary': new_dic
-            }
-            _safe_write_json(backup_path, payload)
-        except Exception:
-            pass
-        return True
+def detect_lang_with_score(text):
+    """Retorna (lang, score_qu, score_es).
 
-# Inicialización de meta e historial al iniciar la app
+    Con modelo de n-gramas los puntajes son probabilidades (suman 1); sin
+    modelo (diccionario vacío y sin artefacto) se usan las pistas heurísticas.
+    """
+    if not text:
+        return ('es', 0.0, 0.0)
+    model = langid_model()
+    if model:
+        return model.score(text)
+    return _detect_lang_heuristic(text)
+
+def detect_lang_many(texts):
+    """Versión por lotes de detect_lang_with_score."""
+    model = langid_model()
+    if model:
+        scored = iter(model.score_many([t for t in texts if t]))
+        return [next(scored) if t else ('es', 0.0, 0.0) for t in texts]
+    return [_detect_lang_heuristic(t) if t else ('es', 0.0, 0.0) for t in texts]
+
+@app.cli.command('train-langid')
+def train_langid_command():
+    """Entrena el modelo de idioma con el diccionario y lo guarda en data/."""
+    global _LANGID_MODEL, _LANGID_STALE
+    dic = DICT_STORE.snapshot().data
+    model = LangIdModel.from_dictionary(dic)
+    model.save(LANGID_MODEL_PATH)
+    with _LANGID_LOCK:
+        _LANGID_MODEL = model
+        _LANGID_STALE = False
+    pairs = [(k, 'es') for k in dic] + [(v, 'qu') for v in dic.values() if isinstance(v, str)]
+    predicted = model.score_many([text for text, _ in pairs])
+    hits = sum(1 for (_, lang), (got, _, _) in zip(pairs, predicted) if got == lang)
+    print(f"Modelo guardado en {LANGID_MODEL_PATH} ({os.path.getsize(LANGID_MODEL_PATH)} bytes); "
+          f"acierto sobre el diccionario: {hits}/{len(pairs)}")
+
+# -------------------- Backups versionados: snapshots completos + deltas --------------------
+_BACKUP_NAME_RE = re.compile(r'^(dictionary_es_qu|delta)_v(\d+)_.+\.json$')
+
+def _diff_changes(old_dic, new_dic):
+    """Lista de cambios (español, antes, después) entre dos diccionarios."""
+    changes = []
+    for es, qu in new_dic.items():
+        before = old_dic.get(es)
+        if before != qu:
+            changes.append((es, before, qu))
+    for es, qu in old_dic.items():
+        if es not in new_dic:
+            changes.append((es, qu, None))
+    return changes
+
+def _merge_changes(changes):
+    """Une cambios consecutivos por clave: (español, primer antes, último después)."""
+    merged = OrderedDict()
+    for es, before, after in changes:
+        first = merged[es][0] if es in merged else before
+        merged[es] = (first, after)
+    return [(es, before, after) for es, (before, after) in merged.items() if before != after]
+
+class BackupStore:
+    """Versiones del diccionario como snapshots completos periódicos + deltas.
+
+    Cada guardado escribe solo un delta con las claves agregadas/cambiadas
+    (`set`) y eliminadas (`removed`) respecto a la versión anterior. Cada
+    `full_every` versiones, o cuando el delta es mayor que medio diccionario,
+    se escribe un snapshot completo. Cualquier versión se reconstruye desde el
+    snapshot completo más cercano aplicando los deltas siguientes. Al escribir
+    un snapshot completo se compacta: se borra todo lo anterior al último
+    completo que queda fuera de la ventana de `retention` versiones.
+
+    La versión y el tipo se leen del nombre de archivo, sin abrirlo:
+    dictionary_es_qu_v<N>_*.json (completo) y delta_v<N>_*.json (delta).
+
+    Además mantiene un catálogo (`catalog_path`) con versión, motivo, fecha,
+    entradas y bytes de cada archivo, para listar backups sin parsearlos. El
+    catálogo es un JSONL al que cada backup (o borrado) agrega una línea, así
+    que varios procesos escriben sin pisarse. Al cargarlo se contrasta con la
+    carpeta, que manda: si falta algo o sobra, se completa leyendo solo los
+    archivos desconocidos y se reescribe compactado.
+    """
+
+    def __init__(self, folder, full_every=50, retention=500, catalog_path=None):
+        self.folder = folder
+        self.full_every = max(1, int(full_every))
+        self.retention = max(1, int(retention))
+        self.catalog_path = catalog_path
+        self._lock = threading.RLock()
+        self._fulls = {}   # versión -> [archivos]
+        self._deltas = {}  # versión -> archivo
+        self._catalog = None  # archivo -> entrada (carga diferida)
+        self._scan()
+
+    def _scan(self):
+        self._fulls, self._deltas = {}, {}
+        try:
+            names = sorted(os.listdir(self.folder))
+        except Exception:
+            names = []
+        for name in names:
+            m = _BACKUP_NAME_RE.match(name)
+            if not m:
+                continue
+            version = int(m.group(2))
+            if m.group(1) == 'delta':
+                self._deltas[version] = name
+            else:
+                self._fulls.setdefault(version, []).append(name)
+
+    @staticmethod
+    def parse_name(name):
+        """(versión, tipo) a partir del nombre de archivo, o None."""
+        m = _BACKUP_NAME_RE.match(name or '')
+        if not m:
+            return None
+        return int(m.group(2)), ('delta' if m.group(1) == 'delta' else 'full')
+
+    def _write(self, name, payload):
+        path = os.path.join(self.folder, name)
+        _safe_write_json(path, payload)
+        entry = self._catalog_entry(name, payload.get('metadata') or {}, path)
+        if self._catalog is not None:
+            self._catalog[name] = entry
+        self._append_catalog([entry])
+
+    # ---- catálogo ----
+    @classmethod
+    def _catalog_entry(cls, name, metadata, path):
+        parsed = cls.parse_name(name)
+        try:
+            size = os.path.getsize(path)
+        except Exception:
+            size = None
+        return {
+            'file': name,
+            'version': metadata.get('version', parsed[0] if parsed else None),
+            'kind': metadata.get('kind') or (parsed[1] if parsed else 'full'),
+            'reason': metadata.get('reason'),
+            'created_at': metadata.get('created_at'),
+            'entries': metadata.get('entries'),
+            'bytes': size,
+        }
+
+    def _append_catalog(self, records):
+        if not self.catalog_path:
+            return
+        try:
+            payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+            with open(self.catalog_path, 'a', encoding='utf-8') as f:
+                f.write(payload)
+        except Exception:
+            pass
+
+    def _read_catalog(self):
+        """Reproduce el JSONL: (archivo -> entrada, líneas leídas)."""
+        known, lines = {}, 0
+        if not self.catalog_path:
+            return known, lines
+        try:
+            with open(self.catalog_path, encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except Exception:
+                        continue  # línea truncada por un corte
+                    if not isinstance(record, dict) or not record.get('file'):
+                        continue
+                    if record.get('removed'):
+                        known.pop(record['file'], None)
+                    else:
+                        known[record['file']] = record
+        except Exception:
+            pass
+        return known, lines
+
+    def _save_catalog(self):
+        if not self.catalog_path or self._catalog is None:
+            return
+        tmp_path = f"{self.catalog_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self._catalog.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.catalog_path)
+        except Exception:
+            pass
+
+    def _ensure_catalog(self):
+        if self._catalog is not None:
+            return self._catalog
+        known, lines = self._read_catalog()
+        try:
+            names = [n for n in os.listdir(self.folder) if self.parse_name(n)]
+        except Exception:
+            names = []
+        catalog = {}
+        changed = len(known) != len(names)
+        for name in sorted(names):
+            entry = known.get(name)
+            if entry is None:
+                changed = True
+                path = os.path.join(self.folder, name)
+                try:
+                    metadata = _safe_read_json(path, {}).get('metadata') or {}
+                except Exception:
+                    metadata = {}
+                entry = self._catalog_entry(name, metadata, path)
+            catalog[name] = entry
+        self._catalog = catalog
+        # Compactar si hubo que completar o si el log acumula muchos borrados
+        if changed or lines > 2 * len(catalog) + 64:
+            self._save_catalog()
+        return catalog
+
+    def catalog(self, reason=None, kind=None, since=None, until=None):
+        """Entradas del catálogo filtradas, de la versión más nueva a la más vieja."""
+        with self._lock:
+            entries = list(self._ensure_catalog().values())
+        if until and len(until) == 10:
+            until = f"{until}T23:59:59Z"
+        out = []
+        for e in entries:
+            if reason and e.get('reason') != reason:
+                continue
+            if kind and e.get('kind') != kind:
+                continue
+            created = e.get('created_at') or ''
+            if since and created < since:
+                continue
+            if until and created > until:
+                continue
+            out.append(e)
+        out.sort(key=lambda e: (e.get('version') or 0, e.get('created_at') or '', e.get('file')), reverse=True)
+        return out
+
+    def write_full(self, dic, version, reason, source='live-dictionary', info=None):
+        ts = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        name = f"dictionary_es_qu_v{version}_{ts}.json"
+        payload = {
+            'metadata': {
+                'reason': reason,
+                'created_at': _now_iso(),
+                'source': source,
+                'kind': 'full',
+                'version': version,
+                'entries': len(dic),
+                'info': info or {}
+            },
+            'dictionary': dic
+        }
+        with self._lock:
+            self._write(name, payload)
+            names = self._fulls.setdefault(version, [])
+            if name not in names:
+                names.append(name)
+        return os.path.join(self.folder, name)
+
+    def write_delta(self, version, new_dic, old_dic, changes, reason, info=None):
+        ts = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        name = f"delta_v{version}_{ts}.json"
+        set_keys = {}
+        removed = []
+        for es, _, _ in changes:
+            if es in new_dic:
+                set_keys[es] = new_dic[es]
+            elif es in old_dic and es not in removed:
+                removed.append(es)
+        payload = {
+            'metadata': {
+                'reason': reason,
+                'created_at': _now_iso(),
+                'source': 'delta',
+                'kind': 'delta',
+                'version': version,
+                'base_version': version - 1,
+                'entries': len(new_dic),
+                'changed': len(set_keys) + len(removed),
+                'info': info or {}
+            },
+            'delta': {'set': set_keys, 'removed': removed}
+        }
+        with self._lock:
+            stale = self._deltas.get(version)
+            self._write(name, payload)
+            self._deltas[version] = name
+            if stale and stale != name:
+                self._remove(stale)
+        return os.path.join(self.folder, name)
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.folder, name))
+        except Exception:
+            pass
+        if self._catalog is not None:
+            self._catalog.pop(name, None)
+        self._append_catalog([{'file': name, 'removed': True}])
+
+    def _base_full(self, version):
+        """Versión del snapshot completo más cercano <= version con cadena íntegra."""
+        candidates = sorted((v for v in self._fulls if v <= version), reverse=True)
+        for v in candidates:
+            if all(x in self._deltas or x in self._fulls for x in range(v + 1, version + 1)):
+                return v
+        return None
+
+    def has_version(self, version):
+        with self._lock:
+            return self._base_full(version) is not None
+
+    def refresh(self):
+        """Vuelve a leer la carpeta (otro proceso pudo escribir versiones)."""
+        with self._lock:
+            self._scan()
+            self._catalog = None
+
+    def changes_since(self, from_version, to_version, data):
+        """Cambios de las versiones (from_version, to_version] aplicados sobre `data`.
+
+        Devuelve tuplas (español, antes, después) o None si falta alguna
+        versión. Un snapshot completo en el camino se resuelve como diferencia
+        con `data`, sin reconstruir desde el principio.
+        """
+        needed = range(from_version + 1, to_version + 1)
+        with self._lock:
+            if any(v not in self._fulls and v not in self._deltas for v in needed):
+                # Versiones de otro proceso: releer la carpeta y el catálogo
+                self.refresh()
+            steps = []
+            for v in needed:
+                if v in self._fulls:
+                    steps.append(('full', sorted(self._fulls[v])[-1]))
+                elif v in self._deltas:
+                    steps.append(('delta', self._deltas[v]))
+                else:
+                    return None
+        overlay = {}  # español -> valor nuevo (None = eliminado), relativo a `data`
+        try:
+            for kind, name in steps:
+                payload = self._load(name)
+                if kind == 'full':
+                    full = payload.get('dictionary') or {}
+                    overlay = {es: None for es in data if es not in full}
+                    overlay.update(full)
+                else:
+                    delta = payload.get('delta') or {}
+                    for es in delta.get('removed') or []:
+                        overlay[es] = None
+                    overlay.update(delta.get('set') or {})
+        except Exception:
+            # Compactado por otro proceso entre el escaneo y la lectura
+            return None
+        return [(es, data.get(es), after) for es, after in overlay.items() if data.get(es) != after]
+
+    def record(self, old_dic, new_dic, base_version, new_version, changes, reason, info=None):
+        """Registra el paso base_version -> new_version antes de guardarlo."""
+        with self._lock:
+            if self._base_full(base_version) is None:
+                # Sin cadena hasta la versión actual: fijar un snapshot completo base
+                self.write_full(old_dic, base_version, reason=f"{reason}-base")
+            last_full = max((v for v in self._fulls if v <= base_version), default=None)
+            big_delta = len(changes) * 2 > max(1, len(new_dic))
+            if last_full is None or new_version - last_full >= self.full_every or big_delta:
+                path = self.write_full(new_dic, new_version, reason=reason, source='new-dictionary', info=info)
+                self.compact(new_version)
+                return path
+            return self.write_delta(new_version, new_dic, old_dic, changes, reason=reason, info=info)
+
+    def _load(self, name):
+        with open(os.path.join(self.folder, name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def rebuild(self, version):
+        """Reconstruye el diccionario de `version` o devuelve None si no es posible."""
+        with self._lock:
+            base = self._base_full(version)
+            if base is None:
+                return None
+            full_name = sorted(self._fulls[base])[-1]
+            steps = []
+            for v in range(base + 1, version + 1):
+                if v in self._fulls:
+                    # un completo intermedio evita reaplicar deltas anteriores
+                    full_name, steps = sorted(self._fulls[v])[-1], []
+                else:
+                    steps.append(self._deltas[v])
+        dic = dict(self._load(full_name).get('dictionary') or {})
+        for name in steps:
+            delta = self._load(name).get('delta') or {}
+            for es in delta.get('removed') or []:
+                dic.pop(es, None)
+            dic.update(delta.get('set') or {})
+        return dic
+
+    def load_file(self, name):
+        """(versión, diccionario) del archivo `name`, o None si no es un backup existente.
+
+        El diccionario es None si la versión ya no puede reconstruirse.
+        """
+        parsed = self.parse_name(name)
+        if not parsed or not os.path.exists(os.path.join(self.folder, name)):
+            return None
+        version, kind = parsed
+        if kind == 'full':
+            return version, self._load(name).get('dictionary') or {}
+        return version, self.rebuild(version)
+
+    def walk(self):
+        """Recorre en orden las versiones retenidas: (versión, cambios, metadata).
+
+        `cambios` es la diferencia con la versión anterior, o None al iniciar
+        una cadena (primer snapshot completo o tras un hueco).
+        """
+        with self._lock:
+            fulls = {v: sorted(names)[-1] for v, names in self._fulls.items()}
+            deltas = dict(self._deltas)
+        if not fulls:
+            return
+        dic = None
+        for v in range(min(fulls), max(list(fulls) + list(deltas)) + 1):
+            if v in fulls:
+                payload = self._load(fulls[v])
+                new = dict(payload.get('dictionary') or {})
+                changes = _diff_changes(dic, new) if dic is not None else None
+                dic = new
+            elif v in deltas and dic is not None:
+                payload = self._load(deltas[v])
+                delta = payload.get('delta') or {}
+                changes = []
+                for es in delta.get('removed') or []:
+                    if es in dic:
+                        changes.append((es, dic.pop(es), None))
+                for es, qu in (delta.get('set') or {}).items():
+                    if dic.get(es) != qu:
+                        changes.append((es, dic.get(es), qu))
+                        dic[es] = qu
+            else:
+                dic = None
+                continue
+            yield v, changes, payload.get('metadata') or {}
+
+    def compact(self, current_version):
+        """Borra versiones fuera de la ventana de retención."""
+        with self._lock:
+            cutoff = current_version - self.retention
+            if cutoff <= 0:
+                return 0
+            anchors = [v for v in self._fulls if v <= cutoff]
+            if not anchors:
+                return 0
+            anchor = max(anchors)
+            removed = 0
+            for v in [v for v in self._fulls if v < anchor]:
+                for name in self._fulls.pop(v):
+                    self._remove(name)
+                    removed += 1
+            for v in [v for v in self._deltas if v <= anchor]:
+                self._remove(self._deltas.pop(v))
+                removed += 1
+            return removed
+
+BACKUP_STORE = BackupStore(
+    BACKUP_DIR,
+    full_every=_env_int('BACKUP_FULL_EVERY', 50),
+    retention=_env_int('BACKUP_RETENTION_VERSIONS', 500),
+    catalog_path=BACKUP_CATALOG_PATH,
+)
+
+def backup_dictionary(reason="manual"):
+    # Copia completa con timestamp y versión (tras volcar ediciones pendientes)
+    with DICT_LOCK:
+        COMMITS.flush()
+        meta = ensure_meta_initialized()
+        version = meta.get('current_version', 0)
+        return BACKUP_STORE.write_full(load_dictionary(), version, reason=reason)
+
+# -------------------- Historial: registro JSONL de solo anexado --------------------
+class HistoryLog:
+    """Historial de cambios como JSON Lines de solo anexado.
+
+    Cada entrada es una línea; anexar cuesta O(entrada) y no O(historial).
+    Las escrituras se vuelcan al SO de inmediato y el fsync se agrupa: como
+    mucho uno cada `fsync_interval` segundos, desde un hilo daemon. `tail`
+    lee desde el final del archivo por bloques.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = max(0.05, float(fsync_interval))
+        self._lock = threading.Lock()
+        self._fh = None
+        self._dirty = False
+        self._flusher = None
+
+    def _handle(self):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        return self._fh
+
+    def migrate_from(self, legacy_path):
+        """Convierte una sola vez el history.json (arreglo) al formato JSONL.
+
+        El original no se toca (está versionado en el repositorio); la
+        existencia del JSONL marca que la migración ya se hizo.
+        """
+        if os.path.exists(self.path) or not os.path.exists(legacy_path):
+            return 0
+        entries = _safe_read_json(legacy_path, [])
+        if not isinstance(entries, list):
+            entries = []
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(entries)
+
+    def append_many(self, entries):
+        if not entries:
+            return
+        payload = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries)
+        with self._lock:
+            fh = self._handle()
+            fh.write(payload)
+            fh.flush()
+            self._dirty = True
+            self._ensure_flusher()
+
+    def append(self, entry):
+        self.append_many([entry])
+
+    def sync(self):
+        with self._lock:
+            if self._fh is not None and self._dirty:
+                try:
+                    os.fsync(self._fh.fileno())
+                except Exception:
+                    pass
+                self._dirty = False
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(self.fsync_interval)
+                self.sync()
+
+        self._flusher = threading.Thread(target=_loop, daemon=True)
+        self._flusher.start()
+
+    def tail(self, limit):
+        """Últimas `limit` entradas en orden cronológico (limit <= 0: todas)."""
+        if not os.path.exists(self.path):
+            return []
+        if limit is None or limit <= 0:
+            return list(self._iter_all())
+        block = 64 * 1024
+        lines = []
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            rest = b''
+            while pos > 0 and len(lines) <= limit:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step) + rest
+                parts = chunk.split(b'\n')
+                rest = parts.pop(0)
+                lines = parts + lines
+            if pos == 0 and rest:
+                lines = [rest] + lines
+        out = []
+        for raw in lines[-(limit + 1):]:
+            if not raw.strip():
+                continue
+            try:
+                out.append(json.loads(raw.decode('utf-8')))
+            except Exception:
+                continue
+        return out[-limit:]
+
+    def _iter_all(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except Exception:
+                    continue
+
+HISTORY_LOG = HistoryLog(HISTORY_LOG_PATH)
+
+def make_history_entry(action, spanish_before=None, spanish_after=None, kichwa_before=None, kichwa_after=None, info=None):
+    return {
+        'timestamp': _now_iso(),
+        'action': action,
+        'spanish_before': spanish_before,
+        'spanish_after': spanish_after,
+        'kichwa_before': kichwa_before,
+        'kichwa_after': kichwa_after,
+        'info': info or {}
+    }
+
+def append_history(action, spanish_before=None, spanish_after=None, kichwa_before=None, kichwa_after=None, info=None):
+    HISTORY_LOG.append(make_history_entry(action, spanish_before, spanish_after, kichwa_before, kichwa_after, info))
+
+def _write_version(previous, new_dic, reason, info, changes, history=()):
+    """Escribe una versión nueva en disco (backup, diccionario y meta) y devuelve su número.
+
+    Con SQLite, `history` se guarda en la misma transacción; con JSON lo
+    anexa quien llama, después de la versión.
+    """
+    if SQLITE_STORAGE is not None:
+        return SQLITE_STORAGE.commit(changes, reason, info, history)[0]
+    meta = ensure_meta_initialized()
+    base_version = int(meta.get('current_version', 0))
+    new_version = base_version + 1
+    # Registrar la versión nueva (delta o snapshot completo) antes de escribir
+    BACKUP_STORE.record(previous, new_dic, base_version, new_version, changes, reason=reason, info=info)
+    # Guardar nuevo estado
+    _safe_write_json(DICT_PATH, new_dic)
+    # Actualizar meta
+    meta['current_version'] = new_version
+    meta['last_updated'] = _now_iso()
+    meta['entry_count'] = len(new_dic)
+    _safe_write_json(META_PATH, meta)
+    return new_version
+
+def save_dictionary(new_dic, reason, info=None, changes=None):
+    with DICT_LOCK:
+        # Las ediciones pendientes van primero para conservar el orden de versiones
+        COMMITS.flush()
+        previous = DICT_STORE.snapshot().data
+        if not isinstance(previous, dict):
+            # Puede ser una capa (LayeredMap); los backups necesitan un dict
+            previous = dict(previous)
+        if changes is None:
+            changes = _diff_changes(previous, new_dic)
+        if SQLITE_STORAGE is not None:
+            _write_version(previous, new_dic, reason, info, changes)
+            # Ponerse al día desde la base: incluye lo que otros procesos hayan escrito
+            DICT_STORE.snapshot()
+        else:
+            # Escritura y publicación juntas: los lectores no ven la firma nueva sin los datos
+            DICT_STORE.commit(lambda: _write_version(previous, new_dic, reason, info, changes),
+                              new_dic, changes=changes)
+        return True
+
+# -------------------- Ediciones: registro previo (WAL) y escritura agrupada --------------------
+DICT_WAL_PATH = os.path.join(DATA_FOLDER, 'dictionary.wal')
+
+class WriteAheadLog:
+    """Registro JSONL de ediciones confirmadas y aún no volcadas al diccionario.
+
+    Cada registro se escribe con fsync antes de responder al cliente; una
+    línea final incompleta (caída a mitad de escritura) se ignora al leer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def _handle(self):
+        if self._fh is None or self._fh.closed:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        return self._fh
+
+    def append(self, record):
+        fh = self._handle()
+        fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    def records(self):
+        out = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        out.append(json.loads(line))
+                    except ValueError:
+                        break
+        except FileNotFoundError:
+            pass
+        return out
+
+    def reset(self):
+        fh = self._handle()
+        fh.truncate(0)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+class CommitPipeline:
+    """Aplica las ediciones en memoria al instante y las vuelca a disco por lotes.
+
+    `submit` escribe la edición en el WAL, publica una instantánea nueva y
+    devuelve la versión que tendrá al volcarse; un hilo agrupa las ediciones
+    y, pasados `flush_interval` segundos desde la primera pendiente (o al
+    llegar a `batch_max`), las escribe como una sola versión: un backup, una
+    escritura del JSON y de meta.json, y las entradas de historial.
+
+    Con `synchronous` (modo multiproceso) cada edición se vuelca antes de
+    soltar DICT_LOCK: otro proceso no puede ver ni pisar ediciones que solo
+    existen en la memoria de este.
+    """
+
+    def __init__(self, wal, flush_interval=0.2, batch_max=100, synchronous=False):
+        self.wal = wal
+        self.flush_interval = max(0.0, flush_interval)
+        self.batch_max = max(1, batch_max)
+        self.synchronous = synchronous
+        self._pending = []       # registros del WAL sin volcar
+        self._first_pending = None
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = None
+        self.counters = {'edits': 0, 'flushes': 0, 'recovered': 0, 'flush_errors': 0}
+        self.last_error = None
+
+    def _pending_version(self):
+        return int(ensure_meta_initialized().get('current_version', 0)) + 1
+
+    def submit(self, reason, info, changes, history):
+        """Registra una edición y devuelve la versión en la que quedará guardada."""
+        with DICT_LOCK:
+            version = self._pending_version()
+            record = {
+                'version': version,
+                'reason': reason,
+                'info': info or {},
+                'changes': [list(c) for c in changes],
+                'history': history,
+            }
+            # Durable antes de confirmar: si el proceso cae, se reaplica al iniciar
+            self.wal.append(record)
+            self._apply(record)
+            if self.synchronous:
+                self.flush()
+        return version
+
+    def _apply(self, record):
+        # Capa sobre la instantánea actual; el diccionario completo se arma solo al volcar
+        data = DICT_STORE.snapshot().data
+        if not isinstance(data, LayeredMap):
+            data = LayeredMap(data)
+        changes = [tuple(c) for c in record['changes']]
+        dic = data.updated({es: _DELETED if after is None else after for es, _, after in changes})
+        with self._cond:
+            self._pending.append(record)
+            pending = len(self._pending)
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            self.counters['edits'] += 1
+            self._cond.notify()
+        DICT_STORE.publish(dic, record['version'], changes=changes, pending=pending, owned=True)
+
+    @staticmethod
+    def _merge(records):
+        """Une los cambios del lote: (español, primer antes, último después)."""
+        return _merge_changes(c for record in records for c in record['changes'])
+
+    def flush(self):
+        """Vuelca las ediciones pendientes como una sola versión. Devuelve la versión o None."""
+        with DICT_LOCK:
+            with self._cond:
+                batch = list(self._pending)
+            if not batch:
+                return None
+            changes = self._merge(batch)
+            dic = dict(DICT_STORE.snapshot().data)
+            for es, _, after in changes:
+                if after is None:
+                    dic.pop(es, None)
+                else:
+                    dic[es] = after
+            previous = dict(dic)
+            for es, before, _ in changes:
+                if before is None:
+                    previous.pop(es, None)
+                else:
+                    previous[es] = before
+            if len(batch) == 1:
+                reason, info = batch[0]['reason'], batch[0]['info']
+            else:
+                reasons = {}
+                for record in batch:
+                    reasons[record['reason']] = reasons.get(record['reason'], 0) + 1
+                reason, info = 'batch', {'edits': len(batch), 'reasons': reasons}
+            history = [entry for record in batch for entry in record['history']]
+            try:
+                # Los índices ya recibieron cada cambio al aplicarse; aquí solo cambia la versión
+                version = DICT_STORE.commit(
+                    lambda: _write_version(previous, dic, reason, info, changes, history),
+                    dic, changes=[], owned=True).version
+                if SQLITE_STORAGE is None:
+                    # Durable antes de vaciar el WAL; si se cae antes, recover lo completa
+                    HISTORY_LOG.append_many(history)
+                    HISTORY_LOG.sync()
+            except Exception as e:
+                self.counters['flush_errors'] += 1
+                self.last_error = str(e)
+                raise
+            with self._cond:
+                del self._pending[:len(batch)]
+                self._first_pending = None
+                self.counters['flushes'] += 1
+            self.wal.reset()
+            self.last_error = None
+            return version
+
+    def recover(self):
+        """Reaplica las ediciones del WAL que no llegaron a volcarse."""
+        with DICT_LOCK:
+            current = int(ensure_meta_initialized().get('current_version', 0))
+            records = self.wal.records()
+            self._restore_history([r for r in records if int(r.get('version', 0)) <= current])
+            records = [r for r in records if int(r.get('version', 0)) > current]
+            for record in records:
+                record['version'] = current + 1
+                self._apply(record)
+            self.counters['recovered'] += len(records)
+            if records:
+                self.flush()
+            else:
+                self.wal.reset()
+
+    @staticmethod
+    def _restore_history(flushed):
+        """Anexa el historial de un lote ya volcado que no llegó al registro.
+
+        El WAL se vacía después del historial, así que sus registros ya
+        volcados son el último lote; lo que falte es un sufijo de sus entradas.
+        """
+        entries = [entry for record in flushed for entry in record.get('history') or []]
+        if not entries:
+            return 0
+        tail = HISTORY_LOG.tail(len(entries))
+        written = next(k for k in range(min(len(tail), len(entries)), -1, -1)
+                       if tail[len(tail) - k:] == entries[:k])
+        missing = entries[written:]
+        HISTORY_LOG.append_many(missing)
+        HISTORY_LOG.sync()
+        return len(missing)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                due = self._first_pending + self.flush_interval
+                while len(self._pending) < self.batch_max and time.monotonic() < due:
+                    self._cond.wait(max(0.005, due - time.monotonic()))
+            try:
+                self.flush()
+            except Exception:
+                # Se reintenta en el siguiente ciclo; las ediciones siguen en el WAL
+                time.sleep(1.0)
+
+    def start(self):
+        if self._thread is None and not self.synchronous:
+            self._thread = threading.Thread(target=self._loop, name='dictionary-commit', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {**self.counters, 'pending': pending, 'last_error': self.last_error,
+                'flush_interval_ms': int(self.flush_interval * 1000), 'batch_max': self.batch_max,
+                'synchronous': self.synchronous}
+
+COMMITS = CommitPipeline(
+    WriteAheadLog(DICT_WAL_PATH),
+    flush_interval=_env_int('COMMIT_FLUSH_MS', 200) / 1000.0,
+    batch_max=_env_int('COMMIT_BATCH_MAX', 100),
+    synchronous=DICT_MULTIPROCESS,
+)
+
+# -------------------- Modo multiproceso: versión compartida vía meta.json --------------------
+class JsonDictionarySource:
+    """Origen del diccionario JSON cuando varios procesos comparten data/.
+
+    La firma es la de meta.json, que `_write_version` reemplaza después del
+    diccionario: si no cambió, ninguna versión nueva está a medio escribir y
+    comprobarlo cuesta un `stat`. Cuando cambia, la instantánea se pone al día
+    con los deltas de las versiones nuevas (BackupStore.changes_since) y los
+    índices y cachés del proceso reciben solo esos cambios.
+    """
+
+    def __init__(self, dict_path, meta_path, backups):
+        self.dict_path = dict_path
+        self.meta_path = meta_path
+        self.backups = backups
+
+    def signature(self):
+        try:
+            st = os.stat(self.meta_path)
+            # os.replace deja un inodo nuevo: distingue escrituras en el mismo tick del reloj
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except Exception:
+            return None
+
+    def _version(self):
+        return int(_safe_read_json(self.meta_path, {}).get('current_version', 0) or 0)
+
+    def load(self):
+        sig = self.signature()
+        version = self._version()
+        data = _safe_read_json(self.dict_path, {})
+        if not isinstance(data, dict):
+            data = {}
+        return data, version, sig
+
+    def catch_up(self, snapshot):
+        sig = self.signature()
+        version = self._version()
+        if version <= snapshot.version:
+            return None
+        changes = self.backups.changes_since(snapshot.version, version, snapshot.data)
+        if changes is None:
+            return None
+        return changes, version, sig
+
+if DICT_MULTIPROCESS and STORAGE_BACKEND != 'sqlite':
+    DICT_STORE.source = JsonDictionarySource(DICT_PATH, META_PATH, BACKUP_STORE)
+
+# -------------------- Almacenamiento opcional en SQLite --------------------
+_SQLITE_SNAPSHOT_RE = re.compile(r'^snapshot-(\d+)$')
+_SQLITE_VERSION_RE = re.compile(r'^v(\d+)$')
+
+class SqliteStorage:
+    """Diccionario, versiones, historial y backups en una base SQLite (modo WAL).
+
+    Cada edición es una transacción `BEGIN IMMEDIATE`: SQLite serializa a los
+    escritores de todos los procesos que comparten el archivo y los lectores
+    siguen viendo la versión anterior sin bloquearse. De cada versión se
+    guardan sus cambios (español, antes, después); con ellos otro proceso pone
+    al día su instantánea en memoria sin releer todo, y cualquier versión
+    retenida se reconstruye deshaciendo los cambios posteriores.
+
+    Las lecturas frecuentes (traducción, búsqueda, listados) siguen usando la
+    instantánea de DICT_STORE; `signature()` indica cuándo hay que ponerla al
+    día y solo relee la tabla state si la base cambió. Las columnas `es_norm`
+    y `qu_norm` (indexadas) guardan las formas normalizadas: las búsquedas
+    exactas (`find_exact`) son consultas puntuales sobre ellas.
+    """
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries ('
+        ' spanish TEXT PRIMARY KEY, kichwa TEXT NOT NULL,'
+        ' es_norm TEXT NOT NULL, qu_norm TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS entries_es_norm ON entries (es_norm)',
+        'CREATE INDEX IF NOT EXISTS entries_qu_norm ON entries (qu_norm)',
+        'CREATE TABLE IF NOT EXISTS state ('
+        ' id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL,'
+        ' updated_ns INTEGER NOT NULL, last_updated TEXT, entry_count INTEGER NOT NULL)',
+        'INSERT OR IGNORE INTO state (id, version, updated_ns, last_updated, entry_count)'
+        ' VALUES (1, 0, 0, NULL, 0)',
+        'CREATE TABLE IF NOT EXISTS versions ('
+        ' version INTEGER PRIMARY KEY, created_at TEXT NOT NULL, reason TEXT,'
+        ' info TEXT, entries INTEGER, changed INTEGER)',
+        'CREATE TABLE IF NOT EXISTS changes ('
+        ' version INTEGER NOT NULL, seq INTEGER NOT NULL, spanish TEXT NOT NULL,'
+        ' kichwa_before TEXT, kichwa_after TEXT, PRIMARY KEY (version, seq))',
+        'CREATE TABLE IF NOT EXISTS snapshots ('
+        ' id INTEGER PRIMARY KEY AUTOINCREMENT, version INTEGER NOT NULL,'
+        ' created_at TEXT NOT NULL, reason TEXT, entries INTEGER, data TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS history ('
+        ' id INTEGER PRIMARY KEY AUTOINCREMENT, version INTEGER, entry TEXT NOT NULL)',
+    )
+
+    def __init__(self, path, retention=500, busy_timeout_ms=10000):
+        self.path = path
+        self.retention = max(1, int(retention))
+        self.busy_timeout = max(0, int(busy_timeout_ms)) / 1000.0
+        self._local = threading.local()
+
+        def create(conn):
+            for sql in self._SCHEMA:
+                conn.execute(sql)
+
+        self._transaction(create)
+
+    def _conn(self):
+        # Una conexión por hilo; en modo autocommit las transacciones son explícitas
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work, write=True):
+        """Ejecuta `work(conn)` en una transacción; las de escritura toman el candado de SQLite al inicio."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        if write:
+            # data_version no cambia con los commits de la propia conexión
+            self._local.signature = None
+        return result
+
+    @staticmethod
+    def _state(conn):
+        return conn.execute(
+            'SELECT version, updated_ns, last_updated, entry_count FROM state WHERE id = 1').fetchone()
+
+    @staticmethod
+    def _entry_row(es, qu):
+        return (es, qu, normalize_kichwa_token(es), normalize_kichwa_token(qu))
+
+    # ---- estado ----
+    def meta(self):
+        version, _, last_updated, entry_count = self._state(self._conn())
+        return {'current_version': version, 'last_updated': last_updated,
+                'entry_count': entry_count, 'storage': 'sqlite'}
+
+    def signature(self):
+        """(updated_ns, versión), cacheada por conexión mientras la base no cambie.
+
+        `PRAGMA data_version` no lee tablas y cambia cuando otra conexión (de
+        este u otro proceso) confirma una transacción.
+        """
+        conn = self._conn()
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        cached = getattr(self._local, 'signature', None)
+        if cached is not None and cached[0] == data_version:
+            return cached[1]
+        version, updated_ns, _, _ = self._state(conn)
+        signature = (updated_ns, version)
+        self._local.signature = (data_version, signature)
+        return signature
+
+    def is_empty(self):
+        conn = self._conn()
+        return self._state(conn)[0] == 0 and conn.execute('SELECT 1 FROM entries LIMIT 1').fetchone() is None
+
+    # ---- lectura del diccionario ----
+    def load(self):
+        """(diccionario, versión, firma) leídos en una sola transacción."""
+        def work(conn):
+            version, updated_ns, _, _ = self._state(conn)
+            data = dict(conn.execute('SELECT spanish, kichwa FROM entries'))
+            return data, version, (updated_ns, version)
+        return self._transaction(work, write=False)
+
+    def find_exact(self, text, fields=('es', 'qu')):
+        """(resultados, versión) de las entradas cuyo campo normalizado es `text`.
+
+        Consulta puntual sobre los índices entries_es_norm y entries_qu_norm;
+        los resultados tienen la misma forma que DictionarySearchIndex.search.
+        """
+        q = normalize_kichwa_token(text or '')
+
+        def work(conn):
+            version = self._state(conn)[0]
+            found = {}
+            for field in fields:
+                column = 'es_norm' if field == 'es' else 'qu_norm'
+                for es, qu in conn.execute(f'SELECT spanish, kichwa FROM entries WHERE {column} = ?', (q,)):
+                    found.setdefault(es, {'spanish': es, 'kichwa': qu, 'match': 'exact',
+                                          'field': field, 'distance': 0})
+            return [found[es] for es in sorted(found)], version
+        if not q:
+            return [], self.signature()[1]
+        return self._transaction(work, write=False)
+
+    def _has_chain(self, conn, version, current):
+        """True si se conservan los cambios de todas las versiones posteriores a `version`."""
+        if version < 0 or version > current:
+            return False
+        count = conn.execute('SELECT COUNT(*) FROM versions WHERE version > ? AND version <= ?',
+                             (version, current)).fetchone()[0]
+        return count == current - version
+
+    def catch_up(self, snapshot):
+        """(cambios, versión, firma) posteriores a la versión de `snapshot`, o None si hay que recargar todo."""
+        from_version = snapshot.version
+
+        def work(conn):
+            version, updated_ns, _, _ = self._state(conn)
+            # Misma versión con otra firma: la base se reemplazó (p.ej. migrate-sqlite --force)
+            if version <= from_version or not self._has_chain(conn, from_version, version):
+                return None
+            rows = conn.execute(
+                'SELECT spanish, kichwa_before, kichwa_after FROM changes'
+                ' WHERE version > ? ORDER BY version, seq', (from_version,))
+            return _merge_changes(rows), version, (updated_ns, version)
+        return self._transaction(work, write=False)
+
+    # ---- escritura ----
+    def _insert_version(self, conn, version, changes, reason, info, created_at, entries):
+        conn.execute('INSERT OR REPLACE INTO versions (version, created_at, reason, info, entries, changed)'
+                     ' VALUES (?, ?, ?, ?, ?, ?)',
+                     (version, created_at or _now_iso(), reason,
+                      json.dumps(info or {}, ensure_ascii=False), entries, len(changes)))
+        conn.execute('DELETE FROM changes WHERE version = ?', (version,))
+        conn.executemany('INSERT INTO changes (version, seq, spanish, kichwa_before, kichwa_after)'
+                         ' VALUES (?, ?, ?, ?, ?)',
+                         [(version, i, es, before, after) for i, (es, before, after) in enumerate(changes)])
+
+    def _set_state(self, conn, version, entry_count, previous_ns):
+        # La firma debe cambiar con cada escritura aunque el reloj no avance
+        updated_ns = max(time.time_ns(), previous_ns + 1)
+        conn.execute('UPDATE state SET version = ?, updated_ns = ?, last_updated = ?, entry_count = ?'
+                     ' WHERE id = 1', (version, updated_ns, _now_iso(), entry_count))
+
+    def _prune(self, conn, current):
+        cutoff = current - self.retention
+        if cutoff <= 0:
+            return 0
+        removed = conn.execute('DELETE FROM versions WHERE version <= ?', (cutoff,)).rowcount
+        conn.execute('DELETE FROM changes WHERE version <= ?', (cutoff,))
+        removed += conn.execute('DELETE FROM snapshots WHERE version <= ?', (cutoff,)).rowcount
+        return removed
+
+    def commit(self, changes, reason, info=None, history=()):
+        """Aplica `changes` como una versión nueva, con su historial, en una transacción.
+
+        Los valores "antes" se releen dentro de la transacción (otro proceso
+        pudo editar mientras tanto). Devuelve (versión, cambios efectivos).
+        """
+        def work(conn):
+            current, previous_ns, _, entry_count = self._state(conn)
+            version = current + 1
+            effective = []
+            for es, _, after in changes:
+                row = conn.execute('SELECT kichwa FROM entries WHERE spanish = ?', (es,)).fetchone()
+                before = row[0] if row else None
+                if before == after:
+                    continue
+                if after is None:
+                    conn.execute('DELETE FROM entries WHERE spanish = ?', (es,))
+                    entry_count -= 1
+                else:
+                    conn.execute('INSERT OR REPLACE INTO entries (spanish, kichwa, es_norm, qu_norm)'
+                                 ' VALUES (?, ?, ?, ?)', self._entry_row(es, after))
+                    if before is None:
+                        entry_count += 1
+                effective.append((es, before, after))
+            self._insert_version(conn, version, effective, reason, info, None, entry_count)
+            if history:
+                conn.executemany('INSERT INTO history (version, entry) VALUES (?, ?)',
+                                 [(version, json.dumps(e, ensure_ascii=False)) for e in history])
+            self._set_state(conn, version, entry_count, previous_ns)
+            self._prune(conn, version)
+            return version, effective
+        return self._transaction(work)
+
+    # ---- versiones y backups ----
+    def rebuild(self, version):
+        """Diccionario de `version` deshaciendo los cambios posteriores, o None si no se conserva."""
+        def work(conn):
+            current = self._state(conn)[0]
+            if not self._has_chain(conn, version, current):
+                return None
+            dic = dict(conn.execute('SELECT spanish, kichwa FROM entries'))
+            undo = conn.execute(
+                'SELECT spanish, kichwa_before FROM changes'
+                ' WHERE version > ? ORDER BY version DESC, seq DESC', (version,))
+            for es, before in undo:
+                if before is None:
+                    dic.pop(es, None)
+                else:
+                    dic[es] = before
+            return dic
+        return self._transaction(work, write=False)
+
+    def write_snapshot(self, dic, version, reason):
+        def work(conn):
+            cur = conn.execute('INSERT INTO snapshots (version, created_at, reason, entries, data)'
+                               ' VALUES (?, ?, ?, ?, ?)',
+                               (version, _now_iso(), reason, len(dic), json.dumps(dic, ensure_ascii=False)))
+            return f"snapshot-{cur.lastrowid}"
+        return self._transaction(work)
+
+    def load_snapshot(self, snapshot_id):
+        row = self._conn().execute('SELECT version, data FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def catalog(self, reason=None, kind=None, since=None, until=None):
+        """Versiones (kind 'delta') y snapshots manuales (kind 'full'), de la más nueva a la más vieja."""
+        where, params = [], []
+        if reason:
+            where.append('reason = ?')
+            params.append(reason)
+        if since:
+            where.append('created_at >= ?')
+            params.append(since)
+        if until:
+            where.append('created_at <= ?')
+            params.append(until)
+        clause = (' WHERE ' + ' AND '.join(where)) if where else ''
+        conn = self._conn()
+        out = []
+        if kind in (None, 'delta'):
+            for version, created_at, why, entries, changed in conn.execute(
+                    'SELECT version, created_at, reason, entries, changed FROM versions' + clause, params):
+                out.append({'file': f"v{version}", 'version': version, 'kind': 'delta', 'reason': why,
+                            'created_at': created_at, 'entries': entries, 'changed': changed, 'bytes': None})
+        if kind in (None, 'full'):
+            for ident, version, created_at, why, entries, size in conn.execute(
+                    'SELECT id, version, created_at, reason, entries, length(data) FROM snapshots' + clause, params):
+                out.append({'file': f"snapshot-{ident}", 'version': version, 'kind': 'full', 'reason': why,
+                            'created_at': created_at, 'entries': entries, 'bytes': size})
+        out.sort(key=lambda e: (e.get('version') or 0, e.get('created_at') or '', e.get('file')), reverse=True)
+        return out
+
+    def compact(self, current_version):
+        return self._transaction(lambda conn: self._prune(conn, current_version))
+
+    # ---- historial ----
+    def append_history(self, entries):
+        def work(conn):
+            version = self._state(conn)[0]
+            conn.executemany('INSERT INTO history (version, entry) VALUES (?, ?)',
+                             [(version, json.dumps(e, ensure_ascii=False)) for e in entries])
+        self._transaction(work)
+
+    def history_tail(self, limit):
+        """Últimas `limit` entradas en orden cronológico (limit <= 0: todas)."""
+        conn = self._conn()
+        if limit is None or limit <= 0:
+            rows = conn.execute('SELECT entry FROM history ORDER BY id').fetchall()
+        else:
+            rows = conn.execute('SELECT entry FROM history ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+            rows.reverse()
+        return [json.loads(r[0]) for r in rows]
+
+    # ---- migración ----
+    def import_state(self, dic, version, versions, history, force=False):
+        """Reemplaza el contenido de la base en una sola transacción.
+
+        `versions` son tuplas (versión, cambios, metadata) como las de
+        BackupStore.walk(). Sin `force` no toca una base con datos y devuelve None.
+        """
+        def work(conn):
+            if not force and (self._state(conn)[0] != 0 or
+                              conn.execute('SELECT 1 FROM entries LIMIT 1').fetchone() is not None):
+                return None
+            previous_ns = self._state(conn)[1]
+            for table in ('entries', 'versions', 'changes', 'snapshots', 'history'):
+                conn.execute(f'DELETE FROM {table}')
+            conn.executemany('INSERT INTO entries (spanish, kichwa, es_norm, qu_norm) VALUES (?, ?, ?, ?)',
+                             (self._entry_row(es, qu) for es, qu in dic.items()))
+            imported = 0
+            for v, changes, metadata in versions:
+                if changes is None or v > version:
+                    continue
+                self._insert_version(conn, v, changes, metadata.get('reason'), metadata.get('info'),
+                                     metadata.get('created_at'), metadata.get('entries'))
+                imported += 1
+            conn.executemany('INSERT INTO history (version, entry) VALUES (NULL, ?)',
+                             ((json.dumps(e, ensure_ascii=False),) for e in history))
+            self._set_state(conn, version, len(dic), previous_ns)
+            return {'entries': len(dic), 'version': version, 'versions': imported, 'history': len(history)}
+        return self._transaction(work)
+
+class SqliteHistoryLog:
+    """Historial en la tabla `history`; misma interfaz que HistoryLog."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def migrate_from(self, legacy_path):
+        return 0
+
+    def append_many(self, entries):
+        if entries:
+            self.storage.append_history(entries)
+
+    def append(self, entry):
+        self.append_many([entry])
+
+    def sync(self):
+        pass
+
+    def tail(self, limit):
+        return self.storage.history_tail(limit)
+
+class SqliteBackupStore:
+    """Backups sobre SqliteStorage; misma interfaz que BackupStore.
+
+    Cada versión ya guarda sus cambios al confirmarse, así que `record` no
+    escribe nada; los backups manuales se guardan como snapshots completos.
+    Los nombres del catálogo son v<N> (versiones) y snapshot-<id>.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def record(self, old_dic, new_dic, base_version, new_version, changes, reason, info=None):
+        return None
+
+    def write_full(self, dic, version, reason, source='live-dictionary', info=None):
+        return self.storage.write_snapshot(dic, version, reason)
+
+    def rebuild(self, version):
+        return self.storage.rebuild(version)
+
+    def has_version(self, version):
+        return self.storage.rebuild(version) is not None
+
+    def load_file(self, name):
+        m = _SQLITE_SNAPSHOT_RE.match(name or '')
+        if m:
+            return self.storage.load_snapshot(int(m.group(1)))
+        m = _SQLITE_VERSION_RE.match(name or '')
+        if m is None:
+            return None
+        version = int(m.group(1))
+        dic = self.storage.rebuild(version)
+        if dic is None and version > self.storage.meta()['current_version']:
+            return None
+        return version, dic
+
+    def catalog(self, reason=None, kind=None, since=None, until=None):
+        if until and len(until) == 10:
+            until = f"{until}T23:59:59Z"
+        return self.storage.catalog(reason=reason, kind=kind, since=since, until=until)
+
+    def compact(self, current_version):
+        return self.storage.compact(current_version)
+
+class SqliteCommitter:
+    """Sustituto de CommitPipeline: cada edición es su propia transacción SQLite.
+
+    En modo WAL una confirmación solo anexa páginas al registro de SQLite, sin
+    reescribir el diccionario, así que no hace falta agrupar ediciones ni un
+    WAL propio: `flush`, `recover` y `start` no tienen nada que hacer.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.counters = {'edits': 0, 'flushes': 0, 'recovered': 0, 'flush_errors': 0}
+        self.last_error = None
+
+    def submit(self, reason, info, changes, history):
+        with DICT_LOCK:
+            try:
+                version, _ = self.storage.commit(changes, reason, info, history)
+            except Exception as e:
+                self.counters['flush_errors'] += 1
+                self.last_error = str(e)
+                raise
+            self.counters['edits'] += 1
+            self.last_error = None
+            DICT_STORE.snapshot()
+        return version
+
+    def flush(self):
+        return None
+
+    def recover(self):
+        pass
+
+    def start(self):
+        pass
+
+    def stats(self):
+        return {**self.counters, 'pending': 0, 'last_error': self.last_error,
+                'flush_interval_ms': 0, 'batch_max': 1, 'storage': 'sqlite'}
+
+def migrate_json_to_sqlite(storage, force=False):
+    """Copia a `storage` el diccionario, las versiones retenidas y el historial JSON.
+
+    Devuelve un resumen, o None si la base ya tiene datos y no se pidió `force`.
+    """
+    dic = _safe_read_json(DICT_PATH, {})
+    if not isinstance(dic, dict):
+        dic = {}
+    dic = {es: qu for es, qu in dic.items() if isinstance(qu, str)}
+    version = int(_safe_read_json(META_PATH, {}).get('current_version', 0) or 0)
+    backups = BackupStore(BACKUP_DIR)
+    saved = version
+    versions = [v for v in backups.walk() if v[0] <= saved]
+    history = HistoryLog(HISTORY_LOG_PATH).tail(0)
+    # Ediciones manuales del JSON posteriores al último backup: una versión más
+    if versions and versions[-1][0] == version:
+        replayed = backups.rebuild(version)
+        drift = _diff_changes(replayed, dic) if replayed is not None else []
+        if drift:
+            version += 1
+            versions.append((version, drift, {'reason': 'migrate-sqlite', 'entries': len(dic)}))
+    # Ediciones confirmadas en el WAL que no llegaron a volcarse al JSON
+    for record in WriteAheadLog(DICT_WAL_PATH).records():
+        if int(record.get('version', 0)) <= saved:
+            continue
+        changes = [tuple(c) for c in record.get('changes') or []]
+        for es, _, after in changes:
+            if after is None:
+                dic.pop(es, None)
+            else:
+                dic[es] = after
+        version += 1
+        versions.append((version, changes, {'reason': record.get('reason'), 'info': record.get('info'),
+                                            'entries': len(dic)}))
+        history.extend(record.get('history') or [])
+    return storage.import_state(dic, version, versions, history, force=force)
+
+@app.cli.command('migrate-sqlite')
+@click.option('--force', is_flag=True, help='Reemplaza el contenido si la base ya tiene datos.')
+@click.option('--db', 'db_path', default=None, help='Ruta de la base (por defecto SQLITE_DB_PATH).')
+def migrate_sqlite_command(force, db_path):
+    """Copia diccionario, versiones e historial de data/ (JSON) a la base SQLite."""
+    if SQLITE_STORAGE is None:
+        # Volcar ediciones pendientes del pipeline JSON antes de leer los archivos
+        COMMITS.flush()
+        HISTORY_LOG.sync()
+    if db_path or SQLITE_STORAGE is None:
+        storage = SqliteStorage(db_path or SQLITE_DB_PATH,
+                                retention=_env_int('BACKUP_RETENTION_VERSIONS', 500))
+    else:
+        storage = SQLITE_STORAGE
+    summary = migrate_json_to_sqlite(storage, force=force)
+    if summary is None:
+        print(f"{storage.path} ya tiene datos; use --force para reemplazarlos")
+        return
+    print(f"Migrado a {storage.path}: {summary['entries']} entradas, versión {summary['version']}, "
+          f"{summary['versions']} versiones con cambios y {summary['history']} entradas de historial")
+
+if STORAGE_BACKEND == 'sqlite':
+    SQLITE_STORAGE = SqliteStorage(SQLITE_DB_PATH, retention=_env_int('BACKUP_RETENTION_VERSIONS', 500))
+    DICT_STORE.source = SQLITE_STORAGE
+    HISTORY_LOG = SqliteHistoryLog(SQLITE_STORAGE)
+    BACKUP_STORE = SqliteBackupStore(SQLITE_STORAGE)
+    COMMITS = SqliteCommitter(SQLITE_STORAGE)
+
+# Inicialización de meta e historial al iniciar la app
 try:
+    if SQLITE_STORAGE is not None and SQLITE_STORAGE.is_empty():
+        # Primer arranque con SQLite: importar los archivos JSON existentes
+        migrate_json_to_sqlite(SQLITE_STORAGE)
     ensure_meta_initialized()
-    if not os.path.exists(HISTORY_PATH):
-        _safe_write_json(HISTORY_PATH, [])
-    # Iniciar limpieza periódica de audios
-    _start_audio_cleanup_thread()
+    # Migración única de history.json (arreglo) a history.jsonl
+    HISTORY_LOG.migrate_from(HISTORY_PATH)
+    # Iniciar limpieza de audios (un escaneo inicial y luego por vencimiento)
+    AUDIO_JANITOR.start()
+except Exception:
+    pass
+
+try:
+    # Reaplicar ediciones confirmadas que no alcanzaron a guardarse y arrancar el volcado
+    COMMITS.recover()
+    COMMITS.start()
 except Exception:
     pass
 
-# Inicializar traductor
-translator = GoogleTranslator()
 
 @app.route('/')
 def index():
@@ -341,186 +2940,1317 @@ def diccionario_page():
 def estudiar_page():
     return render_template('estudiar.html')
 
-@app.route('/speech-to-text', methods=['POST'])
-def speech_to_text():
-    # Verificar archivo
-    audio_file = None
-    if 'file' in request.files:
-        audio_file = request.files['file']
+# -------------------- Voz a texto: reconocedores y cola de trabajos --------------------
+def _stt_language_code(lang_param):
+    """Normaliza el parámetro `lang`; None significa autodetección (qu-EC / es-EC)."""
+    if lang_param in ('qu', 'qu-EC'):
+        return 'qu-EC'
+    if lang_param in ('es', 'es-ES', 'es-EC'):
+        return 'es-EC'
+    return lang_param or None
+
+STT_RECOGNIZE_TIMEOUT = _env_int('STT_RECOGNIZE_TIMEOUT_SECONDS', 20)
+# Probabilidad mínima de que el texto esté en el idioma pedido para no esperar al otro
+STT_CLEAR_WIN = 0.85
+
+class GoogleSpeechRecognizer:
+    """Reconocimiento con la API web de Google (speech_recognition)."""
+
+    name = 'google'
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else STT_RECOGNIZE_TIMEOUT
+
+    def recognize(self, audio_data, language):
+        recognizer = sr.Recognizer()
+        # Corta la llamada HTTP en lugar de dejar el hilo colgado indefinidamente
+        recognizer.operation_timeout = self.timeout
+        return recognizer.recognize_google(audio_data, language=language)
+
+class LocalStandInRecognizer:
+    """Reconocedor local sin red, para pruebas y desarrollo.
+
+    Devuelve `STT_LOCAL_TEXT` (si está definido) o una descripción del audio,
+    tras esperar `STT_LOCAL_DELAY_MS` para simular la latencia remota.
+    """
+
+    name = 'local'
+
+    def recognize(self, audio_data, language):
+        delay_ms = _env_int('STT_LOCAL_DELAY_MS', 0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+        text = os.getenv('STT_LOCAL_TEXT')
+        if text is not None:
+            return text
+        frame_bytes = max(1, audio_data.sample_rate * audio_data.sample_width)
+        seconds = len(audio_data.frame_data) / frame_bytes
+        return f"[{language}] audio de {seconds:.1f} s"
+
+_STT_RECOGNIZERS = {
+    'google': GoogleSpeechRecognizer,
+    'local': LocalStandInRecognizer,
+}
+_stt_recognizer = None
+
+def stt_recognizer():
+    """Reconocedor activo, elegido con STT_RECOGNIZER (google por defecto)."""
+    global _stt_recognizer
+    if _stt_recognizer is None:
+        name = (os.getenv('STT_RECOGNIZER') or 'google').lower()
+        _stt_recognizer = _STT_RECOGNIZERS.get(name, GoogleSpeechRecognizer)()
+    return _stt_recognizer
+
+def set_stt_recognizer(recognizer):
+    """Reemplaza el reconocedor (p. ej. por uno falso en pruebas); None restaura el de entorno."""
+    global _stt_recognizer
+    _stt_recognizer = recognizer
+
+_STT_AUTO_LANGS = ('qu-EC', 'es-EC')
+_stt_executor = None
+_stt_executor_lock = threading.Lock()
+
+def _stt_pool():
+    """Hilos compartidos para las llamadas paralelas de reconocimiento."""
+    global _stt_executor
+    if _stt_executor is None:
+        with _stt_executor_lock:
+            if _stt_executor is None:
+                _stt_executor = ThreadPoolExecutor(
+                    max_workers=max(2, _env_int('STT_RECOGNIZE_WORKERS', 4)),
+                    thread_name_prefix='stt-recognize',
+                )
+    return _stt_executor
+
+def _recognize_or_empty(engine, audio_data, language):
+    try:
+        return engine.recognize(audio_data, language) or ''
+    except Exception:
+        return ''
+
+def _stt_agreement(text, language):
+    """Probabilidad de que `text` esté en el idioma que se pidió al reconocedor."""
+    if not text:
+        return 0.0
+    _, score_qu, score_es = detect_lang_with_score(text)
+    total = score_qu + score_es
+    if total <= 0:
+        return 0.5
+    return (score_qu if language.startswith('qu') else score_es) / total
+
+def recognize_auto(audio_data, engine=None, timeout=None):
+    """Reconoce en qu-EC y es-EC a la vez y devuelve (texto, idioma).
+
+    Gana el candidato cuyo texto más se parece al idioma pedido según
+    `detect_lang_with_score`; si el primero en llegar ya es claro
+    (>= STT_CLEAR_WIN) no se espera al segundo, cuyo resultado se ignora.
+    Con puntajes parecidos se conserva el criterio anterior: el texto más largo.
+    """
+    engine = engine or stt_recognizer()
+    timeout = STT_RECOGNIZE_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    pool = _stt_pool()
+    futures = {pool.submit(_recognize_or_empty, engine, audio_data, lang): lang for lang in _STT_AUTO_LANGS}
+    candidates = []
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for fut in done:
+            lang = futures[fut]
+            text = fut.result()
+            if text:
+                candidates.append((_stt_agreement(text, lang), text, lang))
+        if pending and candidates and max(candidates)[0] >= STT_CLEAR_WIN:
+            break
+    for fut in pending:
+        fut.cancel()
+    if not candidates:
+        return '', None
+    best = max(candidates)
+    close = [c for c in candidates if best[0] - c[0] < 0.1]
+    _, text, lang = max(close, key=lambda c: len(c[1]))
+    return text, lang
+
+class SttJob:
+    """Estado de un trabajo de transcripción asíncrona."""
+
+    def __init__(self, job_id, upload, language_code):
+        self.id = job_id
+        self.upload = upload
+        self.language_code = language_code
+        self.status = 'queued'
+        self.result = None
+        self.http_status = None
+        self.created = time.monotonic()
+        self.created_at = _now_iso()
+        self.finished_at = None
+        self.changed = threading.Condition()
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status, 'created_at': self.created_at}
+        if self.finished_at:
+            data['finished_at'] = self.finished_at
+        if self.result is not None:
+            data['result'] = self.result
+            data['http_status'] = self.http_status
+        return data
+
+    def _set(self, status, result=None, http_status=None):
+        with self.changed:
+            self.status = status
+            if result is not None:
+                self.result = result
+                self.http_status = http_status
+                self.finished_at = _now_iso()
+            self.changed.notify_all()
+
+    def wait_change(self, last_status, timeout):
+        """Bloquea hasta que el estado deje de ser `last_status` o venza `timeout`."""
+        with self.changed:
+            if self.status == last_status:
+                self.changed.wait(timeout)
+            return self.status
+
+    @property
+    def done(self):
+        return self.status in ('done', 'error')
+
+class SttJobQueue:
+    """Cola acotada de transcripciones atendida por un grupo fijo de hilos.
+
+    `submit` nunca bloquea: si la cola está llena lanza `queue.Full` y el
+    endpoint responde 503 con Retry-After (contrapresión). Los trabajos
+    terminados se conservan `ttl_seconds` para que el cliente los consulte.
+
+    La cola y los trabajos viven en la memoria del proceso: con varios
+    workers, el sondeo de un trabajo debe llegar al proceso que lo creó
+    (afinidad de sesión en el balanceador) o responde 404.
+    """
+
+    def __init__(self, handler, workers=2, max_depth=16, ttl_seconds=600):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self.ttl_seconds = ttl_seconds
+        self._queue = queue.Queue(maxsize=self.max_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self.stats_counters = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'stt-worker-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job._set('running')
+            try:
+                result, http_status = self.handler(job.upload, job.language_code)
+                ok = http_status < 400
+                job._set('done' if ok else 'error', result, http_status)
+                self.stats_counters['completed' if ok else 'failed'] += 1
+            except Exception as e:
+                job._set('error', {'error': 'Error al procesar audio', 'detail': str(e)}, 500)
+                self.stats_counters['failed'] += 1
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            expired = [jid for jid, job in self._jobs.items() if job.done and job.created < cutoff]
+            for jid in expired:
+                del self._jobs[jid]
+
+    def submit(self, upload, language_code):
+        self._ensure_workers()
+        self._prune()
+        job = SttJob(uuid.uuid4().hex, upload, language_code)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.stats_counters['rejected'] += 1
+            raise
+        with self._lock:
+            self._jobs[job.id] = job
+        self.stats_counters['submitted'] += 1
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            running = self._running
+            tracked = len(self._jobs)
+        return {
+            **self.stats_counters,
+            'queued': self._queue.qsize(),
+            'running': running,
+            'tracked': tracked,
+            'workers': self.workers,
+            'max_depth': self.max_depth,
+        }
+
+# Límites de audio (se validan antes de decodificar)
+STT_MAX_UPLOAD_BYTES = _env_int('STT_MAX_UPLOAD_MB', 25) * 1024 * 1024
+STT_MAX_SECONDS = _env_int('STT_MAX_SECONDS', 300)
+# Hasta este tamaño la subida queda en memoria; más allá pasa a un temporal del sistema
+STT_SPOOL_BYTES = _env_int('STT_SPOOL_MEMORY_MB', 4) * 1024 * 1024
+STT_SAMPLE_RATE = 16000
+_COPY_CHUNK = 64 * 1024
+
+class AudioLimitError(Exception):
+    """El audio supera el tamaño o la duración permitidos (HTTP 413)."""
+
+class AudioSpool(tempfile.SpooledTemporaryFile):
+    """Búfer de audio (memoria hasta STT_SPOOL_BYTES, luego temporal) con tope de tamaño."""
+
+    def __init__(self, limit=None):
+        super().__init__(max_size=STT_SPOOL_BYTES)
+        self.limit = STT_MAX_UPLOAD_BYTES if limit is None else limit
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        if self.written > self.limit:
+            raise AudioLimitError(f'El audio supera el máximo de {self.limit // (1024 * 1024)} MB')
+        return super().write(data)
+
+class AudioRequest(Request):
+    """Petición cuyo parser multipart escribe el audio directo en un AudioSpool.
+
+    Solo si `_read_uploaded_audio` fijó `audio_limit` antes de leer
+    `request.files`; el resto de subidas (CSV, etc.) usan el flujo normal.
+    Así la parte del archivo se copia una sola vez y el tope se aplica
+    mientras llega.
+    """
+
+    audio_limit = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.audio_limit is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return AudioSpool(self.audio_limit)
+
+app.request_class = AudioRequest
+
+class AudioUpload:
+    """Audio recibido en un búfer en memoria o temporal del sistema.
+
+    Nunca se escribe en static/audio: la carpeta pública solo sirve TTS.
+    """
+
+    def __init__(self, filename, buffer=None, limit=None):
+        self.filename = os.path.basename(filename or '') or 'audio.wav'
+        self.buffer = buffer if buffer is not None else AudioSpool(limit)
+        self.size = getattr(self.buffer, 'written', 0)
+
+    @classmethod
+    def from_stream(cls, stream, filename, limit=None):
+        upload = cls(filename, limit=limit)
+        try:
+            while True:
+                chunk = stream.read(_COPY_CHUNK)
+                if not chunk:
+                    break
+                upload.buffer.write(chunk)
+            upload.size = upload.buffer.written
+        except Exception:
+            upload.close()
+            raise
+        return upload
+
+    @classmethod
+    def from_file_storage(cls, storage, limit=None):
+        """Adopta el búfer que llenó el parser multipart (sin copiarlo)."""
+        if not isinstance(storage.stream, AudioSpool):
+            return cls.from_stream(storage.stream, storage.filename, limit)
+        upload = cls(storage.filename, buffer=storage.stream)
+        # La petición cierra sus archivos al terminar; el búfer ahora es nuestro
+        storage.stream = io.BytesIO()
+        return upload
+
+    def open(self):
+        self.buffer.seek(0)
+        return self.buffer
+
+    def close(self):
+        try:
+            self.buffer.close()
+        except Exception:
+            pass
+
+def _read_uploaded_audio(limit=None):
+    """Copia el audio de la petición a un AudioUpload.
+
+    Devuelve (upload, None) o (None, respuesta de error). El tamaño se valida
+    con Content-Length antes de leer y, si falta, mientras se copia.
+    """
+    limit = STT_MAX_UPLOAD_BYTES if limit is None else limit
+    if request.content_length and request.content_length > limit + _COPY_CHUNK:
+        return None, (jsonify({'error': 'El audio supera el tamaño máximo permitido',
+                               'max_bytes': limit}), 413)
+    try:
+        if request.mimetype == 'multipart/form-data':
+            request.audio_limit = limit
+            audio_file = request.files.get('file')
+            if audio_file is None and request.files:
+                audio_file = request.files[next(iter(request.files))]
+            if not audio_file:
+                return None, (jsonify({'error': 'No se recibió audio'}), 400)
+            upload = AudioUpload.from_file_storage(audio_file, limit)
+        else:
+            upload = AudioUpload.from_stream(request.stream, 'audio.wav', limit)
+    except AudioLimitError as e:
+        return None, (jsonify({'error': str(e), 'max_bytes': limit}), 413)
+    except Exception as e:
+        return None, (jsonify({'error': 'Error al leer audio', 'detail': str(e)}), 400)
+    if upload.size == 0:
+        upload.close()
+        return None, (jsonify({'error': 'No se recibió audio'}), 400)
+    return upload, None
+
+def _decode_with_ffmpeg(upload, max_seconds):
+    """Decodifica con un solo proceso ffmpeg a PCM 16 kHz mono, por tuberías.
+
+    La entrada se alimenta por partes desde el búfer y la salida se corta en
+    `max_seconds`: nunca se decodifica más audio del permitido.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise FileNotFoundError('ffmpeg no encontrado')
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+           '-t', str(max_seconds + 1), '-ac', '1', '-ar', str(STT_SAMPLE_RATE),
+           '-f', 's16le', 'pipe:1']
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    source = upload.open()
+
+    def _feed():
+        try:
+            while True:
+                chunk = source.read(_COPY_CHUNK)
+                if not chunk:
+                    break
+                proc.stdin.write(chunk)
+        except Exception:
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except Exception:
+                pass
+
+    feeder = threading.Thread(target=_feed, daemon=True)
+    feeder.start()
+    max_bytes = max_seconds * STT_SAMPLE_RATE * 2
+    pcm = proc.stdout.read(max_bytes + 1)
+    too_long = len(pcm) > max_bytes
+    if too_long:
+        proc.kill()
+    stderr = proc.stderr.read()
+    proc.wait()
+    feeder.join(timeout=1)
+    if too_long:
+        raise AudioLimitError(f'El audio supera el máximo de {max_seconds} s')
+    if proc.returncode != 0 and not pcm:
+        raise RuntimeError(stderr.decode('utf-8', 'replace').strip() or f'ffmpeg terminó con código {proc.returncode}')
+    return sr.AudioData(pcm, STT_SAMPLE_RATE, 2)
+
+def decode_audio(upload, max_seconds=None):
+    """Convierte la subida en AudioData PCM 16 kHz mono de 16 bits, una sola vez.
+
+    Todos los formatos, WAV incluido, pasan por el mismo ffmpeg, que
+    remuestrea y mezcla a mono. Sin ffmpeg, WAV/AIFF/FLAC se leen con
+    speech_recognition (la duración se valida con la cabecera, antes de leer
+    las muestras) y se convierten a la misma forma.
+    """
+    max_seconds = STT_MAX_SECONDS if max_seconds is None else max_seconds
+    if shutil.which('ffmpeg'):
+        return _decode_with_ffmpeg(upload, max_seconds)
+    try:
+        source = sr.AudioFile(upload.open())
+        source.__enter__()
+    except Exception:
+        raise FileNotFoundError('ffmpeg no encontrado')
+    try:
+        if source.DURATION and source.DURATION > max_seconds:
+            raise AudioLimitError(f'El audio supera el máximo de {max_seconds} s')
+        audio = sr.Recognizer().record(source)
+    finally:
+        source.__exit__(None, None, None)
+    pcm = audio.get_raw_data(convert_rate=STT_SAMPLE_RATE, convert_width=2)
+    return sr.AudioData(pcm, STT_SAMPLE_RATE, 2)
+
+class WhisperClient:
+    """Cliente compartido para la transcripción remota (API de OpenAI Whisper).
+
+    - Una sola `requests.Session` con pool de conexiones: se reutiliza la
+      conexión TLS entre peticiones.
+    - Concurrencia acotada con un semáforo; si no hay cupo en
+      `acquire_timeout` segundos se desiste en lugar de encolar hilos.
+    - Reintentos con backoff exponencial (y Retry-After) ante 429/5xx o
+      errores de conexión.
+    - Circuit breaker: tras `failure_threshold` fallos seguidos se omite la
+      ruta remota durante `cooldown` segundos; luego se deja pasar una prueba.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, url, max_concurrency=4, max_retries=2, backoff=0.5,
+                 failure_threshold=5, cooldown=30, timeout=(10, 120), acquire_timeout=30):
+        self.url = url
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, max_retries=0)
+        self._session = requests.Session()
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._in_flight = 0
+        self.counters = {'calls': 0, 'ok': 0, 'failed': 0, 'http_requests': 0, 'retries': 0,
+                         'short_circuited': 0, 'busy': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _allow(self):
+        """Decide si el circuito deja pasar la llamada (cerrado o media apertura)."""
+        with self._lock:
+            if self._consecutive_failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._open_until or self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def _record(self, ok):
+        """Resultado de una llamada: True éxito, False fallo del proveedor, None neutro.
+
+        Un rechazo 4xx (audio inválido, clave errónea) no dice nada de la
+        salud del proveedor: ni cuenta como fallo ni reinicia la racha.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+            if ok is None:
+                return
+            if ok:
+                self._consecutive_failures = 0
+            else:
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._open_until = time.monotonic() + self.cooldown
+
+    def _delay(self, attempt, resp=None):
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        try:
+            if retry_after:
+                return min(float(retry_after), 30.0)
+        except ValueError:
+            pass
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def transcribe(self, upload, language_code, api_key):
+        """Devuelve (texto, None) o (None, error). Nunca lanza excepciones."""
+        self._count('calls')
+        if not self._allow():
+            self._count('short_circuited')
+            return None, 'Transcription API circuit open: provider failing, remote path skipped'
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._probe_in_flight = False
+            self._count('busy')
+            return None, 'Transcription API busy: concurrency limit reached'
+        with self._lock:
+            self._in_flight += 1
+        try:
+            text, error, transient = self._transcribe_with_retries(upload, language_code, api_key)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+        # Solo los fallos del proveedor (5xx/429/red) abren el circuito
+        self._record(True if error is None else (False if transient else None))
+        self._count('ok' if error is None else 'failed')
+        return text, error
+
+    def _transcribe_with_retries(self, upload, language_code, api_key):
+        headers = {'Authorization': f'Bearer {api_key}'}
+        data = {'model': 'whisper-1'}
+        # pasar idioma solo si está definido; si no, permitir autodetección del proveedor
+        if language_code:
+            data['language'] = language_code.split('-')[0]
+        attempt = 0
+        while True:
+            resp = None
+            try:
+                self._count('http_requests')
+                files = {'file': (upload.filename, upload.open())}
+                resp = self._session.post(self.url, headers=headers, files=files, data=data, timeout=self.timeout)
+                if resp.ok:
+                    try:
+                        return resp.json().get('text', ''), None, False
+                    except Exception as parse_e:
+                        return None, f"API response parse error: {parse_e}; raw: {resp.text}", False
+                error = f"Transcription API error: {resp.status_code} {resp.text}"
+                transient = resp.status_code in self.RETRY_STATUSES
+            except requests.RequestException as api_e:
+                error = f"Transcription API exception: {api_e}"
+                transient = True
+            if not transient or attempt >= self.max_retries:
+                return None, error, transient
+            self._count('retries')
+            time.sleep(self._delay(attempt, resp))
+            attempt += 1
+
+    def stats(self):
+        connections = {'opened': 0, 'requests': 0}
+        try:
+            pools = self._adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections['opened'] += pool.num_connections
+                    connections['requests'] += pool.num_requests
+        except Exception:
+            pass
+        with self._lock:
+            now = time.monotonic()
+            if self._consecutive_failures < self.failure_threshold:
+                state = 'closed'
+            elif now < self._open_until:
+                state = 'open'
+            else:
+                state = 'half-open'
+            return {
+                **self.counters,
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency,
+                'circuit': state,
+                'consecutive_failures': self._consecutive_failures,
+                'connections': connections,
+            }
+
+WHISPER_CLIENT = WhisperClient(
+    os.getenv('WHISPER_API_URL') or 'https://api.openai.com/v1/audio/transcriptions',
+    max_concurrency=_env_int('WHISPER_MAX_CONCURRENCY', 4),
+    max_retries=_env_int('WHISPER_MAX_RETRIES', 2),
+    failure_threshold=_env_int('WHISPER_BREAKER_FAILURES', 5),
+    cooldown=_env_int('WHISPER_BREAKER_COOLDOWN_SECONDS', 30),
+)
+
+def transcribe_audio(upload, language_code):
+    """Transcribe `upload` y libera su búfer al terminar.
+
+    Devuelve (cuerpo, estado_http) para que lo usen tanto la ruta síncrona
+    como los hilos de la cola de trabajos.
+    """
+    try:
+        # Ruta remota primero (evita depender de ffmpeg). Si hay API key, enviamos el audio tal cual.
+        api_key = os.getenv('OPENAI_API_KEY')
+        provider = (os.getenv('TRANSCRIBE_PROVIDER') or 'openai').lower()
+        remote_err = None
+        if api_key and provider == 'openai':
+            text, remote_err = WHISPER_CLIENT.transcribe(upload, language_code, api_key)
+            if text is not None:
+                return {'text': text}, 200
+
+        try:
+            audio_data = decode_audio(upload)
+        except AudioLimitError as e:
+            return {'error': str(e), 'max_seconds': STT_MAX_SECONDS}, 413
+        except Exception as conv_err:
+            suggestion = None
+            if isinstance(conv_err, FileNotFoundError) or 'ffmpeg' in str(conv_err).lower():
+                suggestion = 'Configure la variable OPENAI_API_KEY para usar transcripción remota sin ffmpeg, o instale ffmpeg desde https://ffmpeg.org y agréguelo al PATH'
+            return {
+                'error': 'Error al procesar audio',
+                'detail': str(conv_err),
+                'conversion_error': remote_err or str(conv_err),
+                'suggestion': suggestion
+            }, 400
+
+        # Reconocer texto (autodetección si no se definió language_code)
+        detected = None
+        try:
+            if language_code:
+                text = stt_recognizer().recognize(audio_data, language_code)
+            else:
+                # Ambos idiomas en paralelo; gana el más coherente con su idioma
+                text, detected = recognize_auto(audio_data)
+        except sr.UnknownValueError:
+            text = ""
+        except sr.RequestError as e:
+            return {'error': 'Error en reconocimiento de voz', 'detail': str(e)}, 500
+    finally:
+        upload.close()
+
+    if detected:
+        return {'text': text, 'lang': detected}, 200
+    return {'text': text}, 200
+
+# -------------------- Voz a texto: grabaciones largas por segmentos --------------------
+STT_LONG_MAX_SECONDS = _env_int('STT_LONG_MAX_SECONDS', 1800)
+STT_LONG_MAX_UPLOAD_BYTES = _env_int('STT_LONG_MAX_UPLOAD_MB', 200) * 1024 * 1024
+STT_CHUNK_SECONDS = _env_int('STT_CHUNK_SECONDS', 15)
+STT_CHUNK_OVERLAP_MS = _env_int('STT_CHUNK_OVERLAP_MS', 1000)
+_SILENCE_FRAME_MS = 30
+_SILENCE_MIN_MS = 300
+_stt_chunk_executor = None
+
+def _stt_chunk_pool():
+    """Hilos para segmentos; separado de _stt_pool porque cada segmento puede
+    lanzar a su vez reconocimientos paralelos allí (evita interbloqueos)."""
+    global _stt_chunk_executor
+    if _stt_chunk_executor is None:
+        with _stt_executor_lock:
+            if _stt_chunk_executor is None:
+                _stt_chunk_executor = ThreadPoolExecutor(
+                    max_workers=max(1, _env_int('STT_CHUNK_WORKERS', 3)),
+                    thread_name_prefix='stt-chunk',
+                )
+    return _stt_chunk_executor
+
+def _window_bounds(total, frame, target, overlap):
+    """Ventanas fijas de `target` bytes que se solapan `overlap` bytes."""
+    bounds = []
+    step = max(frame, target - overlap)
+    start = 0
+    while start < total:
+        end = min(total, start + target)
+        bounds.append((start, end, start > 0))
+        if end >= total:
+            break
+        start += step
+    return bounds
+
+def _silence_bounds(pcm, width, frame, target, overlap):
+    """Corta en el centro del primer silencio tras `target` bytes.
+
+    Si no aparece silencio antes de 2 * target se corta igualmente, con
+    solapamiento, como en las ventanas fijas.
+    """
+    energies = [audioop.rms(pcm[i:i + frame], width) for i in range(0, len(pcm), frame)]
+    if not energies:
+        return []
+    quiet = sorted(energies)[len(energies) // 10]
+    threshold = max(80, quiet * 2)
+    min_frames = max(1, target // frame)
+    max_frames = 2 * min_frames
+    silence_frames = max(1, _SILENCE_MIN_MS // _SILENCE_FRAME_MS)
+    overlap_frames = overlap // frame
+    bounds = []
+    start, run, overlapped = 0, 0, False
+    for i, energy in enumerate(energies):
+        run = run + 1 if energy < threshold else 0
+        if i - start >= min_frames and run >= silence_frames:
+            cut = i - run // 2
+            bounds.append((start * frame, cut * frame, overlapped))
+            start, run, overlapped = cut, 0, False
+        elif i - start >= max_frames:
+            bounds.append((start * frame, i * frame, overlapped))
+            start, run, overlapped = max(start + 1, i - overlap_frames), 0, True
+    bounds.append((start * frame, len(pcm), overlapped))
+    return bounds
+
+def split_audio(audio_data, mode='silence', chunk_seconds=None, overlap_ms=None):
+    """Divide AudioData en segmentos [(inicio_s, fin_s, AudioData, solapado)].
+
+    `mode='silence'` corta en pausas (requiere audioop); `mode='window'`
+    usa ventanas fijas con solapamiento.
+    """
+    chunk_seconds = STT_CHUNK_SECONDS if chunk_seconds is None else chunk_seconds
+    overlap_ms = STT_CHUNK_OVERLAP_MS if overlap_ms is None else overlap_ms
+    rate, width = audio_data.sample_rate, audio_data.sample_width
+    pcm = audio_data.frame_data
+    bytes_per_sec = rate * width
+    frame = max(width, (bytes_per_sec * _SILENCE_FRAME_MS // 1000) // width * width)
+    target = max(frame, int(chunk_seconds * bytes_per_sec) // frame * frame)
+    overlap = min(target // 2, int(overlap_ms * bytes_per_sec / 1000) // frame * frame)
+    if len(pcm) <= target * 3 // 2:
+        bounds = [(0, len(pcm), False)]
+    elif mode == 'silence' and audioop is not None:
+        bounds = _silence_bounds(pcm, width, frame, target, overlap)
     else:
-        if request.files:
-            first_key = next(iter(request.files))
-            audio_file = request.files[first_key]
-
-    if not audio_file:
-        raw = request.get_data()
-        if not raw or len(raw) == 0:
-            return jsonify({'error': 'No se recibió audio'}), 400
-            
-        filename = f"{uuid.uuid4()}.wav"
-        filepath = os.path.join(AUDIO_FOLDER, filename)
+        bounds = _window_bounds(len(pcm), frame, target, overlap)
+    return [(start / bytes_per_sec, end / bytes_per_sec, sr.AudioData(pcm[start:end], rate, width), overlapped)
+            for start, end, overlapped in bounds if end > start]
+
+_STITCH_WORD_RE = re.compile(r"[^\w']+", re.UNICODE)
+
+def _drop_overlap(previous_text, text, max_words=6):
+    """Quita del inicio de `text` las palabras repetidas del final de `previous_text`."""
+    prev = [_STITCH_WORD_RE.sub('', w.lower()) for w in previous_text.split()[-max_words:]]
+    words = text.split()
+    norm = [_STITCH_WORD_RE.sub('', w.lower()) for w in words[:max_words]]
+    for k in range(min(len(prev), len(norm)), 0, -1):
+        if prev[-k:] == norm[:k]:
+            return ' '.join(words[k:])
+    return text
+
+def _transcribe_segment(audio_chunk, language_code):
+    """Transcribe un segmento; devuelve (texto, idioma, error)."""
+    api_key = os.getenv('OPENAI_API_KEY')
+    if api_key and (os.getenv('TRANSCRIBE_PROVIDER') or 'openai').lower() == 'openai':
+        upload = AudioUpload.from_stream(io.BytesIO(audio_chunk.get_wav_data()), 'segment.wav')
         try:
-            with open(filepath, 'wb') as f:
-                f.write(raw)
+            text, _ = WHISPER_CLIENT.transcribe(upload, language_code, api_key)
+        finally:
+            upload.close()
+        if text is not None:
+            return text, language_code, None
+    try:
+        if language_code:
+            return stt_recognizer().recognize(audio_chunk, language_code), language_code, None
+        text, detected = recognize_auto(audio_chunk)
+        return text, detected, None
+    except sr.UnknownValueError:
+        return '', language_code, None
+    except Exception as e:
+        return '', language_code, str(e)
+
+def iter_long_transcription(upload, language_code, mode='silence'):
+    """Genera eventos (nombre, datos) mientras se transcribe una grabación larga.
+
+    Los segmentos se reconocen en paralelo pero se emiten en orden: cada
+    `segment` sale en cuanto él y todos los anteriores están listos. Sin
+    `language_code`, el primer segmento decide el idioma del resto.
+    """
+    futures = []
+    try:
+        try:
+            audio = decode_audio(upload, max_seconds=STT_LONG_MAX_SECONDS)
+        except AudioLimitError as e:
+            yield 'error', {'error': str(e), 'max_seconds': STT_LONG_MAX_SECONDS, 'http_status': 413}
+            return
         except Exception as e:
-            return jsonify({'error': 'Error al guardar audio', 'detail': str(e)}), 400
-    else:
-        filename = f"{uuid.uuid4()}_{audio_file.filename}"
-        filepath = os.path.join(AUDIO_FOLDER, filename)
-        audio_file.save(filepath)
+            yield 'error', {'error': 'Error al procesar audio', 'detail': str(e), 'http_status': 400}
+            return
+        finally:
+            upload.close()
+        segments = split_audio(audio, mode=mode)
+        duration = len(audio.frame_data) / float(audio.sample_rate * audio.sample_width)
+        yield 'start', {'segments': len(segments), 'duration': round(duration, 2), 'mode': mode}
+
+        pool = _stt_chunk_pool()
+        lang = language_code
+        futures.append(pool.submit(_transcribe_segment, segments[0][2], lang))
+        if lang is not None:
+            futures.extend(pool.submit(_transcribe_segment, seg[2], lang) for seg in segments[1:])
+        stitched = ''
+        for index, (start, end, chunk, overlapped) in enumerate(segments):
+            text, detected, error = futures[index].result()
+            if index == 0 and language_code is None:
+                # Si tampoco el primer segmento es claro, cada uno se autodetecta
+                lang = detected
+                futures.extend(pool.submit(_transcribe_segment, seg[2], lang) for seg in segments[1:])
+            if overlapped and stitched:
+                text = _drop_overlap(stitched, text)
+            if text:
+                stitched = f"{stitched} {text}".strip()
+            event = {'index': index, 'start': round(start, 2), 'end': round(end, 2), 'text': text}
+            if error:
+                event['error'] = error
+            yield 'segment', event
+        yield 'done', {'text': stitched, 'lang': lang, 'segments': len(segments)}
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+def _long_transcription_response(upload, language_code, mode, fmt):
+    """Envía los eventos como SSE (por defecto) o como JSON por líneas (ndjson)."""
+    def stream():
+        for name, data in iter_long_transcription(upload, language_code, mode):
+            if fmt == 'ndjson':
+                yield json.dumps({'event': name, **data}, ensure_ascii=False) + '\n'
+            else:
+                yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/event-stream'
+    return Response(stream(), mimetype=mimetype, headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+STT_JOBS = SttJobQueue(
+    transcribe_audio,
+    workers=_env_int('STT_WORKERS', 2),
+    max_depth=_env_int('STT_QUEUE_MAX', 16),
+    ttl_seconds=_env_int('STT_JOB_TTL_SECONDS', 600),
+)
+
+def _wants_async():
+    value = request.args.get('async') or request.form.get('async') or ''
+    return value.lower() in ('1', 'true', 'yes')
+
+@app.route('/speech-to-text', methods=['POST'])
+def speech_to_text():
+    """Transcribe el audio recibido.
+
+    Con `?async=1` encola el trabajo y responde 202 con su id; el resultado se
+    consulta en /speech-to-text/jobs/<id> (o por SSE en .../events).
+    Con `?stream=sse|ndjson` (grabaciones largas) divide el audio en
+    segmentos y envía cada transcripción parcial apenas está lista.
+    """
+    stream_fmt = (request.args.get('stream') or '').lower()
+    if stream_fmt in ('1', 'true'):
+        stream_fmt = 'sse'
+    upload, error = _read_uploaded_audio(STT_LONG_MAX_UPLOAD_BYTES if stream_fmt else None)
+    if error:
+        return error
+
+    # Determinar idioma
+    language_code = _stt_language_code(request.form.get('lang', ''))
+
+    if stream_fmt:
+        split_mode = 'window' if (request.args.get('split') or '').lower() == 'window' else 'silence'
+        return _long_transcription_response(upload, language_code, split_mode, stream_fmt)
+
+    if _wants_async():
+        try:
+            job = STT_JOBS.submit(upload, language_code)
+        except queue.Full:
+            upload.close()
+            resp = jsonify({'error': 'Cola de transcripción llena, reintente en unos segundos',
+                            'queue': STT_JOBS.stats()})
+            resp.status_code = 503
+            resp.headers['Retry-After'] = '5'
+            return resp
+        resp = jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/speech-to-text/jobs/{job.id}',
+            'events_url': f'/speech-to-text/jobs/{job.id}/events',
+        })
+        resp.status_code = 202
+        resp.headers['Location'] = f'/speech-to-text/jobs/{job.id}'
+        return resp
+
+    body, status = transcribe_audio(upload, language_code)
+    return jsonify(body), status
+
+@app.route('/speech-to-text/jobs/<job_id>', methods=['GET'])
+def speech_to_text_job(job_id):
+    job = STT_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado o expirado'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/speech-to-text/jobs/<job_id>/events', methods=['GET'])
+def speech_to_text_job_events(job_id):
+    """Server-Sent Events: un evento `status` por cambio y `result` al terminar."""
+    job = STT_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado o expirado'}), 404
+    max_wait = max(1, _int_arg('timeout', 300))
+
+    def stream():
+        deadline = time.monotonic() + max_wait
+        last = None
+        while True:
+            status = job.status
+            if status != last:
+                last = status
+                yield f"event: status\ndata: {json.dumps({'job_id': job.id, 'status': status})}\n\n"
+            if job.done:
+                yield f"event: result\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            if job.wait_change(last, min(15.0, remaining)) == last:
+                # Comentario de mantenimiento para que los proxies no corten la conexión
+                yield ": keep-alive\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/stt/queue', methods=['GET'])
+def api_stt_queue():
+    """Contadores de la cola de transcripción asíncrona."""
+    return jsonify({'queue': STT_JOBS.stats()})
+
+@app.route('/api/stt/remote', methods=['GET'])
+def api_stt_remote():
+    """Métricas del cliente Whisper: reintentos, circuito y reutilización de conexiones."""
+    return jsonify({'remote': WHISPER_CLIENT.stats()})
+
+# -------------------- Traducción: piezas compartidas --------------------
+# Mapear códigos de idioma para deep-translator
+_REMOTE_LANG_MAP = {
+    'es': 'es',
+    'qu': 'qu',  # deep-translator soporta quechua
+    'qu-EC': 'qu',
+    'es-EC': 'es',
+    'es-ES': 'es'
+}
+
+# Límite de caracteres por llamada remota (Google corta en 5000)
+_REMOTE_CHUNK_CHARS = 4500
+BATCH_MAX_ITEMS = int(os.getenv('TRANSLATE_BATCH_MAX_ITEMS', '500') or 500)
+
+def _resolve_direction(text, src, dest, detection=None):
+    """Aplica la autodetección cuando src es 'auto'.
+
+    Devuelve (src, dest, detection) donde detection es None o la tupla
+    (lang, score_qu, score_es) de `detect_lang_with_score`; se puede pasar
+    ya calculada (p.ej. por `detect_lang_many`).
+    """
+    if src != 'auto':
+        detection = None
+    elif detection is None:
+        detection = detect_lang_with_score(text)
+    if src == 'auto':
+        detected = detection[0]
+        src = detected
+        if dest == 'es' and detected == 'es':
+            dest = 'qu'
+        elif dest.startswith('qu') and detected.startswith('qu'):
+            dest = 'es'
+    return src, dest, detection
+
+def _translate_local(snap, text, src, dest):
+    """Intenta traducir con el diccionario local; devuelve dict de respuesta o None."""
+    dic = snap.data
+    if not dic:
+        return None
+
+    # Normalizar entrada para mejorar coincidencias
+    txt = text.strip()
+
+    # Español -> Kichwa (dic keys en español)
+    if dest.startswith('qu') and (src.startswith('es') or src == 'auto'):
+        # Reemplazo por frases largas y normalizadas
+        out = best_kichwa_match(dic, txt, matcher=kichwa_phrase_matcher(snap))
+        if normalize_kichwa_token(out) != normalize_kichwa_token(txt):
+            return {'translation': out}
+
+    # Kichwa -> Español: índice inverso cacheado con tokenización/normalización
+    if dest.startswith('es') and (src.startswith('qu') or src == 'auto'):
+        index = kichwa_inverse_index(snap)
+        # Frase completa registrada tal cual (p.ej. "allin killa")
+        whole = index.lookup_exact(normalize_kichwa_token(txt))
+        if whole:
+            resp = {'translation': whole[0]}
+            if len(whole) > 1:
+                resp['alternatives'] = {normalize_kichwa_token(txt): list(whole)}
+            return resp
+        # sustitución palabra a palabra: forma completa o, si no está, sus bases
+        replaced = []
+        alternatives = {}
+        for raw in _NON_ALNUM_RE.sub(' ', txt).split():
+            forms = _expand_kichwa_token(raw)
+            if not forms:
+                continue
+            tok, glosses = index.lookup_word(forms)
+            replaced.append(glosses[0] if glosses else forms[0])
+            if len(glosses) > 1:
+                alternatives[tok] = list(glosses)
+        out = ' '.join(replaced)
+        if normalize_kichwa_token(out) != normalize_kichwa_token(txt):
+            resp = {'translation': out}
+            if alternatives:
+                resp['alternatives'] = alternatives
+            return resp
+
+    return None
+
+def _remote_langs(src, dest, detection):
+    src_lang = _REMOTE_LANG_MAP.get(src, 'auto')
+    dest_lang = _REMOTE_LANG_MAP.get(dest, 'es')
+    if src_lang == 'auto':
+        # Para autodetección, usar el idioma detectado
+        src_lang = detection[0] if detection else 'es'
+    return src_lang, dest_lang
+
+def _remote_translate(text, src_lang, dest_lang):
+    # Una instancia por llamada: translate() guarda el texto en el propio
+    # objeto antes de la petición, así que compartirla entre hilos mezclaría
+    # textos. Construirla cuesta microsegundos frente a la ida y vuelta remota.
+    return GoogleTranslator(source=src_lang, target=dest_lang).translate(text)
+
+# -------------------- Caché de traducciones remotas --------------------
+def _cache_text_key(text):
+    # Normalización ligera: espacios colapsados y minúsculas
+    return ' '.join((text or '').split()).lower()
+
+class TranslationCache:
+    """Caché LRU con TTL para resultados del traductor remoto.
+
+    La clave es (texto normalizado, src, dest). Opcionalmente persiste en un
+    archivo SQLite para sobrevivir reinicios; la memoria actúa como primer
+    nivel y las escrituras a disco se agrupan en un hilo (cada
+    `write_interval` segundos o al juntar `write_batch`), fuera del lock de
+    las búsquedas. Las ediciones del diccionario invalidan las entradas
+    cuyo texto contiene alguna de las claves o formas kichwa modificadas
+    (comparando sin tildes ni mayúsculas). Una recarga completa solo vacía
+    la memoria: la caché se consulta después de intentar el diccionario
+    local de la versión vigente, así que lo guardado en disco nunca tapa
+    una entrada local nueva.
+    """
+
+    def __init__(self, max_entries=2000, ttl_seconds=86400, db_path=None, write_interval=0.5, write_batch=64):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.write_interval = max(0.01, float(write_interval))
+        self.write_batch = max(1, int(write_batch))
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._pending_writes = {}  # clave -> (traducción, created_at)
+        self._writer = None
+        self._wake = threading.Event()
+        self.stats_counters = {'hits': 0, 'disk_hits': 0, 'misses': 0,
+                               'evictions': 0, 'invalidations': 0, 'reloads': 0, 'disk_writes': 0}
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.create_function('kq_norm', 1, self._norm_text, deterministic=True)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS translations ('
+                    ' src TEXT NOT NULL, dest TEXT NOT NULL, text TEXT NOT NULL,'
+                    ' translation TEXT NOT NULL, created_at REAL NOT NULL,'
+                    ' PRIMARY KEY (src, dest, text))'
+                )
+                columns = {row[1] for row in self._db.execute('PRAGMA table_info(translations)')}
+                if 'norm' not in columns:
+                    # Bases anteriores: agregar la forma sin tildes usada al invalidar
+                    self._db.execute('ALTER TABLE translations ADD COLUMN norm TEXT')
+                    self._db.execute('UPDATE translations SET norm = kq_norm(text)')
+                self._db.commit()
+            except Exception:
+                self._db = None
+
+    @staticmethod
+    def _norm_text(text):
+        # Misma forma que los términos de invalidación: sin tildes ni mayúsculas
+        return remove_diacritics(text or '').lower()
+
+    def get(self, text, src, dest):
+        key = (_cache_text_key(text), src, dest)
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > now:
+                    self._items.move_to_end(key)
+                    self.stats_counters['hits'] += 1
+                    return value
+                del self._items[key]
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                try:
+                    row = self._db.execute(
+                        'SELECT translation, created_at FROM translations WHERE src=? AND dest=? AND text=?',
+                        (src, dest, key[0])).fetchone()
+                except Exception:
+                    row = None
+        with self._lock:
+            if row and row[1] + self.ttl_seconds > now:
+                self._remember(key, row[0], row[1] + self.ttl_seconds)
+                self.stats_counters['disk_hits'] += 1
+                return row[0]
+            self.stats_counters['misses'] += 1
+        return None
 
-    # Determinar idioma
-    lang_param = request.form.get('lang', '')
-    if lang_param in ('qu', 'qu-EC'):
-        language_code = 'qu-EC'
-    elif lang_param in ('es', 'es-ES', 'es-EC'):
-        language_code = 'es-EC'
-    elif lang_param:
-        language_code = lang_param
-    else:
-        language_code = None  # autodetección: probar qu-EC y es-EC
+    def put(self, text, src, dest, value):
+        if value is None:
+            return
+        key = (_cache_text_key(text), src, dest)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now + self.ttl_seconds)
+            if self._db is None:
+                return
+            self._pending_writes[key] = (value, now)
+            full = len(self._pending_writes) >= self.write_batch
+            self._ensure_writer()
+        if full:
+            self._wake.set()
 
-    # Procesar audio
-    recognizer = sr.Recognizer()
-    temp_converted = None
-    try:
-        # Ruta remota primero (evita depender de ffmpeg). Si hay API key, enviamos el archivo tal cual.
-        try:
-            api_key = os.getenv('OPENAI_API_KEY')
-            provider = (os.getenv('TRANSCRIBE_PROVIDER') or 'openai').lower()
-        except Exception:
-            api_key = None
-            provider = 'openai'
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._writer_loop, name='translation-cache-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
 
-        if api_key and provider == 'openai':
+    def _writer_loop(self):
+        while True:
+            self._wake.wait(self.write_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Escribe en SQLite las entradas pendientes en una sola transacción."""
+        if self._db is None:
+            return 0
+        # Tomar el lote con el lock de disco tomado: una invalidación
+        # concurrente borra después de esta escritura, nunca antes.
+        with self._db_lock:
+            with self._lock:
+                batch, self._pending_writes = self._pending_writes, {}
+            if not batch:
+                return 0
+            rows = [(src, dest, text, value, created_at, self._norm_text(text))
+                    for (text, src, dest), (value, created_at) in batch.items()]
             try:
-                headers = {'Authorization': f'Bearer {api_key}'}
-                with open(filepath, 'rb') as f_audio:
-                    files = {'file': (os.path.basename(filepath), f_audio)}
-                    data = {'model': 'whisper-1'}
-                    if language_code:
-                        try:
-                            data['language'] = language_code.split('-')[0]
-                        except Exception:
-                            pass
-                    resp_api = requests.post('https://api.openai.com/v1/audio/transcriptions', headers=headers, files=files, data=data, timeout=120)
-
-                if resp_api.ok:
-                    try:
-                        resp_json = resp_api.json()
-                        text = resp_json.get('text', '')
-                        return jsonify({'text': text})
-                    except Exception as parse_e:
-                        # continuar con flujo local si falla el parseo
-                        pass
-                else:
-                    # Si la API remota falla, continuar con flujo local
-                    pass
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO translations (src, dest, text, translation, created_at, norm)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)', rows)
+                self._db.commit()
             except Exception:
-                # Continuar con flujo local
-                pass
+                return 0
+        with self._lock:
+            self.stats_counters['disk_writes'] += len(rows)
+        return len(rows)
 
-        # Intento directo
-        try:
-            with sr.AudioFile(filepath) as source:
-                audio_data = recognizer.record(source)
-        except Exception as read_err:
-            # Intentar conversión con pydub
-            try:
-                from pydub import AudioSegment
-                temp_converted = f"{filepath}.converted.wav"
-                audio_seg = AudioSegment.from_file(filepath)
-                audio_seg = audio_seg.set_frame_rate(16000).set_channels(1)
-                audio_seg.export(temp_converted, format='wav')
-                
-                with sr.AudioFile(temp_converted) as source:
-                    audio_data = recognizer.record(source)
-            except Exception as conv_err:
-                suggestion = None
+    def _remember(self, key, value, expires_at):
+        self._items[key] = (value, expires_at)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+            self.stats_counters['evictions'] += 1
+
+    def invalidate(self, changes):
+        """Elimina entradas afectadas por `changes` (None = recarga: vaciar la memoria)."""
+        if changes is None:
+            with self._lock:
+                self.stats_counters['invalidations'] += len(self._items)
+                self.stats_counters['reloads'] += 1
+                self._items.clear()
+            return
+        terms = set()
+        for es, before, after in changes:
+            if isinstance(es, str):
+                terms.add(self._norm_text(_cache_text_key(es)))
+            for qu in (before, after):
+                if isinstance(qu, str):
+                    terms.update(tokenize_kichwa(qu))
+        terms.discard('')
+        if not terms:
+            return
+        matches = lambda text: any(t in self._norm_text(text) for t in terms)
+        with self._lock:
+            stale = [k for k in self._items if matches(k[0])]
+            for k in stale:
+                del self._items[k]
+            for k in [k for k in self._pending_writes if matches(k[0])]:
+                del self._pending_writes[k]
+            self.stats_counters['invalidations'] += len(stale)
+        if self._db is not None:
+            with self._db_lock:
                 try:
-                    if isinstance(conv_err, FileNotFoundError) or 'ffmpeg' in str(conv_err).lower():
-                        suggestion = 'Configure la variable OPENAI_API_KEY para usar transcripción remota sin ffmpeg, o instale ffmpeg desde https://ffmpeg.org y agréguelo al PATH'
+                    for t in terms:
+                        escaped = t.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                        self._db.execute("DELETE FROM translations WHERE norm LIKE ? ESCAPE '\\'",
+                                         (f'%{escaped}%',))
+                    self._db.commit()
                 except Exception:
                     pass
-                # Intentar fallback usando una API de transcripción remota (p.ej. OpenAI Whisper)
-                try:
-                    api_key = os.getenv('OPENAI_API_KEY')
-                    provider = os.getenv('TRANSCRIBE_PROVIDER', 'openai').lower()
-                except Exception:
-                    api_key = None
-                    provider = 'openai'
 
-                if api_key and provider == 'openai':
-                    try:
-                        # Llamada a la API de OpenAI para transcribir el archivo tal cual (acepta mp3, wav, etc.)
-                        headers = {'Authorization': f'Bearer {api_key}'}
-                        with open(filepath, 'rb') as f_audio:
-                            files = {'file': (os.path.basename(filepath), f_audio)}
-                            data = {'model': 'whisper-1'}
-                            # pasar idioma solo si está definido; si no, permitir autodetección del proveedor
-                            if language_code:
-                                try:
-                                    data['language'] = language_code.split('-')[0]
-                                except Exception:
-                                    pass
-                            resp_api = requests.post('https://api.openai.com/v1/audio/transcriptions', headers=headers, files=files, data=data, timeout=120)
-
-                        if resp_api.ok:
-                            try:
-                                resp_json = resp_api.json()
-                                text = resp_json.get('text', '')
-                                return jsonify({'text': text})
-                            except Exception as parse_e:
-                                # si la respuesta no tiene texto, continuar para devolver el error original
-                                conv_err = f"API response parse error: {parse_e}; raw: {resp_api.text}"
-                        else:
-                            conv_err = f"Transcription API error: {resp_api.status_code} {resp_api.text}"
-                    except Exception as api_e:
-                        conv_err = f"Transcription API exception: {api_e}"
-
-                return jsonify({
-                    'error': 'Error al procesar audio',
-                    'detail': str(read_err),
-                    'conversion_error': str(conv_err),
-                    'suggestion': suggestion
-                }), 400
+    def stats(self):
+        with self._lock:
+            out = dict(self.stats_counters)
+            out['entries'] = len(self._items)
+            out['pending_writes'] = len(self._pending_writes)
+        lookups = out['hits'] + out['disk_hits'] + out['misses']
+        out['hit_ratio'] = round((out['hits'] + out['disk_hits']) / lookups, 4) if lookups else 0.0
+        out['max_entries'] = self.max_entries
+        out['ttl_seconds'] = self.ttl_seconds
+        out['persistent'] = self._db is not None
+        return out
 
-        # Reconocer texto (autodetección si no se definió language_code)
-        try:
-            if language_code:
-                text = recognizer.recognize_google(audio_data, language=language_code)
-            else:
-                text_qu = ''
-                text_es = ''
-                try:
-                    text_qu = recognizer.recognize_google(audio_data, language='qu-EC')
-                except Exception:
-                    text_qu = ''
-                try:
-                    text_es = recognizer.recognize_google(audio_data, language='es-EC')
-                except Exception:
-                    text_es = ''
-                text = text_qu if len(text_qu) >= len(text_es) else text_es
-        except sr.UnknownValueError:
-            text = ""
-        except sr.RequestError as e:
-            return jsonify({'error': 'Error en reconocimiento de voz', 'detail': str(e)}), 500
+TRANSLATION_CACHE = TranslationCache(
+    max_entries=_env_int('TRANSLATION_CACHE_SIZE', 2000),
+    ttl_seconds=_env_int('TRANSLATION_CACHE_TTL_SECONDS', 86400),
+    db_path=os.getenv('TRANSLATION_CACHE_DB') or None,
+)
+DICT_STORE.add_listener(TRANSLATION_CACHE.invalidate)
 
-    finally:
-        # Limpiar archivos temporales
-        try:
-            if temp_converted and os.path.exists(temp_converted):
-                os.remove(temp_converted)
-        except Exception:
-            pass
-        # Eliminar el archivo original subido/guardado para no acumular
-        try:
-            if filepath and os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception:
-            pass
+def _cached_remote_translate(text, src_lang, dest_lang):
+    cached = TRANSLATION_CACHE.get(text, src_lang, dest_lang)
+    if cached is not None:
+        return cached
+    translation = _remote_translate(text, src_lang, dest_lang)
+    TRANSLATION_CACHE.put(text, src_lang, dest_lang, translation)
+    return translation
+
+def _remote_translate_many(texts, src_lang, dest_lang):
+    """Traduce varias líneas con el menor número de llamadas remotas.
+
+    Las líneas se unen con saltos de línea en bloques de hasta
+    _REMOTE_CHUNK_CHARS caracteres. Si un bloque no vuelve con el mismo número
+    de líneas, ese bloque se traduce elemento a elemento. Devuelve una lista de
+    (traducción, error) en el mismo orden que `texts`.
+    """
+    results = [None] * len(texts)
+    chunks = []
+    current = []
+    size = 0
+    for i, t in enumerate(texts):
+        if '\n' in t or len(t) > _REMOTE_CHUNK_CHARS:
+            chunks.append([i])
+            continue
+        if current and size + len(t) + 1 > _REMOTE_CHUNK_CHARS:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += len(t) + 1
+    if current:
+        chunks.append(current)
 
-    return jsonify({'text': text})
+    for chunk in chunks:
+        if len(chunk) > 1:
+            try:
+                joined = '\n'.join(texts[i] for i in chunk)
+                lines = (_remote_translate(joined, src_lang, dest_lang) or '').split('\n')
+                if len(lines) == len(chunk):
+                    for i, line in zip(chunk, lines):
+                        results[i] = (line.strip(), None)
+                    continue
+            except Exception:
+                pass
+        for i in chunk:
+            try:
+                results[i] = (_remote_translate(texts[i], src_lang, dest_lang), None)
+            except Exception as e:
+                results[i] = (texts[i], str(e))
+    return results
 
 @app.route('/translate', methods=['POST'])
 def translate():
@@ -534,77 +4264,463 @@ def translate():
 
     try:
         # Detección de idioma cuando src es auto
-        if src == 'auto':
-            detected, score_qu, score_es = detect_lang_with_score(text)
-            src = detected
-            if dest == 'es' and detected == 'es':
-                dest = 'qu'
-            elif dest.startswith('qu') and detected.startswith('qu'):
-                dest = 'es'
-
-        # Cargar diccionario local
-        dic = load_dictionary()
-
-        # Normalizar entrada para mejorar coincidencias
-        txt = text.strip()
-
-        # Español -> Kichwa (dic keys en español)
-        if dest.startswith('qu') and (src.startswith('es') or src == 'auto'):
-            if dic:
-                # Reemplazo por frases largas y normalizadas
-                out = best_kichwa_match(dic, txt)
-                if normalize_kichwa_token(out) != normalize_kichwa_token(txt):
-                    return jsonify({'translation': out})
-
-        # Kichwa -> Español: invertimos el dic y utilizamos tokenización/normalización
-        if dest.startswith('es') and (src.startswith('qu') or src == 'auto'):
-            if dic:
-                inv = {normalize_kichwa_token(v): k for k, v in dic.items() if isinstance(v, str)}
-                tokens = tokenize_kichwa(txt)
-                # sustitución token a token si hay coincidencias exactas normalizadas
-                replaced = []
-                for tok in tokens:
-                    repl = inv.get(tok)
-                    replaced.append(repl if repl else tok)
-                out = ' '.join(replaced)
-                if normalize_kichwa_token(out) != normalize_kichwa_token(txt):
-                    return jsonify({'translation': out})
+        src, dest, detection = _resolve_direction(text, src, dest)
+
+        # Instantánea local del diccionario (solo lectura)
+        snap = DICT_STORE.snapshot()
+        local = _translate_local(snap, text, src, dest)
+        if local is not None:
+            return jsonify(local)
 
         # Fallback a Google Translate
         try:
-            # Mapear códigos de idioma para deep-translator
-            lang_map = {
-                'es': 'es',
-                'qu': 'qu',  # deep-translator soporta quechua
-                'qu-EC': 'qu',
-                'es-EC': 'es',
-                'es-ES': 'es'
-            }
-            
-            src_lang = lang_map.get(src, 'auto')
-            dest_lang = lang_map.get(dest, 'es')
-            
-            if src_lang == 'auto':
-                # Para autodetección, usar el idioma detectado
-                src_lang = detected if 'detected' in locals() else 'es'
-            
-            translation = translator.translate(text, source=src_lang, target=dest_lang)
+            src_lang, dest_lang = _remote_langs(src, dest, detection)
+            translation = _cached_remote_translate(text, src_lang, dest_lang)
             resp = {'translation': translation}
         except Exception as translate_error:
             # Si falla la traducción, devolver texto original
             resp = {'translation': text, 'translate_error': str(translate_error)}
-        try:
-            if 'detected' in locals():
-                resp['detected_lang'] = detected
-                resp['scores'] = {'qu': score_qu, 'es': score_es}
-        except Exception:
-            pass
+        if detection:
+            resp['detected_lang'] = detection[0]
+            resp['scores'] = {'qu': detection[1], 'es': detection[2]}
         return jsonify(resp)
     except Exception as e:
         return jsonify({'translation': '', 'error': str(e)})
 
+@app.route('/translate/batch', methods=['POST'])
+def translate_batch():
+    """Traduce muchos textos en una sola petición.
+
+    Cuerpo: {"items": [{"text", "src"?, "dest"?}, ...], "src"?, "dest"?}
+    (también se acepta "texts": ["...", ...]). Todos los elementos usan la
+    misma instantánea del diccionario; solo los que no resuelve el diccionario
+    van al traductor remoto, agrupados por par de idiomas. Cada resultado
+    indica su procedencia en `source`: 'dictionary', 'remote' o 'none'.
+    """
+    data = request.get_json(silent=True) or {}
+    default_src = data.get('src', 'auto')
+    default_dest = data.get('dest', 'es')
+    items = data.get('items')
+    if items is None:
+        items = [{'text': t} for t in (data.get('texts') or [])]
+    if not isinstance(items, list):
+        return jsonify({'error': 'items debe ser una lista'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Máximo {BATCH_MAX_ITEMS} elementos por lote'}), 413
+
+    snap = DICT_STORE.snapshot()
+    results = [None] * len(items)
+    items = [{'text': it} if isinstance(it, str) else (it if isinstance(it, dict) else {}) for it in items]
+    # Detección de idioma de todos los elementos 'auto' en una sola llamada
+    auto_idx = [i for i, it in enumerate(items)
+                if (it.get('src') or default_src) == 'auto' and isinstance(it.get('text'), str) and it.get('text')]
+    detections = dict(zip(auto_idx, detect_lang_many([items[i]['text'] for i in auto_idx])))
+    pending = {}  # (src_lang, dest_lang) -> [(índice, texto, detection)]
+    for i, item in enumerate(items):
+        text = item.get('text') or ''
+        if not isinstance(text, str) or not text:
+            results[i] = {'translation': '', 'source': 'none'}
+            continue
+        try:
+            src, dest, detection = _resolve_direction(text, item.get('src') or default_src, item.get('dest') or default_dest,
+                                                      detection=detections.get(i))
+            local = _translate_local(snap, text, src, dest)
+        except Exception as e:
+            results[i] = {'translation': '', 'source': 'none', 'error': str(e)}
+            continue
+        if local is not None:
+            local['source'] = 'dictionary'
+            results[i] = local
+            continue
+        pending.setdefault(_remote_langs(src, dest, detection), []).append((i, text, detection))
+
+    for (src_lang, dest_lang), group in pending.items():
+        misses = []
+        for entry in group:
+            cached = TRANSLATION_CACHE.get(entry[1], src_lang, dest_lang)
+            if cached is None:
+                misses.append(entry)
+            else:
+                results[entry[0]] = _remote_result(cached, None, entry[2])
+        translated = _remote_translate_many([t for _, t, _ in misses], src_lang, dest_lang)
+        for (i, text, detection), (translation, error) in zip(misses, translated):
+            if not error:
+                TRANSLATION_CACHE.put(text, src_lang, dest_lang, translation)
+            results[i] = _remote_result(translation, error, detection)
+
+    return jsonify({'results': results, 'version': snap.version})
+
+def _remote_result(translation, error, detection):
+    resp = {'translation': translation, 'source': 'remote'}
+    if error:
+        resp['translate_error'] = error
+    if detection:
+        resp['detected_lang'] = detection[0]
+        resp['scores'] = {'qu': detection[1], 'es': detection[2]}
+    return resp
+
+@app.route('/api/translate/cache', methods=['GET'])
+def api_translate_cache():
+    """Contadores de la caché de traducciones remotas."""
+    return jsonify({'cache': TRANSLATION_CACHE.stats()})
+
+# -------------------- Texto a voz: caché direccionada por contenido --------------------
+TTS_CACHE_FOLDER = os.path.join(AUDIO_FOLDER, 'tts')
+os.makedirs(TTS_CACHE_FOLDER, exist_ok=True)
+
+def _tts_lang_code(lang):
+    # Normalizar código de idioma y fallback para kichwa/quechua
+    lang_code = (lang or 'es').lower()
+    try:
+        # gTTS espera códigos simples como 'es', 'en' (no 'es-EC')
+        if '-' in lang_code:
+            lang_code = lang_code.split('-')[0]
+        # gTTS no soporta qu/qu-EC; usar voz española como aproximación
+        if lang_code in ('qu', 'que', 'quz', 'quy', 'quh'):
+            lang_code = 'es'
+    except Exception:
+        lang_code = 'es'
+    return lang_code
+
+def _gtts_synthesize(text, lang_code, filepath):
+    try:
+        tts = gTTS(text=text, lang=lang_code)
+    except Exception as e:
+        # Si falla por idioma no soportado, reintentar en español
+        try:
+            tts = gTTS(text=text, lang='es')
+        except Exception:
+            raise e
+    tts.save(filepath)
+
+class TtsAudioCache:
+    """Archivos de audio TTS nombrados por hash de (texto normalizado, idioma).
+
+    Una petición repetida devuelve el archivo existente sin sintetizar. El
+    tamaño total se limita a `max_bytes` expulsando el menos usado (LRU); el
+    orden se reconstruye al iniciar a partir del mtime, que se actualiza en
+    cada acierto. Peticiones simultáneas del mismo texto comparten una única
+    síntesis. Un archivo entregado hace menos de `min_age` segundos no se
+    expulsa (el cliente aún puede estar descargándolo): el total puede
+    superar el límite un momento hasta que esas entradas envejezcan.
+    """
+
+    def __init__(self, folder, max_bytes, min_age=30):
+        self.folder = folder
+        self.max_bytes = max(1, int(max_bytes))
+        self.min_age = max(0.0, float(min_age))
+        self._entries = OrderedDict()  # nombre -> bytes, del menos al más usado
+        self._touched = {}  # nombre -> time.monotonic() del último uso
+        self._total = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0}
+        self._scan()
+
+    def _scan(self):
+        found = []
+        try:
+            for name in os.listdir(self.folder):
+                path = os.path.join(self.folder, name)
+                if not name.endswith('.mp3') or not os.path.isfile(path):
+                    continue
+                st = os.stat(path)
+                found.append((st.st_mtime, name, st.st_size))
+        except Exception:
+            pass
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total += size
+        self._evict()
+
+    @staticmethod
+    def key_for(text, lang_code, voice='gtts'):
+        # La voz por defecto no entra en la clave para conservar la caché existente
+        prefix = lang_code if voice == 'gtts' else f"{voice}\x1f{lang_code}"
+        digest = hashlib.sha1(f"{prefix}\x1f{_cache_text_key(text)}".encode('utf-8')).hexdigest()
+        return f"{digest}.mp3"
+
+    def contains(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def adopt(self, name):
+        """True si `name` ya está en disco; lo incorpora si esta instancia no lo conocía.
+
+        Cubre archivos escritos por otro proceso (varios workers comparten la
+        carpeta) o que se dejaron de contar sin borrarse.
+        """
+        path = os.path.join(self.folder, name)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        with self._lock:
+            if name not in self._entries:
+                self._add(name, size)
+                self._evict()
+            else:
+                self._touch(name)
+        return True
+
+    def available(self, name):
+        return self.contains(name) or self.adopt(name)
+
+    def in_progress_elsewhere(self, name):
+        """Hay un temporal de síntesis de `name` (p. ej. de otro proceso)."""
+        pattern = os.path.join(glob.escape(self.folder), f"{glob.escape(name)}.*.tmp")
+        return bool(glob.glob(pattern))
+
+    def _touch(self, name):
+        self._entries.move_to_end(name)
+        self._touched[name] = time.monotonic()
+        try:
+            os.utime(os.path.join(self.folder, name))
+        except Exception:
+            pass
+
+    def _add(self, name, size):
+        # Un nombre se cuenta una sola vez aunque se vuelva a escribir
+        self._total += size - self._entries.get(name, 0)
+        self._entries[name] = size
+        self._touch(name)
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        cutoff = time.monotonic() - self.min_age
+        for name in list(self._entries):
+            if self._total <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if self._touched.get(name, 0.0) > cutoff or name in self._inflight:
+                continue
+            self._total -= self._entries.pop(name)
+            self._touched.pop(name, None)
+            self.stats_counters['evictions'] += 1
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except Exception:
+                pass
+
+    def get_or_create(self, text, lang_code, synthesize, voice='gtts'):
+        """Devuelve (nombre_archivo, cached) sintetizando solo si hace falta."""
+        name = self.key_for(text, lang_code, voice)
+        with self._lock:
+            if name in self._entries:
+                self._touch(name)
+                self.stats_counters['hits'] += 1
+                return name, True
+            gate = self._inflight.get(name)
+            if gate is None:
+                gate = self._inflight[name] = threading.Lock()
+            else:
+                self.stats_counters['coalesced'] += 1
+        with gate:
+            with self._lock:
+                if name in self._entries:
+                    self._touch(name)
+                    return name, True
+            path = os.path.join(self.folder, name)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                synthesize(text, lang_code, tmp_path)
+                os.replace(tmp_path, path)
+                size = os.path.getsize(path)
+                with self._lock:
+                    self._add(name, size)
+                    self.stats_counters['misses'] += 1
+                    self._evict()
+            finally:
+                with self._lock:
+                    self._inflight.pop(name, None)
+                try:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                except Exception:
+                    pass
+        return name, False
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.stats_counters)
+            out['files'] = len(self._entries)
+            out['bytes'] = self._total
+        out['max_bytes'] = self.max_bytes
+        return out
+
+class GttsBackend:
+    """Síntesis con Google Text-to-Speech (gTTS)."""
+
+    name = 'gtts'
+
+    def synthesize(self, text, lang_code, filepath):
+        _gtts_synthesize(text, lang_code, filepath)
+
+# Trama MPEG-1 Layer III vacía (128 kbps, 44.1 kHz): se decodifica como silencio
+_SILENT_MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+class LocalSilentBackend:
+    """Sintetizador local sin red, para pruebas y desarrollo.
+
+    Escribe un MP3 silencioso cuya duración crece con el número de palabras,
+    tras esperar `TTS_LOCAL_DELAY_MS` para simular la latencia remota.
+    """
+
+    name = 'local'
+
+    def synthesize(self, text, lang_code, filepath):
+        delay_ms = _env_int('TTS_LOCAL_DELAY_MS', 0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+        # ~0.4 s por palabra (cada trama dura ~26 ms)
+        frames = 15 * max(1, len(text.split()))
+        with open(filepath, 'wb') as f:
+            f.write(_SILENT_MP3_FRAME * frames)
+
+_TTS_BACKENDS = {
+    'gtts': GttsBackend,
+    'local': LocalSilentBackend,
+}
+_tts_backend = None
+
+def tts_backend():
+    """Backend de síntesis activo, elegido con TTS_BACKEND (gtts por defecto)."""
+    global _tts_backend
+    if _tts_backend is None:
+        name = (os.getenv('TTS_BACKEND') or 'gtts').lower()
+        _tts_backend = _TTS_BACKENDS.get(name, GttsBackend)()
+    return _tts_backend
+
+def set_tts_backend(backend):
+    """Reemplaza el backend (p. ej. por uno falso en pruebas); None restaura el de entorno."""
+    global _tts_backend
+    _tts_backend = backend
+
+# -------------------- Texto a voz: segmentos y lista de reproducción --------------------
+TTS_CHUNK_CHARS = _env_int('TTS_CHUNK_CHARS', 200)
+TTS_SEGMENT_WAIT_SECONDS = _env_int('TTS_SEGMENT_WAIT_SECONDS', 30)
+_TTS_SENTENCE_RE = re.compile(r'(?<=[.!?;:…])\s+|\n+')
+_TTS_PHRASE_RE = re.compile(r'(?<=,)\s+')
+_TTS_SEGMENT_NAME_RE = re.compile(r'^[0-9a-f]{40}\.mp3$')
+
+def _split_words(text, max_chars):
+    out, current = [], ''
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            out.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        out.append(current)
+    return out
+
+def split_tts_text(text, max_chars=None):
+    """Divide el texto en oraciones (o frases, si son largas) de hasta `max_chars`.
+
+    Las oraciones cortas consecutivas se agrupan; el corte es determinista,
+    así que un mismo texto reutiliza los segmentos ya sintetizados.
+    """
+    max_chars = max(20, max_chars or TTS_CHUNK_CHARS)
+    pieces = []
+    for sentence in _TTS_SENTENCE_RE.split(text or ''):
+        sentence = ' '.join(sentence.split())
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for phrase in _TTS_PHRASE_RE.split(sentence):
+            pieces.extend([phrase] if len(phrase) <= max_chars else _split_words(phrase, max_chars))
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+class TtsSegmentScheduler:
+    """Sintetiza segmentos en un grupo acotado de hilos, a través de TtsAudioCache.
+
+    `schedule` no bloquea: devuelve el nombre del archivo del segmento y si ya
+    está disponible. `wait` espera a que termine una síntesis en curso; si
+    este proceso no la conoce, mira el disco: el archivo pudo escribirlo otro
+    worker, que mientras sintetiza deja un temporal `<nombre>.*.tmp`.
+
+    El mapa de síntesis en curso es propio de cada proceso; lo único
+    compartido entre workers es la carpeta de la caché.
+    """
+
+    def __init__(self, cache, workers=4):
+        self.cache = cache
+        self.workers = max(1, workers)
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts-synth')
+        return self._executor
+
+    def schedule(self, text, lang_code, backend):
+        name = self.cache.key_for(text, lang_code, backend.name)
+        if self.cache.available(name):
+            return name, True
+        pool = self._pool()
+        fut = None
+        with self._lock:
+            if name not in self._pending:
+                fut = pool.submit(self.cache.get_or_create, text, lang_code, backend.synthesize, backend.name)
+                self._pending[name] = fut
+        if fut is not None:
+            # Fuera del lock: si ya terminó, el callback corre aquí mismo
+            fut.add_done_callback(lambda f, n=name: self._finished(n, f))
+        return name, False
+
+    def _finished(self, name, fut):
+        with self._lock:
+            if self._pending.get(name) is fut:
+                del self._pending[name]
+
+    def wait(self, name, timeout, poll=0.1):
+        """True si el segmento quedó disponible antes de `timeout` segundos."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            fut = self._pending.get(name)
+        if fut is not None:
+            try:
+                fut.result(timeout=timeout)
+            except Exception:
+                return False
+        while not self.cache.available(name):
+            if time.monotonic() >= deadline:
+                return False
+            if not self.cache.in_progress_elsewhere(name):
+                # El temporal pudo renombrarse entre ambas comprobaciones
+                return self.cache.available(name)
+            time.sleep(poll)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'workers': self.workers}
+
+TTS_CACHE = TtsAudioCache(TTS_CACHE_FOLDER, _env_int('TTS_CACHE_MAX_MB', 200) * 1024 * 1024,
+                          min_age=_env_int('TTS_CACHE_MIN_AGE_SECONDS', 30))
+TTS_SEGMENTS = TtsSegmentScheduler(TTS_CACHE, workers=_env_int('TTS_WORKERS', 4))
+
 @app.route('/text-to-speech', methods=['POST'])
 def text_to_speech():
+    """Sintetiza el texto completo o, con `mode: 'playlist'`, por oraciones.
+
+    La lista de reproducción se devuelve sin esperar la síntesis: cada
+    segmento se genera en paralelo y su URL espera a que esté listo, así el
+    cliente puede empezar a reproducir el primero de inmediato.
+    """
     data = request.get_json()
     text = data.get('text', '')
     lang = data.get('lang', 'es')
@@ -612,45 +4728,123 @@ def text_to_speech():
     if not text:
         return jsonify({'audio_url': ''})
 
-    filename = f"{uuid.uuid4()}.mp3"
-    filepath = os.path.join(AUDIO_FOLDER, filename)
-    
     try:
-        # Normalizar código de idioma y fallback para kichwa/quechua
-        lang_code = (lang or 'es').lower()
-        try:
-            # gTTS espera códigos simples como 'es', 'en' (no 'es-EC')
-            if '-' in lang_code:
-                lang_code = lang_code.split('-')[0]
-            # gTTS no soporta qu/qu-EC; usar voz española como aproximación
-            if lang_code in ('qu', 'que', 'quz', 'quy', 'quh'):
-                lang_code = 'es'
-        except Exception:
-            lang_code = 'es'
-
-        try:
-            tts = gTTS(text=text, lang=lang_code)
-        except Exception as e:
-            # Si falla por idioma no soportado, reintentar en español
-            try:
-                tts = gTTS(text=text, lang='es')
-            except Exception:
-                raise e
-        tts.save(filepath)
-        return jsonify({'audio_url': f'/static/audio/{filename}', 'used_lang': lang_code})
+        lang_code = _tts_lang_code(lang)
+        backend = tts_backend()
+        if (data.get('mode') or '').lower() == 'playlist':
+            playlist = []
+            for index, chunk in enumerate(split_tts_text(text, data.get('max_chars'))):
+                name, ready = TTS_SEGMENTS.schedule(chunk, lang_code, backend)
+                playlist.append({'index': index, 'text': chunk,
+                                 'audio_url': f'/text-to-speech/segments/{name}', 'ready': ready})
+            return jsonify({'playlist': playlist, 'used_lang': lang_code})
+        filename, cached = TTS_CACHE.get_or_create(text, lang_code, backend.synthesize, backend.name)
+        return jsonify({'audio_url': f'/static/audio/tts/{filename}', 'used_lang': lang_code, 'cached': cached})
     except Exception as e:
         return jsonify({'audio_url': '', 'error': str(e)})
 
+@app.route('/text-to-speech/segments/<name>', methods=['GET'])
+def text_to_speech_segment(name):
+    """Sirve un segmento de la lista de reproducción, esperando su síntesis si sigue en curso."""
+    if not _TTS_SEGMENT_NAME_RE.match(name):
+        return jsonify({'error': 'Segmento inválido'}), 400
+    if not TTS_SEGMENTS.wait(name, TTS_SEGMENT_WAIT_SECONDS):
+        return jsonify({'error': 'Segmento no disponible'}), 404
+    # Ruta absoluta: Flask resolvería la relativa contra la carpeta de la app, no la de trabajo
+    return send_from_directory(os.path.abspath(TTS_CACHE_FOLDER), name, mimetype='audio/mpeg', max_age=86400)
+
+@app.route('/api/tts/cache', methods=['GET'])
+def api_tts_cache():
+    """Contadores de la caché de audio TTS."""
+    return jsonify({'cache': TTS_CACHE.stats(), 'segments': TTS_SEGMENTS.stats()})
+
+@app.route('/api/audio/janitor', methods=['GET'])
+def api_audio_janitor():
+    """Métricas de la limpieza de static/audio (archivos, bytes, expulsiones)."""
+    return jsonify({'janitor': AUDIO_JANITOR.stats(), 'tts_cache': TTS_CACHE.stats()})
+
 # Endpoints del diccionario
 @app.route('/api/dictionary', methods=['GET'])
 def api_dictionary():
-    dict_path = os.path.join('data', 'dictionary_es_qu.json')
-    if os.path.exists(dict_path):
-        with open(dict_path, 'r', encoding='utf-8') as f:
-            dic = json.load(f)
+    """Diccionario completo o paginado, con soporte de peticiones condicionales.
+
+    Sin `limit` ni `cursor` devuelve el diccionario completo (compatibilidad).
+    Con `limit` (máx. 1000) devuelve una página ordenada por la clave en
+    español y `next_cursor` para pedir la siguiente (un cursor que la API no
+    emitió responde 400). Responde 304 si
+    If-None-Match / If-Modified-Since coinciden con la versión vigente.
+    """
+    snap = DICT_STORE.snapshot()
+    cursor = request.args.get('cursor')
+    paginated = cursor is not None or request.args.get('limit') is not None
+    after = _decode_cursor(cursor) if cursor else None
+    if cursor and after is None:
+        return jsonify({'error': 'Cursor inválido'}), 400
+
+    def build():
+        dic = snap.data
+        if not paginated:
+            return jsonify({'dictionary': dict(dic), 'version': snap.version})
+        limit = min(1000, max(1, _int_arg('limit', 100)))
+        ordered = sorted_dictionary_keys(snap)
+        keys = ordered.page(after, limit)
+        has_more = bool(keys) and keys[-1] != ordered.keys[-1]
+        return jsonify({
+            'dictionary': {es: dic[es] for es in keys},
+            'next_cursor': _encode_cursor(keys[-1]) if has_more else None,
+            'total': len(dic),
+            'version': snap.version,
+        })
+
+    return _conditional_response(snap, build)
+
+@app.route('/api/dictionary/search', methods=['GET'])
+def api_dictionary_search():
+    """Busca en el diccionario sin descargarlo completo.
+
+    Parámetros:
+      - q: texto a buscar (se normaliza igual que en la traducción)
+      - field: 'es', 'qu' o 'both' (por defecto)
+      - mode: 'auto' (prefijo + aproximado, por defecto), 'prefix', 'fuzzy' o
+        'exact' (todo el campo normalizado; con SQLite, consulta a sus índices)
+      - max_dist: distancia de edición máxima para aproximados (por defecto 1-2 según longitud)
+      - offset, limit: paginación (por defecto 0 y 20)
+    """
+    q = request.args.get('q') or ''
+    field = (request.args.get('field') or 'both').lower()
+    fields = ('es', 'qu') if field == 'both' else (field,)
+    mode = (request.args.get('mode') or 'auto').lower()
+    if mode not in ('auto', 'prefix', 'fuzzy', 'exact'):
+        mode = 'auto'
+    offset = max(0, _int_arg('offset', 0))
+    limit = min(200, max(1, _int_arg('limit', 20)))
+    max_dist = request.args.get('max_dist')
+    try:
+        max_dist = min(3, max(0, int(max_dist))) if max_dist not in (None, '') else None
+    except Exception:
+        max_dist = None
+    if mode == 'exact' and SQLITE_STORAGE is not None:
+        fields = tuple(f for f in fields if f in DictionarySearchIndex.FIELDS) or DictionarySearchIndex.FIELDS
+        results, version = SQLITE_STORAGE.find_exact(q, fields)
     else:
-        dic = {}
-    return jsonify({'dictionary': dic})
+        snap = DICT_STORE.snapshot()
+        results = dictionary_search_index(snap).search(q, fields=fields, mode=mode, max_dist=max_dist)
+        version = snap.version
+    return jsonify({
+        'query': q,
+        'results': results[offset: offset + limit],
+        'total': len(results),
+        'offset': offset,
+        'limit': limit,
+        'version': version,
+    })
+
+def _commit_edit(data, reason, info, changes, history):
+    """Envía la edición al pipeline; con `sync` espera a que quede volcada a disco."""
+    version = COMMITS.submit(reason, info, changes, history)
+    if data.get('sync'):
+        COMMITS.flush()
+    return version
 
 @app.route('/api/dictionary/add', methods=['POST'])
 def api_dictionary_add():
@@ -663,18 +4857,17 @@ def api_dictionary_add():
             return jsonify({'error': 'Faltan datos'}), 400
 
         with DICT_LOCK:
-            dic = load_dictionary()
-            before = dic.get(spanish)
-            dic[spanish] = kichwa
-            save_dictionary(dic, reason='add', info={'spanish': spanish})
-            append_history(
+            before = DICT_STORE.snapshot().data.get(spanish)
+            history = make_history_entry(
                 action='add' if before is None else 'overwrite',
                 spanish_before=spanish if before is not None else None,
                 spanish_after=spanish,
                 kichwa_before=before,
                 kichwa_after=kichwa,
             )
-        return jsonify({'ok': True})
+            version = _commit_edit(data, 'add', {'spanish': spanish},
+                                   [(spanish, before, kichwa)], [history])
+        return jsonify({'ok': True, 'version': version})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -690,31 +4883,29 @@ def api_dictionary_update():
             return jsonify({'error': 'Faltan datos'}), 400
 
         with DICT_LOCK:
-            dic = load_dictionary()
+            dic = DICT_STORE.snapshot().data
             if spanish not in dic:
                 return jsonify({'error': 'Palabra no encontrada'}), 404
 
             before_kichwa = dic.get(spanish)
-            dic[spanish] = kichwa
-
-            renamed = False
-            if spanish_new and spanish_new != spanish:
-                dic[spanish_new] = dic.pop(spanish)
-                renamed = True
+            renamed = bool(spanish_new) and spanish_new != spanish
+            if renamed:
                 spanish_after = spanish_new
+                changes = [(spanish, before_kichwa, None), (spanish_new, dic.get(spanish_new), kichwa)]
             else:
                 spanish_after = spanish
-
-            save_dictionary(dic, reason='update', info={'spanish': spanish, 'spanish_new': spanish_new or None})
-            append_history(
+                changes = [(spanish, before_kichwa, kichwa)]
+            history = make_history_entry(
                 action='rename' if renamed else 'update',
                 spanish_before=spanish,
                 spanish_after=spanish_after,
                 kichwa_before=before_kichwa,
-                kichwa_after=dic[spanish_after]
+                kichwa_after=kichwa
             )
+            version = _commit_edit(data, 'update', {'spanish': spanish, 'spanish_new': spanish_new or None},
+                                   changes, [history])
 
-        return jsonify({'ok': True, 'spanish': spanish_after, 'kichwa': dic[spanish_after]})
+        return jsonify({'ok': True, 'spanish': spanish_after, 'kichwa': kichwa, 'version': version})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -728,48 +4919,80 @@ def api_dictionary_delete():
             return jsonify({'error': 'Palabra no especificada'}), 400
 
         with DICT_LOCK:
-            dic = load_dictionary()
+            dic = DICT_STORE.snapshot().data
             if spanish in dic:
                 before_kichwa = dic.get(spanish)
-                del dic[spanish]
-                save_dictionary(dic, reason='delete', info={'spanish': spanish})
-                append_history(
+                history = make_history_entry(
                     action='delete',
                     spanish_before=spanish,
                     spanish_after=None,
                     kichwa_before=before_kichwa,
                     kichwa_after=None
                 )
-                return jsonify({'ok': True})
+                version = _commit_edit(data, 'delete', {'spanish': spanish},
+                                       [(spanish, before_kichwa, None)], [history])
+                return jsonify({'ok': True, 'version': version})
             else:
                 return jsonify({'error': 'Palabra no encontrada'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/dictionary/import', methods=['POST'])
-def api_dictionary_import():
-    if 'file' not in request.files:
-        return jsonify({'error': 'file required'}), 400
+# -------------------- Importación masiva --------------------
+_IMPORT_FORMATS = ('csv', 'tsv', 'jsonl')
+_IMPORT_PREVIEW_LIMIT = 50
 
-    f = request.files['file']
-    # Leer bytes una sola vez y decodificar con fallback
-    try:
-        raw = f.read()
-    except Exception as e:
-        return jsonify({'error': f'No se pudo leer el archivo: {e}'}), 400
-    try:
-        content = raw.decode('utf-8')
-    except Exception:
-        try:
-            content = raw.decode('latin-1')
-        except Exception as e:
-            return jsonify({'error': f'No se pudo decodificar el archivo: {e}'}), 400
-    # Remover BOM si existe
-    if content and content[0] == '\ufeff':
-        content = content.lstrip('\ufeff')
+def _import_format(fmt, filename):
+    fmt = (fmt or '').strip().lower()
+    if fmt in ('ndjson', 'json-lines', 'jsonlines'):
+        fmt = 'jsonl'
+    if fmt in _IMPORT_FORMATS:
+        return fmt
+    name = (filename or '').lower()
+    if name.endswith('.tsv') or name.endswith('.tab'):
+        return 'tsv'
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
 
-    import csv, io
+def _import_field(value):
+    """Texto de un campo JSON: números se convierten, objetos/listas/booleanos no."""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+def _iter_import_rows(text_stream, fmt):
+    """Genera filas [español, kichwa, ...] leyendo el archivo de forma incremental."""
+    if fmt == 'jsonl':
+        for line in text_stream:
+            line = line.strip()
+            if not line:
+                yield []
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                yield []
+                continue
+            if isinstance(obj, dict):
+                fields = [obj.get('spanish', obj.get('es')), obj.get('kichwa', obj.get('qu'))]
+            elif isinstance(obj, list):
+                fields = obj
+            else:
+                fields = []
+            row = [_import_field(v) for v in fields]
+            # Un campo que no es texto invalida solo esa fila
+            yield [] if None in row else row
+        return
+    delimiter = '\t' if fmt == 'tsv' else ','
+    for row in csv.reader(text_stream, delimiter=delimiter):
+        yield row
 
+def _apply_import_rows(rows, current, source):
+    """Aplica filas sobre `current` (se modifica); devuelve (stats, changes, history)."""
     stats = {
         'added': 0,
         'updated': 0,
@@ -777,90 +5000,233 @@ def api_dictionary_import():
         'skipped_duplicates': 0,
         'total_rows': 0
     }
+    seen_in_file = set()
+    changes = []
+    history = []
+    for row in rows:
+        stats['total_rows'] += 1
+        if not row or len(row) < 2:
+            stats['skipped_invalid'] += 1
+            continue
+        es = (row[0] or '').strip().lower()
+        qu = (row[1] or '').strip()
+        if not es or not qu:
+            stats['skipped_invalid'] += 1
+            continue
+        # duplicados dentro del mismo archivo
+        key_pair = (es, qu)
+        if key_pair in seen_in_file:
+            stats['skipped_duplicates'] += 1
+            continue
+        seen_in_file.add(key_pair)
 
-    with DICT_LOCK:
-        current = load_dictionary()
-
-        seen_in_file = set()
-        reader = csv.reader(io.StringIO(content))
-        for row in reader:
-            stats['total_rows'] += 1
-            if not row or len(row) < 2:
-                stats['skipped_invalid'] += 1
-                continue
-            es = (row[0] or '').strip().lower()
-            qu = (row[1] or '').strip()
-            if not es or not qu:
-                stats['skipped_invalid'] += 1
-                continue
-            # duplicados dentro del mismo archivo
-            key_pair = (es, qu)
-            if key_pair in seen_in_file:
+        if es in current:
+            if current[es] == qu:
                 stats['skipped_duplicates'] += 1
-                continue
-            seen_in_file.add(key_pair)
-
-            if es in current:
-                if current[es] == qu:
-                    stats['skipped_duplicates'] += 1
-                else:
-                    # actualizar valor existente
-                    before = current[es]
-                    current[es] = qu
-                    stats['updated'] += 1
-                    append_history(
-                        action='bulk-update',
-                        spanish_before=es,
-                        spanish_after=es,
-                        kichwa_before=before,
-                        kichwa_after=qu,
-                        info={'source': 'import-csv'}
-                    )
             else:
+                # actualizar valor existente
+                before = current[es]
                 current[es] = qu
-                stats['added'] += 1
-                append_history(
-                    action='bulk-add',
-                    spanish_before=None,
+                changes.append((es, before, qu))
+                stats['updated'] += 1
+                history.append(make_history_entry(
+                    action='bulk-update',
+                    spanish_before=es,
                     spanish_after=es,
-                    kichwa_before=None,
+                    kichwa_before=before,
                     kichwa_after=qu,
-                    info={'source': 'import-csv'}
-                )
+                    info={'source': source}
+                ))
+        else:
+            current[es] = qu
+            changes.append((es, None, qu))
+            stats['added'] += 1
+            history.append(make_history_entry(
+                action='bulk-add',
+                spanish_before=None,
+                spanish_after=es,
+                kichwa_before=None,
+                kichwa_after=qu,
+                info={'source': source}
+            ))
+    return stats, changes, history
+
+@app.route('/api/dictionary/import', methods=['POST'])
+def api_dictionary_import():
+    """Importa pares español/kichwa desde CSV, TSV o JSON Lines.
+
+    Parámetros (query o formulario):
+      - format: 'csv' (por defecto), 'tsv' o 'jsonl'; si falta se deduce de la extensión
+      - dry_run: '1' para calcular las estadísticas sin escribir nada
+    El archivo se lee en streaming (UTF-8, con reintento en Latin-1). Todo el
+    lote se guarda con un único save_dictionary y un único anexado al historial.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'file required'}), 400
+
+    f = request.files['file']
+    params = request.values
+    fmt = _import_format(params.get('format'), f.filename)
+    dry_run = (params.get('dry_run') or '').lower() in ('1', 'true', 'yes', 'si', 'sí')
+    source = f'import-{fmt}'
+
+    raw_stream = f.stream
+    try:
+        seekable = raw_stream.seekable()
+    except Exception:
+        seekable = False
+    if not seekable:
+        try:
+            raw_stream = io.BytesIO(raw_stream.read())
+        except Exception as e:
+            return jsonify({'error': f'No se pudo leer el archivo: {e}'}), 400
 
-        save_dictionary(current, reason='import-csv', info={'stats': stats})
+    with DICT_LOCK:
+        result = None
+        last_error = None
+        for encoding in ('utf-8-sig', 'latin-1'):
+            current = load_dictionary()
+            try:
+                raw_stream.seek(0)
+                text_stream = io.TextIOWrapper(raw_stream, encoding=encoding, newline='')
+                try:
+                    result = _apply_import_rows(_iter_import_rows(text_stream, fmt), current, source)
+                finally:
+                    # No cerrar el stream del archivo subido al liberar el wrapper
+                    text_stream.detach()
+                break
+            except UnicodeDecodeError as e:
+                last_error = e
+                continue
+            except Exception as e:
+                return jsonify({'error': f'No se pudo leer el archivo: {e}'}), 400
+        if result is None:
+            return jsonify({'error': f'No se pudo decodificar el archivo: {last_error}'}), 400
 
-    return jsonify({'ok': True, **stats})
+        stats, changes, history = result
+        if dry_run:
+            preview = [{'spanish': es, 'kichwa_before': before, 'kichwa_after': after}
+                       for es, before, after in changes[:_IMPORT_PREVIEW_LIMIT]]
+            return jsonify({'ok': True, 'dry_run': True, 'format': fmt, **stats, 'preview': preview})
+
+        if changes:
+            save_dictionary(current, reason=source, info={'stats': stats}, changes=changes)
+            HISTORY_LOG.append_many(history)
+
+    return jsonify({'ok': True, 'format': fmt, **stats})
 
 @app.route('/api/dictionary/export', methods=['GET'])
 def api_dictionary_export():
+    """Exporta el diccionario en JSON o CSV, generado por partes en orden alfabético."""
     fmt = (request.args.get('format') or 'json').lower()
-    dict_path = os.path.join('data', 'dictionary_es_qu.json')
-
-    if os.path.exists(dict_path):
-        with open(dict_path, 'r', encoding='utf-8') as f:
-            dic = json.load(f)
-    else:
-        dic = {}
+    snap = DICT_STORE.snapshot()
 
-    if fmt == 'csv':
-        # Construir CSV simple "es,kichwa"
-        import io
-        import csv
-        output = io.StringIO()
-        writer = csv.writer(output)
-        for es, qu in sorted(dic.items(), key=lambda x: x[0]):
-            writer.writerow([es, qu])
-        csv_data = output.getvalue()
-        from flask import Response
-        return Response(csv_data, mimetype='text/csv', headers={
-            'Content-Disposition': 'attachment; filename=dictionary_es_qu.csv'
-        })
+    def build():
+        keys = sorted_dictionary_keys(snap).keys
+        if fmt == 'csv':
+            # CSV simple "es,kichwa"
+            return Response(_iter_export_csv(snap.data, keys), mimetype='text/csv', headers={
+                'Content-Disposition': 'attachment; filename=dictionary_es_qu.csv'
+            })
+        # Por defecto JSON
+        return Response(_iter_export_json(snap.data, keys), mimetype='application/json')
 
-    # Por defecto JSON
-    return jsonify({'dictionary': dic})
+    return _conditional_response(snap, build)
 
 # -------------------- Estudio: Flashcards y Quizzes --------------------
+_QUIZ_WINDOW = 12  # vecinos (por lado) entre los que se buscan distractores parecidos
+_QUIZ_MAX_QUESTIONS = 100
+_QUIZ_MAX_OPTIONS = 10
+
+class StudyPairs:
+    """Pares (español, kichwa) de una instantánea, indexables para muestrear.
+
+    Se construye una vez por versión, en el orden alfabético de las claves
+    (el mismo en todos los procesos, para que una semilla reproduzca el mismo
+    quiz). Para cada dirección guarda, bajo demanda, dos órdenes de las
+    respuestas como arreglos de índices: por longitud y alfabético. Los
+    distractores se toman por índice cerca de la respuesta correcta en uno de
+    esos órdenes (longitud o prefijo parecidos), descartando repetidos; el
+    costo por pregunta no depende del tamaño del diccionario.
+    """
+
+    def __init__(self, data, keys):
+        self.es = []
+        self.qu = []
+        for es in keys:
+            qu = data.get(es)
+            if isinstance(qu, str):
+                self.es.append(es)
+                self.qu.append(qu)
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.es)
+
+    def answers(self, direction):
+        return self.es if direction == 'qu2es' else self.qu
+
+    def _order(self, direction, kind):
+        """(orden, posición): índices ordenados por `kind` y la posición de cada índice."""
+        cached = self._orders.get((direction, kind))
+        if cached is None:
+            answers = self.answers(direction)
+            if kind == 'length':
+                key = lambda i: (len(answers[i]), answers[i])
+            else:
+                key = lambda i: answers[i].lower()
+            order = array('i', sorted(range(len(answers)), key=key))
+            position = array('i', bytes(order.itemsize * len(order)))
+            for pos, i in enumerate(order):
+                position[i] = pos
+            cached = (order, position)
+            # Carrera benigna: dos hilos pueden construir el mismo orden
+            self._orders[(direction, kind)] = cached
+        return cached
+
+    def distractors(self, index, direction, k, rng, window=_QUIZ_WINDOW):
+        """Hasta `k` respuestas distintas de la correcta, preferentemente parecidas."""
+        answers = self.answers(direction)
+        prompts = self.qu if direction == 'qu2es' else self.es
+        n = len(answers)
+        prompt = prompts[index]
+        chosen = []
+        seen = {answers[index]}
+
+        def take(j):
+            # Otra clave con el mismo enunciado también sería correcta
+            text = answers[j]
+            if text not in seen and prompts[j] != prompt:
+                seen.add(text)
+                chosen.append(text)
+
+        orders = (self._order(direction, 'length'), self._order(direction, 'prefix'))
+        attempts = 0
+        # Muestreo por rechazo entre los vecinos de la respuesta en uno de los dos órdenes
+        while len(chosen) < k and attempts < 8 * k:
+            attempts += 1
+            order, position = orders[rng.randrange(2)]
+            pos = position[index] + rng.randint(-window, window)
+            if 0 <= pos < n:
+                take(order[pos])
+        # Vecindario agotado (muchas respuestas repetidas): cualquier índice
+        while len(chosen) < k and attempts < 16 * k:
+            attempts += 1
+            take(rng.randrange(n))
+        if len(chosen) < k:
+            # Diccionarios diminutos: recorrido completo
+            for j in range(n):
+                if len(chosen) >= k:
+                    break
+                take(j)
+        return chosen
+
+def study_pairs(snapshot):
+    """Pares de estudio cacheados para la instantánea dada."""
+    # Fuera del builder: `derived` no es reentrante
+    keys = sorted_dictionary_keys(snapshot).keys
+    return snapshot.derived('study_pairs', lambda data: StudyPairs(data, keys))
+
 @app.route('/api/study/flashcards', methods=['GET'])
 def api_study_flashcards():
     """Devuelve una lista de tarjetas de estudio basadas en el diccionario.
@@ -875,7 +5241,7 @@ def api_study_flashcards():
     except Exception:
         limit = 20
 
-    dic = load_dictionary()
+    dic = DICT_STORE.snapshot().data
     if not dic:
         return jsonify({'flashcards': []})
 
@@ -900,45 +5266,43 @@ def api_study_quiz():
 
     Parámetros:
       - dir: 'es2qu' (por defecto) o 'qu2es'
-      - limit: número de preguntas (por defecto 10)
-      - options: número de opciones por pregunta (por defecto 4)
+      - limit: número de preguntas (por defecto 10, entre 1 y 100, como mucho
+        una por entrada del diccionario)
+      - options: número de opciones por pregunta (por defecto 4, entre 2 y 10,
+        como mucho tantas como entradas)
+      - seed: semilla para repetir el mismo quiz sobre la misma versión; la
+        respuesta incluye la usada (aleatoria si falta)
     """
     direction = (request.args.get('dir') or 'es2qu').lower()
-    try:
-        limit = int(request.args.get('limit', '10'))
-    except Exception:
-        limit = 10
-    try:
-        num_options = max(2, int(request.args.get('options', '4')))
-    except Exception:
-        num_options = 4
-
-    dic = load_dictionary()
-    if not dic:
-        return jsonify({'questions': []})
+    limit = min(_QUIZ_MAX_QUESTIONS, max(1, _int_arg('limit', 10)))
+    num_options = min(_QUIZ_MAX_OPTIONS, max(2, _int_arg('options', 4)))
+    seed = (request.args.get('seed') or '').strip() or str(random.getrandbits(32))
 
-    pairs = [(es, qu) for es, qu in dic.items() if isinstance(qu, str)]
-    if not pairs:
-        return jsonify({'questions': []})
+    snap = DICT_STORE.snapshot()
+    pairs = study_pairs(snap)
+    if not len(pairs):
+        return jsonify({'questions': [], 'seed': seed, 'version': snap.version})
 
-    random.shuffle(pairs)
-    base = pairs[: max(0, limit)]
+    # Cada pregunta usa una entrada distinta y sus opciones, respuestas distintas
+    limit = min(limit, len(pairs))
+    num_options = min(num_options, len(pairs))
+    rng = random.Random(seed)
+    picks = rng.sample(range(len(pairs)), k=limit)
+    window = max(_QUIZ_WINDOW, 4 * num_options)
 
     questions = []
-    for es, qu in base:
+    for i in picks:
         if direction == 'qu2es':
-            prompt = qu
-            correct = es
-            pool = [p[0] for p in pairs if p[1] != qu]
+            prompt = pairs.qu[i]
+            correct = pairs.es[i]
         else:
-            prompt = es
-            correct = qu
-            pool = [p[1] for p in pairs if p[0] != es]
+            prompt = pairs.es[i]
+            correct = pairs.qu[i]
 
         # construir opciones
-        distractors = random.sample(pool, k=min(len(pool), num_options - 1)) if pool else []
+        distractors = pairs.distractors(i, direction, num_options - 1, rng, window)
         options = distractors + [correct]
-        random.shuffle(options)
+        rng.shuffle(options)
         questions.append({
             'prompt': prompt,
             'options': options,
@@ -946,25 +5310,21 @@ def api_study_quiz():
             'dir': direction
         })
 
-    return jsonify({'questions': questions})
+    return jsonify({'questions': questions, 'seed': seed, 'version': snap.version})
 
 # Metadatos, historial, backups y restauración
 @app.route('/api/dictionary/meta', methods=['GET'])
 def api_dictionary_meta():
     meta = ensure_meta_initialized()
     try:
-        backups = []
-        for name in sorted(os.listdir(BACKUP_DIR)):
-            if not name.endswith('.json'): continue
-            path = os.path.join(BACKUP_DIR, name)
-            try:
-                stat = os.stat(path)
-                backups.append({'file': name, 'bytes': stat.st_size})
-            except Exception:
-                backups.append({'file': name})
+        catalog = BACKUP_STORE.catalog()
+        backups = [{'file': e['file'], 'bytes': e.get('bytes')} for e in catalog]
+        total_bytes = sum(e.get('bytes') or 0 for e in catalog)
     except Exception:
         backups = []
-    return jsonify({'meta': meta, 'backups': backups})
+        total_bytes = 0
+    return jsonify({'meta': meta, 'backups': backups, 'backups_bytes': total_bytes,
+                    'commits': COMMITS.stats()})
 
 @app.route('/api/dictionary/history', methods=['GET'])
 def api_dictionary_history():
@@ -973,45 +5333,66 @@ def api_dictionary_history():
         limit = int(limit)
     except Exception:
         limit = 200
-    history = _safe_read_json(HISTORY_PATH, [])
-    return jsonify({'history': history[-limit:]})
+    return jsonify({'history': HISTORY_LOG.tail(limit)})
 
 @app.route('/api/dictionary/backups', methods=['GET'])
 def api_dictionary_backups():
-    files = []
+    """Lista backups desde el catálogo, de la versión más nueva a la más vieja.
+
+    Parámetros:
+      - offset, limit: paginación (por defecto 0 y 100)
+      - reason: motivo exacto (add, update, import-csv, restore, ...)
+      - kind: 'full' o 'delta'
+      - since, until: fechas ISO (YYYY-MM-DD o YYYY-MM-DDTHH:MM:SSZ)
+    """
+    offset = max(0, _int_arg('offset', 0))
+    limit = max(1, _int_arg('limit', 100))
     try:
-        for name in sorted(os.listdir(BACKUP_DIR)):
-            if not name.endswith('.json'): continue
-            path = os.path.join(BACKUP_DIR, name)
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                meta = data.get('metadata', {})
-            except Exception:
-                meta = {}
-            files.append({'file': name, 'metadata': meta})
+        entries = BACKUP_STORE.catalog(
+            reason=request.args.get('reason') or None,
+            kind=request.args.get('kind') or None,
+            since=request.args.get('since') or None,
+            until=request.args.get('until') or None,
+        )
     except Exception as e:
-        return jsonify({'error': str(e), 'files': files}), 500
-    return jsonify({'files': files})
+        return jsonify({'error': str(e), 'files': []}), 500
+    page = entries[offset: offset + limit]
+    files = [{'file': e['file'], 'metadata': {k: v for k, v in e.items() if k != 'file'}} for e in page]
+    return jsonify({'files': files, 'total': len(entries), 'offset': offset, 'limit': limit})
 
 @app.route('/api/dictionary/restore', methods=['POST'])
 def api_dictionary_restore():
+    """Restaura una versión anterior como versión nueva.
+
+    Cuerpo: {"file": "<archivo en data/backups>"} o {"version": N}. Los
+    archivos delta y las versiones se reconstruyen aplicando deltas sobre el
+    snapshot completo más cercano. Con SQLite, `file` es un nombre del
+    catálogo (v<N> o snapshot-<id>).
+    """
     body = request.get_json() or {}
-    filename = (body.get('file') or '').strip()
-    if not filename:
-        return jsonify({'error': 'file requerido'}), 400
-    target = os.path.join(BACKUP_DIR, filename)
-    if not os.path.exists(target):
-        return jsonify({'error': 'Backup no encontrado'}), 404
+    filename = os.path.basename((body.get('file') or '').strip())
+    version = body.get('version')
+    if not filename and version in (None, ''):
+        return jsonify({'error': 'file o version requerido'}), 400
     try:
-        with open(target, 'r', encoding='utf-8') as f:
-            payload = json.load(f)
-        new_dic = payload.get('dictionary') or {}
+        if filename:
+            found = BACKUP_STORE.load_file(filename)
+            if found is None:
+                return jsonify({'error': 'Backup no encontrado'}), 404
+            version, new_dic = found
+        else:
+            version = int(version)
+            new_dic = BACKUP_STORE.rebuild(version)
+        if new_dic is None:
+            return jsonify({'error': 'Versión no disponible'}), 404
         if not isinstance(new_dic, dict):
             return jsonify({'error': 'Backup inválido'}), 400
-        save_dictionary(new_dic, reason='restore', info={'file': filename})
-        append_history(action='restore', info={'file': filename})
-        return jsonify({'ok': True, 'restored_from': filename, 'entries': len(new_dic)})
+        source = {'file': filename} if filename else {'version': version}
+        save_dictionary(new_dic, reason='restore', info=source)
+        append_history(action='restore', info=source)
+        return jsonify({'ok': True, 'restored_from': filename or f'v{version}', 'version': version, 'entries': len(new_dic)})
+    except (TypeError, ValueError):
+        return jsonify({'error': 'version inválida'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1023,7 +5404,6 @@ def transcribe():
 def api_ffmpeg():
     """Verifica si ffmpeg está disponible en el sistema y su versión."""
     try:
-        import subprocess
         completed = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
         ok = completed.returncode == 0
         version = None
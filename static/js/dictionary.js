@@ -8,21 +8,9 @@ let sortDir = 'asc';
 let pageSize = 10;
 let currentPage = 1;
 let swapped = false; // controla si se muestran columnas invertidas
-
-// Utilidad de normalización ligera para búsqueda (quitar tildes y normalizar guiones)
-const normalizeForSearch = (s) => {
-    if (!s) return '';
-    const nfd = s.normalize('NFD');
-    let out = '';
-    for (const ch of nfd) {
-        if (ch === 'ñ' || ch === 'Ñ') { out += ch; continue; }
-        if (/\p{Mn}/u.test(ch)) continue; // diacríticos
-        out += ch;
-    }
-    out = out.normalize('NFC').toLowerCase();
-    out = out.replace(/[-_·•]+/g, '-').replace(/^[-]+|[-]+$/g, '');
-    return out;
-};
+let searchResults = null; // página de resultados del servidor para currentFilter
+let searchTotal = 0;
+let searchController = null; // petición de búsqueda en curso (se cancela al escribir)
 
 // Cargar diccionario
 async function loadDictionary() {
@@ -30,27 +18,63 @@ async function loadDictionary() {
         const r = await fetch('/api/dictionary');
         const data = await r.json();
         dictionary = data.dictionary || {};
-        renderDictionary();
+        refreshDictionary();
     } catch (err) {
         console.error('Error cargando diccionario:', err);
         showAlert('Error cargando el diccionario', 'danger');
     }
 }
 
+// Buscar en el servidor la página actual de currentFilter
+async function searchDictionary() {
+    if (searchController) searchController.abort();
+    const controller = searchController = new AbortController();
+    const params = new URLSearchParams({
+        q: currentFilter,
+        field: swapped ? 'qu' : 'es',
+        offset: String((currentPage - 1) * pageSize),
+        limit: String(pageSize)
+    });
+    try {
+        const r = await fetch(`/api/dictionary/search?${params}`, { signal: controller.signal });
+        const data = await r.json();
+        if (controller !== searchController) return; // llegó una búsqueda más nueva
+        searchTotal = data.total || 0;
+        const lastPage = Math.max(1, Math.ceil(searchTotal / pageSize));
+        if (currentPage > lastPage) {
+            // La página quedó fuera de rango (p.ej. tras eliminar): pedir la última
+            currentPage = lastPage;
+            return searchDictionary();
+        }
+        searchResults = (data.results || []).map(x => [x.spanish, x.kichwa]);
+        renderDictionary();
+    } catch (err) {
+        if (err.name === 'AbortError') return;
+        console.error('Error buscando en el diccionario:', err);
+        showAlert('Error buscando en el diccionario', 'danger');
+    }
+}
+
+// Volver a pintar: con filtro se pide la página al servidor
+function refreshDictionary() {
+    if (currentFilter) {
+        searchDictionary();
+    } else {
+        if (searchController) searchController.abort();
+        searchController = null;
+        searchResults = null;
+        renderDictionary();
+    }
+}
+
 // Renderizar diccionario
 function renderDictionary(filter = currentFilter) {
     const container = document.getElementById('dictionary-list');
     container.innerHTML = '';
 
-    const normFilter = normalizeForSearch(filter);
-
-    // Filtrar y ordenar entradas
-    let entries = Object.entries(dictionary)
-        .filter(([es, qu]) => {
-            const left = swapped ? qu : es;
-            const leftNorm = normalizeForSearch(left);
-            return !normFilter || leftNorm.includes(normFilter);
-        })
+    // Con filtro, los resultados ya vienen paginados y ordenados por relevancia
+    const searching = Boolean(filter) && searchResults !== null;
+    let entries = searching ? searchResults : Object.entries(dictionary)
         .sort((a, b) => {
             const valA = (sortBy === 'spanish' ? a[0] : a[1]) || '';
             const valB = (sortBy === 'spanish' ? b[0] : b[1]) || '';
@@ -71,12 +95,11 @@ function renderDictionary(filter = currentFilter) {
     }
 
     // Paginación
-    const totalItems = entries.length;
+    const totalItems = searching ? searchTotal : entries.length;
     const totalPages = Math.max(1, Math.ceil(totalItems / pageSize));
     if (currentPage > totalPages) currentPage = totalPages;
     const start = (currentPage - 1) * pageSize;
-    const end = start + pageSize;
-    const pageEntries = entries.slice(start, end);
+    const pageEntries = searching ? entries : entries.slice(start, start + pageSize);
 
     for (const [es, ki] of pageEntries) {
         const row = document.createElement('tr');
@@ -118,7 +141,7 @@ async function addWord(spanish, kichwa) {
 
         if (r.ok) {
             dictionary[spanish] = kichwa;
-            renderDictionary();
+            refreshDictionary();
             showAlert('Palabra agregada correctamente', 'success');
             return true;
         } else {
@@ -144,7 +167,7 @@ async function deleteWord(spanish) {
 
         if (r.ok) {
             delete dictionary[spanish];
-            renderDictionary();
+            refreshDictionary();
             showAlert('Palabra eliminada correctamente', 'success');
         } else {
             throw new Error('Error eliminando palabra');
@@ -213,7 +236,7 @@ function inlineEdit(row, spanish, kichwa) {
             // Actualizar estado local
             delete dictionary[spanish];
             dictionary[newSpanish] = newKichwa;
-            renderDictionary(currentFilter);
+            refreshDictionary();
             showAlert('Entrada actualizada', 'success');
         } catch (e) {
             console.error(e);
@@ -237,7 +260,7 @@ function renderPagination(totalPages) {
             e.preventDefault();
             if (disabled) return;
             currentPage = page;
-            renderDictionary(currentFilter);
+            refreshDictionary();
         });
         li.appendChild(a);
         return li;
@@ -282,30 +305,30 @@ searchInput.addEventListener('input', (e) => {
     debounceTimer = setTimeout(() => {
         currentFilter = value;
         currentPage = 1;
-        renderDictionary(currentFilter);
+        refreshDictionary();
     }, 250);
 });
 
 document.getElementById('btn-search').addEventListener('click', () => {
     currentFilter = document.getElementById('search-dictionary').value.trim();
     currentPage = 1;
-    renderDictionary(currentFilter);
+    refreshDictionary();
 });
 
 // Controles de orden y tamaño de página
 document.getElementById('sort-by').addEventListener('change', (e) => {
     sortBy = e.target.value;
     currentPage = 1;
-    renderDictionary(currentFilter);
+    refreshDictionary();
 });
 document.getElementById('sort-dir').addEventListener('change', (e) => {
     sortDir = e.target.value;
-    renderDictionary(currentFilter);
+    refreshDictionary();
 });
 document.getElementById('page-size').addEventListener('change', (e) => {
     pageSize = parseInt(e.target.value, 10) || 10;
     currentPage = 1;
-    renderDictionary(currentFilter);
+    refreshDictionary();
 });
 
 // Exportar CSV/JSON
@@ -355,7 +378,7 @@ document.getElementById('toggle-direction').addEventListener('click', () => {
     thA.textContent = thB.textContent;
     thB.textContent = temp;
     // Re-render
-    renderDictionary(currentFilter);
+    refreshDictionary();
 });
 
 // Manejar importación CSV
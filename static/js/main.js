@@ -171,6 +171,23 @@ async function translateText(text, src, dest) {
     }
 }
 
+const TTS_PLAYLIST_MIN_CHARS = 200;
+
+// Reproduce los segmentos en orden, precargando el siguiente mientras suena el actual
+async function playPlaylist(urls) {
+    let next = new Audio(urls[0]);
+    for (let i = 0; i < urls.length; i++) {
+        const current = next;
+        next = i + 1 < urls.length ? new Audio(urls[i + 1]) : null;
+        if (next) next.preload = 'auto';
+        await new Promise((resolve) => {
+            current.onended = resolve;
+            current.onerror = resolve;
+            current.play().catch(resolve);
+        });
+    }
+}
+
 // TTS con fallback
 async function speakText(text, langPrefer) {
     if (!text) return { ok: false };
@@ -195,17 +212,23 @@ async function speakText(text, langPrefer) {
         console.warn('speechSynthesis failed', e);
     }
 
-    // Fallback: TTS por servidor
+    // Fallback: TTS por servidor (textos largos: por oraciones, en lista de reproducción)
     try {
+        const long = text.length > TTS_PLAYLIST_MIN_CHARS;
         const resp = await fetch('/text-to-speech', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
                 text, 
-                lang: langPrefer.startsWith('qu') ? 'qu' : langPrefer 
+                lang: langPrefer.startsWith('qu') ? 'qu' : langPrefer,
+                mode: long ? 'playlist' : undefined
             })
         });
         const data = await resp.json();
+        if (resp.ok && data.playlist?.length) {
+            await playPlaylist(data.playlist.map(s => s.audio_url));
+            return { ok: true };
+        }
         if (resp.ok && data.audio_url) {
             const audio = new Audio(data.audio_url);
             await audio.play();
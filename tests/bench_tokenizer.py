@@ -0,0 +1,51 @@
+"""Microbenchmark del tokenizador kichwa frente a la implementación original.
+
+Uso (desde la raíz del proyecto):  python tests/bench_tokenizer.py
+No forma parte de la suite de pytest.
+"""
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import conftest  # noqa: E402,F401  (copia data/ a un directorio temporal)
+import app  # noqa: E402
+import reference_tokenizer as ref  # noqa: E402
+
+SENTENCES = [
+    'Ñuka wasi-kuna-pak mikuy-pak kani, allin kawsay-shi',
+    'Hola, ¿cómo estás? Buenos días amigo mío',
+    'imashalla kanki mashi, yuspagara',
+]
+
+
+def _compare(label, old, new, number):
+    t_old = timeit.timeit(old, number=number)
+    t_new = timeit.timeit(new, number=number)
+    print(f"{label:<28} original {t_old:7.3f} s   actual {t_new:7.3f} s   {t_old / t_new:5.1f}x")
+
+
+def main(number=20000):
+    _compare('tokenize_kichwa',
+             lambda: [ref.tokenize_kichwa(s) for s in SENTENCES],
+             lambda: [app.tokenize_kichwa(s) for s in SENTENCES], number)
+    _compare('tokenize_kichwa_many',
+             lambda: [ref.tokenize_kichwa(s) for s in SENTENCES],
+             lambda: app.tokenize_kichwa_many(SENTENCES), number)
+    _compare('normalize_kichwa_token',
+             lambda: [ref.normalize_kichwa_token(s) for s in SENTENCES],
+             lambda: [app.normalize_kichwa_token(s) for s in SENTENCES], number)
+    # Sin memoria: textos distintos en cada llamada
+    unique = [f"{s} {i}" for i in range(2000) for s in SENTENCES]
+    app.normalize_kichwa_token.cache_clear()
+    app._expand_kichwa_token.cache_clear()
+    _compare('tokenize_kichwa (fría)',
+             lambda: [ref.tokenize_kichwa(s) for s in unique],
+             lambda: app.tokenize_kichwa_many(unique), 1)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,27 @@
+"""Configuración común: la app se importa dentro de una copia temporal de data/.
+
+app.py usa rutas relativas (data/, static/audio) y escribe en ellas al
+importarse, así que los tests corren en un directorio temporal con una
+copia del diccionario y con los reconocedores/sintetizadores locales (sin red).
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='asistente_tests_')
+
+for name in ('data',):
+    shutil.copytree(os.path.join(ROOT, name), os.path.join(WORKDIR, name))
+for name in ('dictionary.wal', 'asistente.sqlite', 'history.jsonl'):
+    path = os.path.join(WORKDIR, 'data', name)
+    if os.path.exists(path):
+        os.remove(path)
+os.makedirs(os.path.join(WORKDIR, 'static', 'audio'), exist_ok=True)
+
+os.environ.setdefault('STT_RECOGNIZER', 'local')
+os.environ.setdefault('TTS_BACKEND', 'local')
+os.environ.setdefault('COMMIT_FLUSH_MS', '20')
+os.chdir(WORKDIR)
+sys.path.insert(0, ROOT)
@@ -0,0 +1,72 @@
+"""Implementación original (sin tablas ni memoria) del tokenizador kichwa.
+
+Sirve de referencia para comprobar que la versión optimizada de app.py
+produce exactamente la misma salida, y como línea base del benchmark.
+"""
+import re
+import unicodedata
+
+_NON_ALNUM_RE = re.compile(r"[^a-zñáéíóúü-]+", re.IGNORECASE)
+_DASHES_RE = re.compile(r"[-_·•]+")
+
+def remove_diacritics(text):
+    # Normaliza eliminando tildes, conserva ñ
+    if not text:
+        return ''
+    normalized = unicodedata.normalize('NFD', text)
+    out_chars = []
+    for ch in normalized:
+        # Mantener ñ/Ñ explícitamente
+        if ch in ('ñ', 'Ñ'):
+            out_chars.append(ch)
+            continue
+        # Omitir marcas diacríticas
+        if unicodedata.category(ch) == 'Mn':
+            continue
+        out_chars.append(ch)
+    return unicodedata.normalize('NFC', ''.join(out_chars))
+
+def normalize_kichwa_token(token):
+    # minúsculas, quitar tildes, normalizar guiones múltiples a uno, recortar
+    t = token.strip().lower()
+    t = remove_diacritics(t)
+    t = _DASHES_RE.sub('-', t)
+    t = t.strip('-')
+    return t
+
+def tokenize_kichwa(text):
+    if not text:
+        return []
+    # Reemplazar separadores no alfanum a espacios, preservar guiones como partidores de morfemas
+    cleaned = _NON_ALNUM_RE.sub(' ', text)
+    tokens = []
+    for raw in cleaned.split():
+        t = normalize_kichwa_token(raw)
+        if not t:
+            continue
+        # Segmentar por sufijos comunes kichwa (heurístico)
+        # Lista básica de morfemas frecuentes
+        suffixes = ['-mi', '-m', '-shi', '-sh', '-ka', '-k', '-ta', '-n', '-pak', '-paj', '-sapa', '-kuna']
+        # asegurar formato con guión
+        parts = t.split('-') if '-' in t else [t]
+        # Mantener token completo y sus partes base
+        tokens.append(t)
+        for p in parts:
+            if p and p != t:
+                tokens.append(p)
+        # Generar variantes sin sufijos con y sin guiones
+        for suf in suffixes:
+            suf_clean = suf.lstrip('-')
+            if t.endswith(suf_clean):
+                base = t[: -len(suf_clean)]
+                base = base.rstrip('-')
+                if base:
+                    tokens.append(base)
+    # Unificar y devolver únicos preservando orden
+    seen = set()
+    uniq = []
+    for tok in tokens:
+        if tok not in seen:
+            seen.add(tok)
+            uniq.append(tok)
+    return uniq
@@ -0,0 +1,34 @@
+import os
+
+import app
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_quota_evicts_first_expiring(tmp_path):
+    janitor = app.AudioJanitor(str(tmp_path), ttl_seconds=3600, max_bytes=250)
+    for i, mtime in enumerate((300, 100, 200)):
+        path = tmp_path / f"a{i}.wav"
+        _write(path, 100)
+        os.utime(path, (mtime, mtime))
+        assert janitor.track(str(path))
+    assert not (tmp_path / 'a1.wav').exists()
+    assert (tmp_path / 'a0.wav').exists() and (tmp_path / 'a2.wav').exists()
+    stats = janitor.stats()
+    assert stats['files'] == 2 and stats['bytes'] == 200 and stats['evicted_quota'] == 1
+
+
+def test_tts_folder_belongs_to_tts_cache(tmp_path):
+    tts = tmp_path / 'tts'
+    tts.mkdir()
+    _write(tts / 'x.mp3', 500)
+    _write(tmp_path / 'legacy.wav', 50)
+    janitor = app.AudioJanitor(str(tmp_path), ttl_seconds=3600, max_bytes=100)
+    janitor.reconcile()
+    assert not janitor.track(str(tts / 'x.mp3'))
+    stats = janitor.stats()
+    assert stats['files'] == 1 and stats['bytes'] == 50
+    assert (tts / 'x.mp3').exists()
@@ -0,0 +1,81 @@
+import io
+import math
+import shutil
+import struct
+import wave
+
+import pytest
+
+import app
+
+
+def _wav(rate=44100, channels=2, seconds=0.5):
+    frames = int(rate * seconds)
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        samples = (int(8000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(frames))
+        w.writeframes(b''.join(struct.pack('<h', s) * channels for s in samples))
+    return out.getvalue()
+
+
+def test_multipart_se_copia_una_sola_vez(monkeypatch):
+    created = []
+    original = app.AudioSpool.__init__
+
+    def counting(self, limit=None):
+        created.append(self)
+        original(self, limit)
+
+    monkeypatch.setattr(app.AudioSpool, '__init__', counting)
+    payload = _wav()
+    with app.app.test_request_context('/speech-to-text', method='POST', data={
+            'lang': 'es', 'file': (io.BytesIO(payload), 'voz.wav')}):
+        upload, error = app._read_uploaded_audio()
+        assert error is None
+    # El búfer del parser es el del upload y sobrevive al cierre de la petición
+    assert created == [upload.buffer]
+    assert upload.size == len(payload) and upload.open().read() == payload
+    upload.close()
+
+
+def test_multipart_respeta_el_limite_mientras_llega():
+    with app.app.test_request_context('/speech-to-text', method='POST', data={
+            'file': (io.BytesIO(b'x' * 5000), 'voz.wav')}):
+        upload, error = app._read_uploaded_audio(limit=1000)
+    assert upload is None and error[1] == 413
+
+
+def test_otras_subidas_no_usan_el_bufer_de_audio():
+    with app.app.test_request_context('/api/dictionary/import', method='POST', data={
+            'file': (io.BytesIO(b'perro,allku\n'), 'd.csv')}):
+        stream = app.request.files['file'].stream
+        assert not isinstance(stream, app.AudioSpool)
+
+
+def _decode(payload):
+    upload = app.AudioUpload.from_stream(io.BytesIO(payload), 'voz.wav')
+    try:
+        return app.decode_audio(upload)
+    finally:
+        upload.close()
+
+
+def test_wav_sin_ffmpeg_se_normaliza_a_16k_mono(monkeypatch):
+    monkeypatch.setattr(app.shutil, 'which', lambda name: None)
+    audio = _decode(_wav(rate=44100, channels=2, seconds=0.5))
+    assert (audio.sample_rate, audio.sample_width) == (16000, 2)
+    assert abs(len(audio.frame_data) - 16000) <= 64  # 0.5 s * 16000 * 2 bytes
+
+
+@pytest.mark.skipif(not shutil.which('ffmpeg'), reason='ffmpeg no instalado')
+def test_wav_con_ffmpeg_pasa_por_el_mismo_decodificador(monkeypatch):
+    calls = []
+    original = app._decode_with_ffmpeg
+    monkeypatch.setattr(app, '_decode_with_ffmpeg', lambda u, s: calls.append(u) or original(u, s))
+    audio = _decode(_wav(rate=22050, channels=2, seconds=0.5))
+    assert len(calls) == 1
+    assert (audio.sample_rate, audio.sample_width) == (16000, 2)
+    assert abs(len(audio.frame_data) - 16000) <= 64
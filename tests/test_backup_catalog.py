@@ -0,0 +1,100 @@
+import os
+import tempfile
+
+import app
+
+
+def _store(folder, catalog):
+    return app.BackupStore(folder, full_every=3, retention=100, catalog_path=catalog)
+
+
+def test_catalogo_compartido_entre_procesos():
+    folder = tempfile.mkdtemp(prefix='backups_')
+    catalog = os.path.join(folder, 'catalog.jsonl')
+    a, b = _store(folder, catalog), _store(folder, catalog)
+    a.catalog()
+    b.catalog()
+    data = {'perro': 'allku'}
+    for version in range(1, 7):
+        store = a if version % 2 else b
+        new = dict(data, **{f'k{version}': str(version)})
+        store.record(data, new, version - 1, version, [(f'k{version}', None, str(version))], 'edit')
+        data = new
+    with open(catalog, encoding='utf-8') as f:
+        appended = sum(1 for _ in f)
+    # Cada backup agregó una línea; ninguno reescribió el catálogo del otro
+    files = sorted(n for n in os.listdir(folder) if app.BackupStore.parse_name(n))
+    assert appended >= len(files)
+    fresh = _store(folder, catalog)
+    assert sorted(e['file'] for e in fresh.catalog()) == files
+
+
+def test_catalogo_se_repara_desde_la_carpeta():
+    folder = tempfile.mkdtemp(prefix='backups_')
+    catalog = os.path.join(folder, 'catalog.jsonl')
+    store = _store(folder, catalog)
+    store.write_full({'a': 'b'}, 1, 'manual')
+    store.write_full({'a': 'c'}, 2, 'manual')
+    with open(catalog, 'a', encoding='utf-8') as f:
+        f.write('{"file": "truncad')
+    os.remove(os.path.join(folder, sorted(store._fulls[1])[0]))
+    fresh = _store(folder, catalog)
+    assert [e['version'] for e in fresh.catalog()] == [2]
+    # Quedó compactado: una línea por archivo
+    with open(catalog, encoding='utf-8') as f:
+        assert len(f.readlines()) == 1
+
+
+
+def test_fuente_multiproceso_no_relee_la_carpeta_en_cada_comprobacion(tmp_path):
+    class CountingBackups:
+        refreshes = 0
+
+        def refresh(self):
+            self.refreshes += 1
+
+        def changes_since(self, from_version, to_version, data):
+            return [('sol', None, 'inti')]
+
+    meta = tmp_path / 'meta.json'
+    meta.write_text('{"current_version": 4}', encoding='utf-8')
+    backups = CountingBackups()
+    source = app.JsonDictionarySource(str(tmp_path / 'dictionary.json'), str(meta), backups)
+    assert source.catch_up(app.DictionarySnapshot({}, None, 4)) is None
+    changes, version, _ = source.catch_up(app.DictionarySnapshot({}, None, 3))
+    assert version == 4 and changes == [('sol', None, 'inti')]
+    assert backups.refreshes == 0
+
+
+def test_delta_de_otro_proceso_relee_carpeta_y_catalogo():
+    folder = tempfile.mkdtemp(prefix='backups_')
+    catalog = os.path.join(folder, 'catalog.jsonl')
+    a, b = _store(folder, catalog), _store(folder, catalog)
+    data = {'sol': 'inti'}
+    a.write_full(data, 1, reason='base')
+    b.catalog()
+    a.record(data, {'sol': 'inti', 'luna': 'killa'}, 1, 2, [('luna', None, 'killa')], reason='add')
+    # b no conoce la versión 2 hasta que la necesita
+    assert 2 not in b._deltas
+    assert b.changes_since(1, 2, data) == [('luna', None, 'killa')]
+    assert 2 in b._deltas
+    assert any(e['version'] == 2 for e in b.catalog())
+
+
+def test_puesta_al_dia_aplica_una_capa_sin_copiar():
+    class Source:
+        def signature(self):
+            return 'v2'
+
+        def catch_up(self, snapshot):
+            return [('luna', None, 'killa'), ('sol', 'inti', None)], 2, 'v2'
+
+    base = {'sol': 'inti', 'agua': 'yaku'}
+    store = app.DictionaryStore('unused.json', source=Source())
+    store._snapshot = app.DictionarySnapshot(base, 'v1', 1)
+    notified = []
+    store.add_listener(notified.append)
+    snap = store.snapshot()
+    assert snap.version == 2 and dict(snap.data) == {'agua': 'yaku', 'luna': 'killa'}
+    assert isinstance(snap.data, app.LayeredMap) and snap.data._base is base
+    assert notified == [[('luna', None, 'killa'), ('sol', 'inti', None)]]
@@ -0,0 +1,73 @@
+import json
+import threading
+
+import pytest
+
+import app
+
+
+def test_escritura_y_publicacion_atomicas(tmp_path):
+    path = tmp_path / 'dictionary.json'
+    path.write_text(json.dumps({'perro': 'allku'}), encoding='utf-8')
+    store = app.DictionaryStore(str(path))
+    store.snapshot()
+    notified = []
+    store.add_listener(notified.append)
+    seen = []
+
+    def write():
+        path.write_text(json.dumps({'perro': 'allku', 'gato': 'misi'}), encoding='utf-8')
+        # Un lector ve la firma nueva en plena escritura: debe esperar, no recargar
+        reader = threading.Thread(target=lambda: seen.append(store.snapshot()))
+        reader.start()
+        reader.join(0.2)
+        return 7
+
+    snap = store.commit(write, {'perro': 'allku', 'gato': 'misi'}, changes=[('gato', None, 'misi')])
+    while not seen:
+        threading.Event().wait(0.01)
+    assert seen[0] is snap and snap.version == 7
+    assert None not in notified
+
+
+def test_ediciones_en_capa_hasta_volcar(tmp_path):
+    pipeline = app.CommitPipeline(app.WriteAheadLog(str(tmp_path / 'd.wal')), flush_interval=60)
+    app.COMMITS.flush()
+    before = app.DICT_STORE.snapshot().data
+    pipeline.submit('add', {}, [('zz_capa_1', None, 'uno')], [])
+    pipeline.submit('add', {}, [('zz_capa_2', None, 'dos')], [])
+    data = app.DICT_STORE.snapshot().data
+    assert isinstance(data, app.LayeredMap)
+    assert data['zz_capa_1'] == 'uno' and data['zz_capa_2'] == 'dos'
+    assert 'zz_capa_1' not in before and len(data) == len(before) + 2
+    pipeline.flush()
+    assert type(app.DICT_STORE.snapshot().data) is dict
+
+
+def test_historial_se_recupera_del_wal(tmp_path, monkeypatch):
+    wal_path = str(tmp_path / 'd.wal')
+    pipeline = app.CommitPipeline(app.WriteAheadLog(wal_path), flush_interval=60)
+    app.COMMITS.flush()
+    entries = [app.make_history_entry('add', spanish_after=f'zz_wal_{i}', kichwa_after='wal', info={'i': i})
+               for i in range(2)]
+
+    def crash(batch):
+        raise OSError('caída simulada')
+
+    monkeypatch.setattr(app.HISTORY_LOG, 'append_many', crash)
+    pipeline.submit('add', {}, [('zz_wal_0', None, 'wal'), ('zz_wal_1', None, 'wal')], entries)
+    with pytest.raises(OSError):
+        pipeline.flush()
+    monkeypatch.undo()
+    # La versión quedó escrita; el historial no
+    assert app.DICT_STORE.snapshot().data['zz_wal_0'] == 'wal'
+    # Caída a mitad del anexado: solo llegó la primera entrada
+    app.HISTORY_LOG.append_many(entries[:1])
+
+    recovered = app.CommitPipeline(app.WriteAheadLog(wal_path))
+    recovered.recover()
+    assert app.HISTORY_LOG.tail(2) == entries
+    assert app.WriteAheadLog(wal_path).records() == []
+    recovered.recover()
+    assert app.HISTORY_LOG.tail(3)[-2:] == entries
+    assert app.HISTORY_LOG.tail(3)[0] != entries[0]
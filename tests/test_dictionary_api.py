@@ -0,0 +1,45 @@
+import app
+
+
+def _client():
+    return app.app.test_client()
+
+
+def test_paginacion_recorre_todo_con_cursor():
+    client = _client()
+    seen, cursor = [], None
+    while True:
+        url = '/api/dictionary?limit=50' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get(url).get_json()
+        seen.extend(body['dictionary'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert seen == sorted(app.DICT_STORE.snapshot().data)
+
+
+def test_cursor_mal_formado_responde_400():
+    client = _client()
+    key = sorted(app.DICT_STORE.snapshot().data)[3]
+    good = app._encode_cursor(key)
+    assert client.get(f'/api/dictionary?limit=5&cursor={good}').status_code == 200
+    for bad in ('%%%', 'no es base64!', good + 'x', '_w', '4pyTIMOgIGxhIG1vZGU'[:-1]):
+        resp = client.get(f'/api/dictionary?limit=5&cursor={bad}')
+        assert resp.status_code == 400, bad
+        assert resp.get_json()['error']
+
+
+def test_if_modified_since_no_oculta_ediciones_pendientes(tmp_path):
+    client = _client()
+    app.COMMITS.flush()
+    first = client.get('/api/dictionary?limit=1')
+    last_modified = first.headers['Last-Modified']
+    assert client.get('/api/dictionary?limit=1', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    pipeline = app.CommitPipeline(app.WriteAheadLog(str(tmp_path / 'd.wal')), flush_interval=60)
+    pipeline.submit('add', {}, [('zz_pendiente_ims', None, 'pendiente')], [])
+    resp = client.get('/api/dictionary?limit=1', headers={'If-Modified-Since': last_modified})
+    assert resp.status_code == 200 and 'Last-Modified' not in resp.headers
+    assert resp.headers['ETag'] != first.headers['ETag']
+    pipeline.flush()
+    assert 'Last-Modified' in client.get('/api/dictionary?limit=1').headers
@@ -0,0 +1,132 @@
+import app
+
+
+def _sample():
+    return {
+        'perro': 'allku',
+        'gato': 'misi',
+        'casa grande': 'hatun wasi',
+        'agua': 'yaku',
+        'río': 'hatun yaku',
+    }
+
+
+CHANGES = [
+    ('perro', 'allku', 'allkuku'),
+    ('gato', 'misi', None),
+    ('montaña', None, 'urku'),
+    ('agua', 'yaku', 'yakú'),
+]
+
+
+def _apply(data, changes):
+    out = dict(data)
+    for es, _, after in changes:
+        if after is None:
+            out.pop(es, None)
+        else:
+            out[es] = after
+    return out
+
+
+def _search_view(index, queries, mode='auto'):
+    return {q: index.search(q, mode=mode) for q in queries}
+
+
+def test_layered_map_shares_base_without_leaking_changes():
+    base = app.LayeredMap({'a': 1, 'b': 2})
+    newer = base.updated({'a': 10, 'c': 3, 'b': app._DELETED})
+    assert dict(base) == {'a': 1, 'b': 2}
+    assert dict(newer) == {'a': 10, 'c': 3}
+    assert len(newer) == 2 and 'b' not in newer and newer.get('b') is None
+    assert list(newer) == ['a', 'c']
+
+
+def test_layered_map_compacts_large_layers():
+    current = app.LayeredMap({})
+    for i in range(3000):
+        current = current.updated({i: i})
+    assert len(current) == 3000 and len(current._layer) <= app.LayeredMap._COMPACT_MIN
+
+
+def test_inverse_index_incremental_matches_rebuild_and_keeps_old_version():
+    data = _sample()
+    old = app.KichwaInverseIndex.from_dictionary(data)
+    new = old.apply_changes(CHANGES)
+    rebuilt = app.KichwaInverseIndex.from_dictionary(_apply(data, CHANGES))
+    assert dict(new.exact) == dict(rebuilt.exact)
+    assert dict(new.bases) == dict(rebuilt.bases)
+    # El índice anterior sigue describiendo los datos anteriores
+    assert old.lookup('misi') == ('gato',)
+    assert new.lookup('misi') == ()
+
+
+def test_search_index_incremental_matches_rebuild_and_keeps_old_version():
+    data = _sample()
+    queries = ['pe', 'allku', 'yaku', 'mont', 'urku', 'gato', 'hatun', 'alku']
+    old = app.DictionarySearchIndex.from_dictionary(data)
+    before = _search_view(old, queries)
+    new = old.apply_changes(CHANGES)
+    rebuilt = app.DictionarySearchIndex.from_dictionary(_apply(data, CHANGES))
+    assert _search_view(new, queries) == _search_view(rebuilt, queries)
+    assert _search_view(old, queries) == before
+
+
+def test_carry_over_does_not_touch_previous_snapshot():
+    data = _sample()
+    previous = app.DictionarySnapshot(data, None, 1)
+    old_index = app.dictionary_search_index(previous)
+    snap = app.DictionarySnapshot(_apply(data, CHANGES), None, 2)
+    snap.carry_over(previous, CHANGES)
+    assert app.dictionary_search_index(previous) is old_index
+    assert app.dictionary_search_index(snap) is not old_index
+    assert [r['spanish'] for r in app.dictionary_search_index(previous).search('gato')] == ['gato']
+    assert app.dictionary_search_index(snap).search('gato') == []
+
+
+def test_search_index_survives_many_batches_and_compaction():
+    import random
+    rng = random.Random(7)
+    data = {f'palabra{i}': f'shimi{i % 97} kuna{i}' for i in range(2000)}
+    index = app.DictionarySearchIndex.from_dictionary(data)
+    for _ in range(40):
+        changes = []
+        for _ in range(50):
+            es = f'palabra{rng.randrange(2600)}'
+            after = None if rng.random() < 0.3 else f'shimi{rng.randrange(97)} kuna{rng.randrange(9999)}'
+            if data.get(es) != after:
+                changes.append((es, data.get(es), after))
+                data = _apply(data, [changes[-1]])
+        index = index.apply_changes(changes)
+    rebuilt = app.DictionarySearchIndex.from_dictionary(data)
+    # Prefijos: el tope de candidatos aproximados desempata por id y los ids difieren al reconstruir
+    queries = ['palabra1', 'palabra25', 'shimi3', 'kuna12', 'palabr', 'shimi9 kuna']
+    assert _search_view(index, queries, 'prefix') == _search_view(rebuilt, queries, 'prefix')
+    assert _search_view(index, ['palabra1999x'], 'fuzzy') == _search_view(rebuilt, ['palabra1999x'], 'fuzzy')
+
+
+def _qu_es(data, text):
+    return app._translate_local(app.DictionarySnapshot(data, None, 1), text, 'qu', 'es')
+
+
+def test_inverse_index_does_not_spread_phrase_glosses_to_words():
+    data = {
+        'bien': 'allin', 'buenos dias': 'allin killa', 'mal': 'mana allin',
+        'bienvenido': 'alli shamuy', 'muy bien': 'ashta allin', 'casa': 'wasi',
+        'escuela': 'yachay wasi', 'amigo': 'mashi', 'amiga': 'mashika',
+        'primo': 'mashi wayqi', 'hoy': 'kunan', 'ahora': 'kunan',
+    }
+    assert _qu_es(data, 'allin wasi') == {'translation': 'bien casa'}
+    assert _qu_es(data, 'mashi kuna') == {'translation': 'amigo kuna'}
+    assert _qu_es(data, 'alli') == {'translation': 'bien'}
+    assert _qu_es(data, 'wasikuna') == {'translation': 'casa'}
+    assert _qu_es(data, 'kunan') == {'translation': 'hoy', 'alternatives': {'kunan': ['hoy', 'ahora']}}
+    index = app.KichwaInverseIndex.from_dictionary(data)
+    assert index.lookup('alli') == ('bien',)
+    assert index.lookup('mashi') == ('amigo',)
+    assert 'killa' not in index.bases and 'yachay' not in index.bases
+
+
+def test_inverse_index_ranks_single_word_glosses_first():
+    index = app.KichwaInverseIndex.from_dictionary({'buen día': 'allin', 'bien': 'allin'})
+    assert index.lookup('allin') == ('bien', 'buen día')
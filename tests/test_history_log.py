@@ -0,0 +1,23 @@
+import json
+import os
+import tempfile
+
+import app
+
+
+def test_migracion_no_modifica_el_original():
+    folder = tempfile.mkdtemp(prefix='history_')
+    legacy = os.path.join(folder, 'history.json')
+    entries = [{'action': 'add', 'es': 'perro'}, {'action': 'edit', 'es': 'gato'}]
+    with open(legacy, 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+    with open(legacy, 'rb') as f:
+        original = f.read()
+
+    log = app.HistoryLog(os.path.join(folder, 'history.jsonl'))
+    assert log.migrate_from(legacy) == 2
+    with open(legacy, 'rb') as f:
+        assert f.read() == original
+    # Segunda vez: el JSONL ya existe, no se duplica nada
+    assert log.migrate_from(legacy) == 0
+    assert log.tail(10) == entries
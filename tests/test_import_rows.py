@@ -0,0 +1,24 @@
+import io
+
+import app
+
+
+def test_jsonl_con_valores_no_texto():
+    lines = [
+        '{"spanish": "uno", "kichwa": "shuk"}',
+        '{"spanish": 2, "kichwa": "ishkay"}',
+        '{"spanish": "tres", "kichwa": {"x": 1}}',
+        '{"spanish": "cuatro", "kichwa": true}',
+        '{"es": "cinco", "qu": null}',
+        '["seis", "sukta"]',
+        '["siete", ["kanchis"]]',
+        '42',
+        'no es json',
+    ]
+    rows = list(app._iter_import_rows(io.StringIO('\n'.join(lines)), 'jsonl'))
+    assert rows == [['uno', 'shuk'], ['2', 'ishkay'], [], [], ['cinco', ''],
+                    ['seis', 'sukta'], [], [], []]
+    current = {}
+    stats, changes, _ = app._apply_import_rows(rows, current, 'test')
+    assert current == {'uno': 'shuk', '2': 'ishkay', 'seis': 'sukta'}
+    assert stats['added'] == 3 and stats['skipped_invalid'] == 6
@@ -0,0 +1,60 @@
+import os
+import random
+import tempfile
+
+import app
+
+DIC = {
+    'perro': 'allku', 'gato': 'misi', 'casa': 'wasi', 'agua': 'yaku',
+    'comida': 'mikuna', 'vida': 'kawsay', 'amigo': 'mashi', 'bueno': 'alli',
+    'aprender': 'yachay', 'hablar': 'rimay', 'grande': 'hatun', 'uno': 'shuk',
+}
+TEXTS = ['ñuka wasipi kani', 'el perro come', '', 'allku mikun', 'buenos días amigo', 'x']
+
+
+def test_score_many_igual_a_score():
+    model = app.LangIdModel.from_dictionary(DIC, buckets=512)
+    assert model.score_many(TEXTS) == [model.score(t) for t in TEXTS]
+    assert model.score_many([]) == []
+
+
+def test_actualizacion_incremental_igual_a_reentrenar():
+    rng = random.Random(5)
+    data = dict(DIC)
+    model = app.LangIdModel.from_dictionary(data, buckets=512)
+    for _ in range(30):
+        changes = []
+        for _ in range(4):
+            es = rng.choice(list(data) + ['nuevo', 'río', 'montaña'])
+            before = data.get(es)
+            after = None if before and rng.random() < 0.3 else rng.choice(['urku', 'mayu', 'hatun yaku', 'kuchi'])
+            if after is None:
+                data.pop(es, None)
+            else:
+                data[es] = after
+            if before != after:
+                changes.append((es, before, after))
+        model = model.updated(changes)
+    fresh = app.LangIdModel.from_dictionary(data, buckets=512)
+    assert list(model.counts[0]) == list(fresh.counts[0])
+    assert list(model.counts[1]) == list(fresh.counts[1])
+    assert abs(model.bias - fresh.bias) < 1e-9
+    assert model.score_many(TEXTS) == fresh.score_many(TEXTS)
+
+
+def test_guardar_y_cargar_conserva_conteos():
+    model = app.LangIdModel.from_dictionary(DIC, buckets=256)
+    path = os.path.join(tempfile.mkdtemp(prefix='langid_'), 'model.bin')
+    model.save(path)
+    loaded = app.LangIdModel.load(path)
+    assert list(loaded.counts[1]) == list(model.counts[1])
+    assert loaded.score_many(TEXTS) == model.score_many(TEXTS)
+    assert loaded.updated([('río', None, 'mayu')]).score('mayu') != loaded.score('mayu')
+
+
+def test_celdas_por_palabra_igual_a_ngramas_del_texto():
+    samples = TEXTS + ['a b c d', 'ñuka  wasi-kuna, pak!', 'Río Grande del Norte', ' x ', 'ab cd ef']
+    for max_order in (1, 2, 3, 4, 5):
+        for text in samples:
+            expected = sorted(app._langid_hash(g) % 97 for g in app._langid_grams(text, max_order))
+            assert sorted(app._langid_cells(text, 97, max_order)) == expected, (text, max_order)
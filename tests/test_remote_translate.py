@@ -0,0 +1,34 @@
+import threading
+import time
+
+import app
+
+
+class SharedStateTranslator:
+    """Imita deep_translator: translate() guarda el texto en la instancia antes de la petición."""
+
+    def __init__(self, source, target):
+        self._url_params = {}
+
+    def translate(self, text):
+        self._url_params['q'] = text
+        time.sleep(0.05)  # ida y vuelta remota
+        return f"<{self._url_params['q']}>"
+
+
+def test_llamadas_concurrentes_no_mezclan_textos(monkeypatch):
+    monkeypatch.setattr(app, 'GoogleTranslator', SharedStateTranslator)
+    texts = [f'texto {i}' for i in range(8)]
+    results = {}
+    start = threading.Barrier(len(texts))
+
+    def run(text):
+        start.wait()
+        results[text] = app._remote_translate(text, 'es', 'en')
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {t: f'<{t}>' for t in texts}
@@ -0,0 +1,46 @@
+import threading
+
+import app
+
+
+def _storage(tmp_path):
+    storage = app.SqliteStorage(str(tmp_path / 'db.sqlite'))
+    storage.commit([('Buenos días', None, 'Alli puncha'), ('día', None, 'puncha'),
+                    ('luna', None, 'killa'), ('mes', None, 'killa')], 'seed')
+    return storage
+
+
+def test_busqueda_exacta_usa_columnas_normalizadas(tmp_path):
+    storage = _storage(tmp_path)
+    results, version = storage.find_exact('KILLA')
+    assert version == 1
+    assert [r['spanish'] for r in results] == ['luna', 'mes']
+    assert results[0] == {'spanish': 'luna', 'kichwa': 'killa', 'match': 'exact', 'field': 'qu', 'distance': 0}
+    assert [r['spanish'] for r in storage.find_exact('buenos dias', fields=('es',))[0]] == ['Buenos días']
+    assert storage.find_exact('killa', fields=('es',))[0] == []
+    plan = storage._conn().execute('EXPLAIN QUERY PLAN SELECT spanish FROM entries WHERE qu_norm = ?',
+                                   ('killa',)).fetchall()
+    assert 'entries_qu_norm' in str(plan)
+    # Mismos resultados que la búsqueda exacta en memoria
+    index = app.DictionarySearchIndex.from_dictionary(storage.load()[0])
+    assert index.search('killa', mode='exact') == results
+
+
+def test_firma_cacheada_hasta_que_cambia_la_base(tmp_path):
+    storage = _storage(tmp_path)
+    first = storage.signature()
+    statements = []
+    storage._conn().set_trace_callback(statements.append)
+    assert storage.signature() == first
+    assert statements == ['PRAGMA data_version']
+
+    # Escritura desde otra conexión (otro hilo)
+    worker = threading.Thread(target=storage.commit, args=([('sol', None, 'inti')], 'add'))
+    worker.start()
+    worker.join()
+    second = storage.signature()
+    assert second != first and second[1] == 2
+
+    # Escritura desde la propia conexión: data_version no cambia, la caché se invalida
+    storage.commit([('sol', 'inti', 'inti tayta')], 'edit')
+    assert storage.signature()[1] == 3
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import app
+
+
+class FakeRecognizer:
+    """Respuesta fija por idioma: (segundos de espera, texto o excepción)."""
+
+    name = 'fake'
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def recognize(self, audio_data, language):
+        with self._lock:
+            self.calls.append(language)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            delay, answer = self.answers[language]
+            time.sleep(delay)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _run(answers, timeout=5):
+    engine = FakeRecognizer(answers)
+    start = time.monotonic()
+    result = app.recognize_auto(object(), engine=engine, timeout=timeout)
+    return result, time.monotonic() - start, engine
+
+
+def test_ambos_idiomas_en_paralelo():
+    # qu-EC no reconoce nada: hay que esperar a ambos, que corren a la vez
+    (text, lang), elapsed, engine = _run({
+        'qu-EC': (0.3, ''),
+        'es-EC': (0.3, 'el perro come en la casa'),
+    })
+    assert sorted(engine.calls) == ['es-EC', 'qu-EC'] and engine.max_active == 2
+    assert elapsed < 0.55
+    assert (text, lang) == ('el perro come en la casa', 'es-EC')
+
+
+def test_resultado_claro_no_espera_al_otro():
+    (text, lang), elapsed, _ = _run({
+        'qu-EC': (0.05, 'alli puncha mashi'),
+        'es-EC': (1.5, 'ali punchamashi'),
+    })
+    assert (text, lang) == ('alli puncha mashi', 'qu-EC')
+    assert elapsed < 1.0
+
+
+def test_resultado_dudoso_espera_al_otro_idioma():
+    # El texto español que llega primero desde qu-EC no convence: se espera a es-EC
+    (text, lang), elapsed, _ = _run({
+        'qu-EC': (0.05, 'buenos días amigo'),
+        'es-EC': (0.3, 'buenos días amigo mío'),
+    })
+    assert (text, lang) == ('buenos días amigo mío', 'es-EC')
+    assert elapsed >= 0.3
+
+
+def test_fallo_de_un_idioma_y_tiempo_limite():
+    (text, lang), _, _ = _run({
+        'qu-EC': (0.0, RuntimeError('sin red')),
+        'es-EC': (0.1, 'buenos días amigo'),
+    })
+    assert (text, lang) == ('buenos días amigo', 'es-EC')
+
+    (text, lang), elapsed, _ = _run({
+        'qu-EC': (1.0, 'tarde'),
+        'es-EC': (1.0, 'tarde'),
+    }, timeout=0.2)
+    assert (text, lang) == ('', None)
+    assert elapsed < 0.6
@@ -0,0 +1,98 @@
+import io
+import json
+import queue
+import threading
+
+import pytest
+
+import app
+
+
+def _gated_handler(gate):
+    def handler(upload, language_code):
+        gate.wait(5)
+        return {'text': upload.open().read().decode('utf-8'), 'lang': language_code}, 200
+    return handler
+
+
+def _upload(text):
+    return app.AudioUpload.from_stream(io.BytesIO(text.encode('utf-8')), 'a.wav')
+
+
+def _wait_status(job, status):
+    seen = job.status
+    for _ in range(50):
+        if seen == status:
+            return
+        seen = job.wait_change(seen, 0.1)
+    assert seen == status
+
+
+def test_cola_acotada_y_estados():
+    gate = threading.Event()
+    jobs = app.SttJobQueue(_gated_handler(gate), workers=1, max_depth=1)
+    first = jobs.submit(_upload('uno'), 'es-ES')
+    _wait_status(first, 'running')
+    second = jobs.submit(_upload('dos'), 'es-ES')
+    assert second.status == 'queued'
+    with pytest.raises(queue.Full):
+        jobs.submit(_upload('tres'), 'es-ES')
+    assert jobs.stats()['rejected'] == 1 and jobs.stats()['running'] == 1
+    gate.set()
+    _wait_status(second, 'done')
+    assert first.to_dict()['result'] == {'text': 'uno', 'lang': 'es-ES'}
+    assert second.http_status == 200
+    assert jobs.stats()['completed'] == 2
+
+
+def test_errores_del_manejador():
+    def failing(upload, language_code):
+        if language_code == 'boom':
+            raise RuntimeError('falló')
+        return {'error': 'audio inválido'}, 422
+
+    jobs = app.SttJobQueue(failing, workers=1, max_depth=4)
+    crashed = jobs.submit(_upload('x'), 'boom')
+    rejected = jobs.submit(_upload('y'), 'es-ES')
+    _wait_status(crashed, 'error')
+    _wait_status(rejected, 'error')
+    assert crashed.http_status == 500 and 'falló' in crashed.result['detail']
+    assert rejected.http_status == 422
+    assert jobs.stats()['failed'] == 2
+
+
+def _events(body):
+    out = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if 'event' in lines:
+            out.append((lines['event'], json.loads(lines['data'])))
+    return out
+
+
+def test_endpoint_async_y_eventos_sse(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(app, 'STT_JOBS', app.SttJobQueue(_gated_handler(gate), workers=1, max_depth=1))
+    client = app.app.test_client()
+
+    resp = client.post('/speech-to-text?async=1', data=b'hola', content_type='audio/wav')
+    assert resp.status_code == 202
+    job_id = resp.get_json()['job_id']
+    assert resp.headers['Location'] == f'/speech-to-text/jobs/{job_id}'
+
+    _wait_status(app.STT_JOBS.get(job_id), 'running')
+    queued = client.post('/speech-to-text?async=1', data=b'chao', content_type='audio/wav')
+    assert queued.status_code == 202
+    full = client.post('/speech-to-text?async=1', data=b'otro', content_type='audio/wav')
+    assert full.status_code == 503 and full.headers['Retry-After'] == '5'
+
+    threading.Timer(0.2, gate.set).start()
+    events = _events(client.get(f'/speech-to-text/jobs/{job_id}/events').get_data(as_text=True))
+    statuses = [data['status'] for name, data in events if name == 'status']
+    assert statuses[0] == 'running' and statuses[-1] == 'done'
+    name, result = events[-1]
+    assert name == 'result' and result['result']['text'] == 'hola'
+
+    polled = client.get(f'/speech-to-text/jobs/{job_id}').get_json()
+    assert polled['status'] == 'done' and polled['http_status'] == 200
+    assert client.get('/speech-to-text/jobs/desconocido').status_code == 404
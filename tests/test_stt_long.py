@@ -0,0 +1,120 @@
+import io
+import json
+import threading
+import time
+import wave
+from array import array
+
+import pytest
+
+import app
+
+RATE = 16000
+
+
+def _pcm(levels, block_seconds=16, gap_seconds=3):
+    """Bloques de nivel constante separados por silencios: el nivel k identifica el bloque."""
+    pcm = array('h')
+    for index, level in enumerate(levels):
+        if index:
+            pcm.extend(array('h', [0]) * int(gap_seconds * RATE))
+        pcm.extend(array('h', [level]) * int(block_seconds * RATE))
+    return pcm.tobytes()
+
+
+def _wav(pcm):
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(pcm)
+    return out.getvalue()
+
+
+class LevelRecognizer:
+    """Devuelve `w<k>` según el nivel del segmento; los primeros tardan más."""
+
+    name = 'fake'
+
+    def __init__(self, texts=None):
+        self.texts = texts or {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def recognize(self, audio_data, language):
+        peak = max(array('h', audio_data.frame_data))
+        k = round(peak / 1000) - 1
+        with self._lock:
+            self.calls.append((k, language))
+        time.sleep(max(0.0, 0.2 - 0.05 * k))
+        if language in self.texts:
+            return self.texts[language].format(k=k)
+        return f"w{k}"
+
+
+@pytest.fixture
+def recognizer():
+    fake = LevelRecognizer()
+    app.set_stt_recognizer(fake)
+    yield fake
+    app.set_stt_recognizer(None)
+
+
+def test_cortes_en_silencios():
+    audio = app.sr.AudioData(_pcm([1000, 2000, 3000]), RATE, 2)
+    segments = app.split_audio(audio, mode='silence', chunk_seconds=15)
+    assert len(segments) == 3
+    for index, (start, end, chunk, overlapped) in enumerate(segments):
+        assert not overlapped
+        # Cada corte cae dentro del silencio (3 s) que sigue al bloque anterior
+        assert 19 * index - 3 <= start <= 19 * index
+        assert max(array('h', chunk.frame_data)) == 1000 * (index + 1)
+    assert segments[0][0] == 0 and segments[-1][1] == pytest.approx(54.0)
+
+
+def test_ventanas_con_solapamiento():
+    audio = app.sr.AudioData(_pcm([1000], block_seconds=40, gap_seconds=0), RATE, 2)
+    segments = app.split_audio(audio, mode='window', chunk_seconds=15, overlap_ms=1000)
+    assert [round(s[0], 2) for s in segments] == [0.0, 14.01, 28.02]
+    assert [s[3] for s in segments] == [False, True, True]
+    assert segments[-1][1] == pytest.approx(40.0)
+    for (_, end, _, _), (start, _, _, _) in zip(segments, segments[1:]):
+        assert start < end  # se solapan
+
+
+def test_union_quita_palabras_repetidas():
+    assert app._drop_overlap('hola buenos días', 'Días, amigo mío') == 'amigo mío'
+    assert app._drop_overlap('hola', 'otra cosa') == 'otra cosa'
+    assert app._drop_overlap('', 'algo') == 'algo'
+
+
+def test_eventos_en_orden_aunque_terminen_desordenados(recognizer):
+    upload = app.AudioUpload.from_stream(io.BytesIO(_wav(_pcm([1000, 2000, 3000, 4000]))), 'clase.wav')
+    events = list(app.iter_long_transcription(upload, 'qu-EC'))
+    names = [name for name, _ in events]
+    assert names == ['start', 'segment', 'segment', 'segment', 'segment', 'done']
+    assert events[0][1]['segments'] == 4
+    assert [data['text'] for name, data in events if name == 'segment'] == ['w0', 'w1', 'w2', 'w3']
+    assert events[-1][1] == {'text': 'w0 w1 w2 w3', 'lang': 'qu-EC', 'segments': 4}
+    assert {lang for _, lang in recognizer.calls} == {'qu-EC'}
+
+
+def test_primer_segmento_decide_el_idioma(recognizer):
+    recognizer.texts = {'qu-EC': 'ñuka wasipi kani mashi {k}', 'es-EC': ''}
+    upload = app.AudioUpload.from_stream(io.BytesIO(_wav(_pcm([1000, 2000, 3000]))), 'clase.wav')
+    events = list(app.iter_long_transcription(upload, None))
+    assert events[-1][1]['lang'] == 'qu-EC'
+    # Solo el primer segmento se intentó en ambos idiomas
+    assert sorted(lang for k, lang in recognizer.calls if k == 0) == ['es-EC', 'qu-EC']
+    assert {lang for k, lang in recognizer.calls if k > 0} == {'qu-EC'}
+
+
+def test_endpoint_ndjson(recognizer):
+    client = app.app.test_client()
+    resp = client.post('/speech-to-text?stream=ndjson', data={
+        'lang': 'qu', 'file': (io.BytesIO(_wav(_pcm([1000, 2000]))), 'clase.wav')})
+    assert resp.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [line['event'] for line in lines] == ['start', 'segment', 'segment', 'done']
+    assert lines[-1]['text'] == 'w0 w1'
@@ -0,0 +1,19 @@
+import app
+
+
+def test_parametros_del_quiz_acotados():
+    client = app.app.test_client()
+    data = client.get('/api/study/quiz?limit=100000&options=100000&seed=1').get_json()
+    assert len(data['questions']) == 100
+    assert all(len(q['options']) == 10 for q in data['questions'])
+    data = client.get('/api/study/quiz?limit=-5&options=1&seed=1').get_json()
+    assert len(data['questions']) == 1 and len(data['questions'][0]['options']) == 2
+
+
+def test_quiz_recortado_al_tamano_del_diccionario(monkeypatch):
+    small = app.DictionarySnapshot({'sol': 'inti', 'luna': 'killa', 'agua': 'yaku'}, None, 1)
+    monkeypatch.setattr(app.DICT_STORE, 'snapshot', lambda: small)
+    data = app.app.test_client().get('/api/study/quiz?limit=50&options=10&seed=2').get_json()
+    assert len(data['questions']) == 3
+    for question in data['questions']:
+        assert sorted(question['options']) == ['inti', 'killa', 'yaku']
@@ -0,0 +1,47 @@
+import json
+
+import app
+import reference_tokenizer as ref
+
+SAMPLES = [
+    'Ñuka wasi-kuna-pak', 'ÁÉÍÓÚ ñandú', 'água', 'Việt Nam', 'Ελληνικά ό',
+    'mikuy-pak-mi shimi-kuna', 'kawsay-shi', '--guión__doble··', '', '   ',
+    'Hola, ¿cómo estás? Buenos días amigo mío', 'imashalla kanki mashi, yuspagara',
+]
+
+
+def _corpus():
+    with open('data/dictionary_es_qu.json', encoding='utf-8') as f:
+        dic = json.load(f)
+    return list(dic) + list(dic.values()) + SAMPLES
+
+
+def test_igual_a_la_implementacion_original():
+    for text in _corpus():
+        assert app.remove_diacritics(text) == ref.remove_diacritics(text), text
+        assert app.normalize_kichwa_token(text) == ref.normalize_kichwa_token(text), text
+        assert app.tokenize_kichwa(text) == ref.tokenize_kichwa(text), text
+
+
+def test_tokenize_many_equivale_a_uno_por_uno():
+    texts = _corpus()
+    assert app.tokenize_kichwa_many(texts) == [ref.tokenize_kichwa(t) for t in texts]
+    assert app.tokenize_kichwa_many([]) == []
+
+
+def test_puntuacion_latin1_no_toma_la_ruta_lenta(monkeypatch):
+    def slow(text):
+        raise AssertionError(f'ruta lenta con {text!r}')
+
+    samples = ['¿Cómo estás?', '¡Hola, señor!', '1º «ñandú» ß æ', 'Ǆ ǅ ǈ']
+    expected = [ref.remove_diacritics(t) for t in samples]
+    monkeypatch.setattr(app, '_remove_diacritics_slow', slow)
+    assert [app.remove_diacritics(t) for t in samples] == expected
+
+
+def test_todo_el_rango_de_la_tabla_igual_a_la_original():
+    chars = [chr(cp) for cp in list(range(0x80, 0x250)) + list(range(0x300, 0x370))]
+    text = ''.join(chars)
+    assert app.remove_diacritics(text) == ref.remove_diacritics(text)
+    for pair in zip(chars, chars[1:]):
+        assert app.remove_diacritics(''.join(pair)) == ref.remove_diacritics(''.join(pair))
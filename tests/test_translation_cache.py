@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+import app
+
+
+def _cache(**kw):
+    path = os.path.join(tempfile.mkdtemp(prefix='tcache_'), 'cache.sqlite')
+    return app.TranslationCache(db_path=path, **kw), path
+
+
+def test_invalidation_ignora_tildes_y_mayusculas():
+    cache, _ = _cache()
+    cache.put('El Río está lejos', 'es', 'qu', 'mayuka karupi')
+    cache.put('Wasipi kani', 'qu', 'es', 'estoy en casa')
+    cache.flush()
+    cache.invalidate([('río', None, 'mayu'), ('casa', 'wásí', 'wasi')])
+    assert cache.get('el río está lejos', 'es', 'qu') is None
+    assert cache.get('wasipi kani', 'qu', 'es') is None
+
+
+def test_recarga_conserva_el_nivel_en_disco():
+    cache, path = _cache()
+    cache.put('buenos días', 'es', 'qu', 'alli puncha')
+    cache.flush()
+    cache.invalidate(None)
+    assert cache.stats()['entries'] == 0
+    assert cache.get('buenos días', 'es', 'qu') == 'alli puncha'
+    assert cache.stats()['disk_hits'] == 1
+    # Otra instancia sobre el mismo archivo también la ve
+    other = app.TranslationCache(db_path=path)
+    assert other.get('buenos  días', 'es', 'qu') == 'alli puncha'
+
+
+def test_escrituras_agrupadas_en_segundo_plano():
+    cache, path = _cache(write_interval=60, write_batch=3)
+    cache.put('uno', 'es', 'qu', 'shuk')
+    cache.put('dos', 'es', 'qu', 'ishkay')
+    assert cache.stats()['pending_writes'] == 2
+    # Un invalidate descarta también lo pendiente
+    cache.invalidate([('dos', None, 'ishkay')])
+    assert cache.stats()['pending_writes'] == 1
+    cache.put('tres', 'es', 'qu', 'kimsa')
+    cache.put('cuatro', 'es', 'qu', 'chusku')  # completa el lote: despierta al escritor
+    for _ in range(200):
+        if cache.stats()['pending_writes'] == 0:
+            break
+        app.time.sleep(0.01)
+    other = app.TranslationCache(db_path=path)
+    assert other.get('cuatro', 'es', 'qu') == 'chusku'
+    assert other.get('dos', 'es', 'qu') is None
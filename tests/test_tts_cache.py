@@ -0,0 +1,48 @@
+import os
+import tempfile
+import threading
+
+import app
+
+
+def _write(size):
+    def synthesize(text, lang_code, path):
+        with open(path, 'wb') as f:
+            f.write(b'\0' * size)
+    return synthesize
+
+
+def test_tamano_se_cuenta_una_vez():
+    cache = app.TtsAudioCache(tempfile.mkdtemp(prefix='tts_'), 10_000)
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        cache.get_or_create('hola', 'es', _write(100))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats['files'] == 1 and stats['bytes'] == 100
+    # Reescribir el mismo nombre (p.ej. otro proceso) no duplica la cuenta
+    with cache._lock:
+        cache._add(cache.key_for('hola', 'es'), 120)
+    assert cache.stats()['bytes'] == 120
+
+
+def test_no_expulsa_entradas_recientes():
+    folder = tempfile.mkdtemp(prefix='tts_')
+    cache = app.TtsAudioCache(folder, 250, min_age=60)
+    names = [cache.get_or_create(f'texto {i}', 'es', _write(100))[0] for i in range(4)]
+    # Todos se usaron hace menos de min_age: siguen en disco aunque excedan el límite
+    assert all(os.path.exists(os.path.join(folder, n)) for n in names)
+    assert cache.stats()['evictions'] == 0
+
+    cache.min_age = 0
+    cache.get_or_create('texto 4', 'es', _write(100))
+    stats = cache.stats()
+    assert stats['bytes'] <= 250 and stats['evictions'] == 3
+    assert not os.path.exists(os.path.join(folder, names[0]))
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+import app
+
+
+class FakeBackend:
+    name = 'fake'
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def synthesize(self, text, lang_code, path):
+        self.calls += 1
+        time.sleep(self.delay)
+        with open(path, 'wb') as f:
+            f.write(text.encode('utf-8'))
+
+
+class InlineExecutor:
+    """Ejecuta en el mismo hilo: el futuro ya está resuelto al volver de submit."""
+
+    def submit(self, fn, *args):
+        fut = Future()
+        fut.set_result(fn(*args))
+        return fut
+
+
+def _scheduler(folder=None, workers=2):
+    cache = app.TtsAudioCache(folder or tempfile.mkdtemp(prefix='tts_'), 10 * 1024 * 1024)
+    return app.TtsSegmentScheduler(cache, workers=workers)
+
+
+def test_futuro_resuelto_no_bloquea():
+    scheduler = _scheduler()
+    scheduler._executor = InlineExecutor()
+    done = []
+    worker = threading.Thread(target=lambda: done.append(scheduler.schedule('hola', 'es', FakeBackend())))
+    worker.start()
+    worker.join(2)
+    assert done, 'schedule quedó bloqueado'
+    assert scheduler.stats()['pending'] == 0
+    assert scheduler.wait(done[0][0], 1)
+
+
+def test_segmentos_en_paralelo_y_espera():
+    scheduler = _scheduler(workers=3)
+    backend = FakeBackend(delay=0.2)
+    start = time.monotonic()
+    names = [scheduler.schedule(f'oración {i}', 'es', backend)[0] for i in range(3)]
+    assert all(scheduler.wait(n, 5) for n in names)
+    assert time.monotonic() - start < 0.5 and backend.calls == 3
+    # Ya sintetizados: listos sin volver a sintetizar
+    assert scheduler.schedule('oración 0', 'es', backend) == (names[0], True)
+    assert backend.calls == 3
+
+
+def test_adopta_archivos_de_otro_proceso():
+    folder = tempfile.mkdtemp(prefix='tts_')
+    mine, other = _scheduler(folder), _scheduler(folder)
+    name, _ = other.schedule('de otro worker', 'es', FakeBackend())
+    assert other.wait(name, 2)
+    assert not mine.cache.contains(name)
+    assert mine.wait(name, 2)
+    assert mine.cache.contains(name) and mine.cache.stats()['files'] == 1
+
+
+def test_espera_la_sintesis_en_curso_de_otro_proceso():
+    folder = tempfile.mkdtemp(prefix='tts_')
+    scheduler = _scheduler(folder)
+    name = scheduler.cache.key_for('lento', 'es', 'fake')
+    tmp = os.path.join(folder, f'{name}.abc.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(b'...')
+
+    def finish():
+        time.sleep(0.3)
+        os.replace(tmp, os.path.join(folder, name))
+
+    threading.Thread(target=finish).start()
+    assert scheduler.wait(name, 3, poll=0.05)
+
+
+def test_segmento_desconocido_responde_enseguida():
+    scheduler = _scheduler()
+    start = time.monotonic()
+    assert not scheduler.wait('0' * 40 + '.mp3', 5)
+    assert time.monotonic() - start < 0.5
+
+
+def test_endpoint_lista_de_reproduccion():
+    client = app.app.test_client()
+    resp = client.post('/text-to-speech', json={
+        'text': 'Primera oración. Segunda oración más larga.', 'lang': 'es', 'mode': 'playlist'})
+    playlist = resp.get_json()['playlist']
+    assert playlist
+    for item in playlist:
+        audio = client.get(item['audio_url'])
+        assert audio.status_code == 200 and audio.mimetype == 'audio/mpeg'
+        audio.close()
@@ -0,0 +1,113 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+
+class StubWhisper:
+    """Servidor local que responde con la secuencia de estados indicada."""
+
+    def __init__(self):
+        self.script = []
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                stub.requests += 1
+                status = stub.script.pop(0) if stub.script else 200
+                body = json.dumps({'text': 'allí kanki'} if status == 200 else {'error': status}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1/audio/transcriptions'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubWhisper()
+    yield server
+    server.close()
+
+
+def _client(stub, **kw):
+    options = dict(max_retries=2, backoff=0.01, failure_threshold=3, cooldown=0.3)
+    options.update(kw)
+    return app.WhisperClient(stub.url, **options)
+
+
+def _call(client):
+    upload = app.AudioUpload.from_stream(io.BytesIO(b'RIFF....WAVE'), 'voz.wav')
+    try:
+        return client.transcribe(upload, 'qu-EC', 'clave')
+    finally:
+        upload.close()
+
+
+def test_reintenta_errores_transitorios(stub):
+    client = _client(stub)
+    stub.script = [503, 429, 200]
+    text, error = _call(client)
+    assert (text, error) == ('allí kanki', None)
+    stats = client.stats()
+    assert stub.requests == 3 and stats['retries'] == 2 and stats['ok'] == 1
+    # Las tres peticiones viajaron por la misma conexión
+    assert stats['connections']['opened'] == 1
+
+
+def test_4xx_no_se_reintenta_ni_cuenta_para_el_circuito(stub):
+    client = _client(stub, max_retries=0)
+    stub.script = [500, 500]
+    _call(client)
+    _call(client)
+    assert client.stats()['consecutive_failures'] == 2
+    stub.script = [400]
+    text, error = _call(client)
+    assert text is None and '400' in error and stub.requests == 3
+    # Neutro: ni reinicia la racha ni la aumenta
+    assert client.stats()['consecutive_failures'] == 2
+    assert client.stats()['circuit'] == 'closed'
+    stub.script = [200]
+    assert _call(client)[0] == 'allí kanki'
+    assert client.stats()['consecutive_failures'] == 0
+
+
+def test_circuito_abre_y_se_recupera_con_una_prueba(stub):
+    client = _client(stub, max_retries=0)
+    stub.script = [502, 502, 502]
+    for _ in range(3):
+        _call(client)
+    assert client.stats()['circuit'] == 'open'
+    text, error = _call(client)
+    assert text is None and 'circuit open' in error and stub.requests == 3
+    time.sleep(0.35)
+    assert client.stats()['circuit'] == 'half-open'
+    # Un 4xx en media apertura no cierra ni vuelve a abrir: se permite otra prueba
+    stub.script = [401]
+    _call(client)
+    assert client.stats()['circuit'] == 'half-open'
+    stub.script = [200]
+    assert _call(client)[0] == 'allí kanki'
+    assert client.stats()['circuit'] == 'closed' and client.stats()['short_circuited'] == 1